@@ -0,0 +1,202 @@
+"""Архив оценок для аналитики: только дозапись, столбцы фиксированной ширины.
+
+Каталог архива содержит по файлу на столбец (COLUMNS). Запись добавляется в
+конец каждого файла; чтение отображает файлы в память через mmap и отдаёт
+их как массивы numpy без копирования. Если запись оборвалась посередине,
+столбцы разной длины обрезаются до самого короткого при следующем открытии.
+"""
+import json
+import mmap
+import os
+
+import numpy as np
+
+import risk_engine
+
+
+DEFAULT_PATH = "history_archive"
+FORMAT_VERSION = 1
+SCAN_CHUNK = 1 << 22
+
+# (имя, тип numpy) - порядок задаёт порядок файлов, не влияет на формат
+COLUMNS = (
+    ("ts", "<i8"),
+    ("age", "<i2"),
+    ("female", "u1"),
+    ("weight", "<f4"),
+    ("height", "<f4"),
+    ("factors", "<u4"),
+    ("score", "<i2"),
+    ("tier", "u1"),
+)
+
+
+class ColumnArchive:
+    def __init__(self, path=DEFAULT_PATH, repair=True):
+        """repair=False - только для чтения: столбцы не обрезаются, ведь
+        дозапись может идти в другом процессе (читаются полные записи)"""
+        self.path = path
+        self.files = {}
+        self.maps = []
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != FORMAT_VERSION:
+                raise ValueError(f"неподдерживаемая версия архива: {meta.get('version')}")
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"version": FORMAT_VERSION, "columns": COLUMNS}, f)
+        if repair:
+            self._repair()
+
+    def _file(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _repair(self):
+        # Обрезаем столбцы до общей длины после оборванной дозаписи
+        self.truncate(self.count())
+
+    def truncate(self, rows):
+        """Обрезает столбцы до rows записей - например, отбрасывает дозапись,
+        транзакция истории которой откатилась"""
+        for name, dtype in COLUMNS:
+            size = rows * np.dtype(dtype).itemsize
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def count(self):
+        counts = []
+        for name, dtype in COLUMNS:
+            path = self._file(name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            counts.append(size // np.dtype(dtype).itemsize)
+        return min(counts)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        for m in self.maps:
+            try:
+                m.close()
+            except BufferError:
+                pass  # на отображение ещё ссылаются массивы - закроется вместе с ними
+        self.maps = []
+
+    # --- Запись ------------------------------------------------------------
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        records = list(records)
+        if not records:
+            return
+        # Возраст вводится как произвольное целое; в архиве - int16
+        ages = [min(max(r.age, -32768), 32767) for r in records]
+        columns = {
+            "ts": [r.ts for r in records],
+            "age": ages,
+            "female": [r.is_female for r in records],
+            "weight": [r.weight for r in records],
+            "height": [r.height for r in records],
+            "factors": [r.factors for r in records],
+            "score": [r.score for r in records],
+            "tier": [r.tier for r in records],
+        }
+        self.append_columns(columns)
+
+    def append_columns(self, columns):
+        """Дозапись готовых столбцов (словарь имя -> последовательность)"""
+        for name, dtype in COLUMNS:
+            data = np.asarray(columns[name], dtype=dtype)
+            f = self.files.get(name)
+            if f is None:
+                f = self.files[name] = open(self._file(name), "ab")
+            f.write(data.tobytes())
+        for f in self.files.values():
+            f.flush()
+
+    def sync(self):
+        """Сбрасывает дописанные данные на диск"""
+        for f in self.files.values():
+            os.fsync(f.fileno())
+
+    # --- Чтение ------------------------------------------------------------
+
+    def columns(self):
+        """Столбцы как массивы numpy поверх mmap, без копирования"""
+        rows = self.count()
+        result = {}
+        for name, dtype in COLUMNS:
+            if rows == 0:
+                result[name] = np.empty(0, dtype=dtype)
+                continue
+            with open(self._file(name), "rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps.append(m)
+            result[name] = np.frombuffer(m, dtype=dtype, count=rows)
+        return result
+
+    def summary(self):
+        """Сводка по всему архиву: уровни риска, баллы по возрасту,
+        распространённость факторов"""
+        cols = self.columns()
+        rows = len(cols["ts"])
+        result = {"count": rows}
+        if rows == 0:
+            return result
+
+        lowers = np.array([lower for lower, _ in reversed(risk_engine.AGE_BANDS)])
+        bits = (np.arange(256)[:, None] >> np.arange(8)) & 1
+        tiers = np.zeros(len(risk_engine.TIERS), dtype=np.int64)
+        band_counts = np.zeros(len(lowers) + 1, dtype=np.int64)
+        band_sums = np.zeros(len(lowers) + 1)
+        bit_counts = np.zeros(32, dtype=np.int64)
+        score_sum = 0
+
+        # Блоками, чтобы временные массивы не зависели от размера архива
+        for start in range(0, rows, SCAN_CHUNK):
+            end = min(start + SCAN_CHUNK, rows)
+            scores = cols["score"][start:end]
+            score_sum += int(scores.sum(dtype=np.int64))
+            tiers += np.bincount(cols["tier"][start:end], minlength=len(tiers))
+
+            # Номер диапазона - как у risk_engine.band_index
+            band = np.searchsorted(lowers, cols["age"][start:end], side="right")
+            band_counts += np.bincount(band, minlength=len(band_counts))
+            band_sums += np.bincount(band, weights=scores, minlength=len(band_sums))
+
+            # Гистограмма каждого байта маски даёт число записей с каждым
+            # битом за 4 прохода вместо 29
+            as_bytes = cols["factors"][start:end].view(np.uint8).reshape(-1, 4)
+            for i in range(4):
+                hist = np.bincount(as_bytes[:, i], minlength=256)
+                bit_counts[8 * i:8 * i + 8] += hist @ bits
+
+        result["tiers"] = {label: int(n) for (_, label, _), n in zip(risk_engine.TIERS, tiers)}
+        result["mean_score"] = score_sum / rows
+        result["mean_score_by_age"] = {
+            name: (float(total / n) if n else None)
+            for name, total, n in zip(risk_engine.AGE_LABELS, band_sums, band_counts)
+        }
+        result["factor_prevalence"] = {
+            factor.key: int(bit_counts[i]) / rows for i, factor in enumerate(risk_engine.FACTORS)
+        }
+        return result
+
+
+def run_stats(args):
+    archive = ColumnArchive(args.path, repair=False)
+    print(json.dumps(archive.summary(), ensure_ascii=False, indent=2))
+    archive.close()
+    return 0
+
+
+def add_arguments(parser):
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH,
+                        help="каталог архива (по умолчанию %(default)s)")
+    parser.set_defaults(func=run_stats)
@@ -0,0 +1,299 @@
+"""Пакетная оценка риска для файлов CSV/JSONL без графического интерфейса.
+
+Входная запись: name (необязательно), age, sex, weight, height, factors.
+factors - ключи из risk_engine.FACTORS: список в JSONL или строка через ";"
+в CSV. Файл читается блоками по chunk_size строк, поэтому потребление памяти
+не зависит от размера входа. Оценка - по модели из файла --model, как в
+окне; версия модели пишется в каждый результат.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+from itertools import islice
+
+import numpy as np
+
+import model
+import risk_engine
+
+
+CHUNK_SIZE = 10000
+FORMATS = ("csv", "jsonl")
+OUTPUT_FIELDS = ("row", "name", "score", "tier", "recommendations", "model")
+
+SEXES = {
+    "мужской": False, "м": False, "male": False, "m": False,
+    "женский": True, "ж": True, "female": True, "f": True,
+}
+
+
+def detect_format(path, default="csv"):
+    ext = os.path.splitext(path or "")[1].lower()
+    if ext in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if ext == ".csv":
+        return "csv"
+    return default
+
+
+def read_records(stream, fmt, fieldnames=None):
+    """Записи из текстового потока. Строку JSONL, которую не удалось
+    разобрать, генератор отдаёт как None - она попадёт в отклонённые."""
+    if fmt == "csv":
+        yield from csv.DictReader(stream, fieldnames=fieldnames)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield record if isinstance(record, dict) else None
+
+
+def parse_sex(value):
+    try:
+        return SEXES[str(value).strip().lower()]
+    except KeyError:
+        raise ValueError(f"неизвестное значение пола: {value!r}") from None
+
+
+def _factor_key(key):
+    # В JSONL список факторов может содержать что угодно: [1], [null]
+    if not isinstance(key, str):
+        raise ValueError(f"неверный фактор риска: {key!r}")
+    return key.strip()
+
+
+def parse_factors(value):
+    if value is None or value == "":
+        return 0
+    if isinstance(value, str):
+        value = value.replace(",", ";").split(";")
+    return risk_engine.factor_mask(key for key in map(_factor_key, value) if key)
+
+
+def _text(value):
+    # Числа из JSON приводятся к строке, чтобы разбор совпадал с разбором
+    # полей ввода в окне: "35.5" лет - ошибка, как и в calculate_risk
+    return value if isinstance(value, str) else str(value)
+
+
+def parse_record(record):
+    """(возраст, ИМТ, женский пол, маска факторов) или исключение"""
+    age, bmi = risk_engine.parse_inputs(_text(record["age"]), _text(record["weight"]),
+                                        _text(record["height"]))
+    return age, bmi, parse_sex(record["sex"]), parse_factors(record.get("factors"))
+
+
+@lru_cache(maxsize=4096)
+def _recommendations(scoring_model, risk_score, age, mask):
+    return tuple(scoring_model.recommendations(risk_score, age, mask))
+
+
+def recommendations(risk_score, age, mask, scoring_model=None):
+    # Список рекомендаций зависит только от части маски и от age >= 65,
+    # поэтому повторяющиеся сочетания берутся из кэша
+    scoring_model = scoring_model or model.builtin()
+    return _recommendations(scoring_model, risk_score, 65 if age >= 65 else 0,
+                            mask & scoring_model.recommendation_mask)
+
+
+def parse_chunk(records, first_row=1):
+    """Разбор блока записей в столбцы.
+
+    Возвращает (rows, names, ages, bmis, females, masks, rejected); номер
+    строки row отсчитывается от first_row и учитывает отклонённые записи.
+    """
+    rows, names, ages, bmis, females, masks = [], [], [], [], [], []
+    rejected = 0
+    for row, record in enumerate(records, first_row):
+        try:
+            age, bmi, is_female, mask = parse_record(record)
+        except (ValueError, ArithmeticError, KeyError, TypeError):
+            rejected += 1
+            continue
+        rows.append(row)
+        names.append(record.get("name") or "")
+        ages.append(age)
+        bmis.append(bmi)
+        females.append(is_female)
+        masks.append(mask)
+    return rows, names, ages, bmis, females, masks, rejected
+
+
+def clip_ages(ages):
+    # int() принимает числа любой длины; для сравнения с границами
+    # возрастных диапазонов возраст достаточно ограничить
+    return np.array([min(max(age, -1), 1000) for age in ages], dtype=np.int32)
+
+
+def score_chunk(records, first_row=1, scoring_model=None):
+    """Оценивает блок записей по модели scoring_model (model.ScoringModel,
+    по умолчанию встроенная).
+
+    Возвращает (список результатов, число отклонённых записей). Номер
+    строки row отсчитывается от first_row и учитывает отклонённые записи.
+    """
+    rows, names, ages, bmis, females, masks, rejected = parse_chunk(records, first_row)
+    if not rows:
+        return [], rejected
+
+    scoring_model = scoring_model or model.builtin()
+    scores = scoring_model.score_batch(clip_ages(ages), bmis, females,
+                                       np.array(masks, dtype=np.uint32))
+    tiers = scoring_model.tier_batch(scores)
+
+    results = []
+    for i, row in enumerate(rows):
+        risk_score = int(scores[i])
+        results.append({
+            "row": row,
+            "name": names[i],
+            "score": risk_score,
+            "tier": scoring_model.tiers[tiers[i]][1],
+            "recommendations": recommendations(risk_score, ages[i], masks[i], scoring_model),
+            "model": scoring_model.version,
+        })
+    return results, rejected
+
+
+class ResultWriter:
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == "csv":
+            self.writer = csv.writer(stream, lineterminator="\n")
+
+    def write_header(self):
+        if self.fmt == "csv":
+            self.writer.writerow(OUTPUT_FIELDS)
+
+    def write(self, results):
+        if self.fmt == "csv":
+            self.writer.writerows(
+                (r["row"], r["name"], r["score"], r["tier"], " | ".join(r["recommendations"]),
+                 r["model"])
+                for r in results
+            )
+        else:
+            self.stream.writelines(
+                json.dumps(dict(r, recommendations=list(r["recommendations"])),
+                           ensure_ascii=False) + "\n"
+                for r in results
+            )
+
+
+def score_stream(src, dst, fmt, out_fmt=None, chunk_size=CHUNK_SIZE, scoring_model=None):
+    """Потоковая оценка src -> dst. Возвращает (всего строк, отклонено)."""
+    writer = ResultWriter(dst, out_fmt or fmt)
+    writer.write_header()
+    records = read_records(src, fmt)
+    total = rejected = 0
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        results, bad = score_chunk(chunk, total + 1, scoring_model)
+        writer.write(results)
+        total += len(chunk)
+        rejected += bad
+    return total, rejected
+
+
+def _open_input(path):
+    if path in (None, "-"):
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+    return open(path, encoding="utf-8-sig", newline="")
+
+
+def _open_output(path):
+    if path in (None, "-"):
+        return io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def report(total, rejected, elapsed, stream=sys.stderr):
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"Обработано строк: {total} за {elapsed:.2f} с ({rate:,.0f} строк/с), "
+          f"отклонено: {rejected}", file=stream)
+
+
+def load_model(path):
+    """Модель из файла path (без файла - встроенная) или None, если файл
+    не удалось загрузить - об этом сообщается в stderr"""
+    model_file = model.ModelFile(path)
+    if model_file.error:
+        print(f"Модель оценки не загружена ({path}): {model_file.error}", file=sys.stderr)
+        return None
+    return model_file.model
+
+
+def run(args):
+    scoring_model = load_model(args.model)
+    if scoring_model is None:
+        return 2
+    fmt = args.format or detect_format(args.input)
+    out_fmt = args.output_format or detect_format(args.output, default=fmt)
+    started = time.perf_counter()
+    if args.workers != 1:
+        if args.input in (None, "-"):
+            print("Параллельный режим (--workers) требует входной файл, а не stdin",
+                  file=sys.stderr)
+            return 2
+        import parallel
+        with _open_output(args.output) as dst:
+            total, rejected = parallel.score_file(args.input, dst, fmt, out_fmt,
+                                                  args.workers or None, args.chunk_size,
+                                                  model_data=scoring_model.data)
+    else:
+        with _open_input(args.input) as src, _open_output(args.output) as dst:
+            total, rejected = score_stream(src, dst, fmt, out_fmt, args.chunk_size,
+                                           scoring_model)
+    report(total, rejected, time.perf_counter() - started)
+    return 0
+
+
+def count_argument(minimum):
+    """Тип argparse: целое не меньше minimum. Иначе - ошибка разбора
+    аргументов, а не исключение из пула процессов"""
+
+    def parse(text):
+        try:
+            value = int(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"ожидается целое число: {text!r}") from None
+        if value < minimum:
+            raise argparse.ArgumentTypeError(f"ожидается число не меньше {minimum}: {value}")
+        return value
+
+    return parse
+
+
+def add_arguments(parser):
+    parser.add_argument("input", nargs="?", default="-",
+                        help="входной файл CSV/JSONL (по умолчанию stdin)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="файл результатов (по умолчанию stdout)")
+    parser.add_argument("-f", "--format", choices=FORMATS,
+                        help="формат входа (по умолчанию по расширению, иначе csv)")
+    parser.add_argument("--output-format", choices=FORMATS,
+                        help="формат результатов (по умолчанию как у входа)")
+    parser.add_argument("--chunk-size", type=count_argument(1), default=CHUNK_SIZE,
+                        help="число строк в блоке (по умолчанию %(default)s)")
+    parser.add_argument("-j", "--workers", type=count_argument(0), default=1,
+                        help="число процессов; 0 - по числу ядер (по умолчанию %(default)s)")
+    add_model_argument(parser)
+    parser.set_defaults(func=run)
+
+
+def add_model_argument(parser):
+    parser.add_argument("--model", default=model.DEFAULT_PATH,
+                        help="файл модели оценки (по умолчанию %(default)s, "
+                             "без файла - встроенная модель)")
@@ -0,0 +1,411 @@
+"""Воспроизведение сеансов окна калькулятора для проверки задержек интерфейса.
+
+    python benchmarks/replay.py sessions.jsonl --repeat 20 --budget budget.json
+    python benchmarks/replay.py --synthetic 2000 -o replay.json
+    python benchmarks/replay.py --synthetic 100 --save sessions.jsonl
+
+Окно CovidRiskApp создаётся на платформе offscreen с историей во временном
+каталоге, и сеансы проигрываются подряд, как на киоске: кнопка «Завершить»,
+ввод ФИО следующего пациента, анкета. Файл сеансов - JSONL, по сеансу на
+строку:
+    {"name": "Иванов Иван", "steps": [["type", "age", "45"],
+     ["select", "gender", "Женский"], ["next"], ["toggle", "diabetes"], ...]}
+Шаги:
+    type <поле> <текст>   - ввод с клавиатуры в age, weight или height
+    select <поле> <текст> - выбор в списке gender
+    toggle <фактор>       - щелчок по чекбоксу фактора (ключ risk_engine)
+    next, back            - кнопки «Далее» и «Назад»
+    history               - окно истории (закрывается сразу после показа)
+
+Время шага - действие и обработка событий, включая перерисовку. Отчёт -
+перцентили по каждому шагу (next и back - с номером новой страницы, finish -
+переход к следующему пациенту) и прирост памяти процесса и числа виджетов
+на сеанс после разогрева. Если задержка шага или прирост памяти превышают
+бюджет (DEFAULT_BUDGET или файл --budget), программа завершается с кодом 1.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import risk_engine  # noqa: E402
+from benchmarks.synthetic import NAMES, SURNAMES, patient  # noqa: E402
+
+
+# Шаг -> число аргументов
+STEP_ARGS = {"type": 2, "select": 2, "toggle": 1, "next": 0, "back": 0, "history": 0}
+# Поля шагов type и select -> виджеты окна
+TEXT_FIELDS = {"age": "age_input", "weight": "weight_input", "height": "height_input"}
+SELECT_FIELDS = {"gender": "gender_combo"}
+WARMUP = 50
+# Бюджет: перцентили времени шагов, мс ("*" - для шагов без своего
+# бюджета) и прирост на сеанс после разогрева
+DEFAULT_BUDGET = {
+    "steps": {
+        "*": {"p95_ms": 50, "p99_ms": 100},
+        "next 4": {"p95_ms": 100, "p99_ms": 200},
+        "history": {"p95_ms": 500, "p99_ms": 1000},
+    },
+    "session_kb": 16,
+    "session_widgets": 0.5,
+}
+
+
+class ReplayError(ValueError):
+    pass
+
+
+def percentiles(samples):
+    cuts = statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99
+    return {"p50_ms": cuts[49], "p95_ms": cuts[94], "p99_ms": cuts[98]}
+
+
+def rss_kb():
+    """Резидентная память процесса, КБ (где текущее значение недоступно -
+    пиковое)"""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage",
+                    "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage",
+                    "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        kernel32 = ctypes.windll.kernel32
+        kernel32.K32GetProcessMemoryInfo(kernel32.GetCurrentProcess(),
+                                         ctypes.byref(counters), counters.cb)
+        return counters.WorkingSetSize // 1024
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def check_session(session):
+    name = session.get("name") if isinstance(session, dict) else None
+    # Короткое ФИО окно не примет, а предупреждение остановило бы проигрывание
+    if not isinstance(name, str) or len(name.split()) < 2:
+        raise ReplayError("нужно ФИО минимум из 2 слов")
+    steps = session.get("steps")
+    if not isinstance(steps, list):
+        raise ReplayError("нет списка шагов")
+    for step in steps:
+        if not isinstance(step, list) or not step or step[0] not in STEP_ARGS:
+            raise ReplayError(f"неизвестный шаг: {step!r}")
+        if len(step) - 1 != STEP_ARGS[step[0]] or not all(isinstance(a, str) for a in step):
+            raise ReplayError(f"неверные аргументы шага: {step!r}")
+        if step[0] == "type" and step[1] not in TEXT_FIELDS \
+                or step[0] == "select" and step[1] not in SELECT_FIELDS:
+            raise ReplayError(f"неизвестное поле: {step!r}")
+        if step[0] == "toggle" and step[1] not in risk_engine.FACTOR_BITS:
+            raise ReplayError(f"неизвестный фактор риска: {step[1]!r}")
+    return session
+
+
+def load_sessions(path):
+    sessions = []
+    with open(path, encoding="utf-8-sig") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                sessions.append(check_session(json.loads(line)))
+            except ValueError as e:
+                raise ReplayError(f"{path}:{line_no}: {e}") from None
+    if not sessions:
+        raise ReplayError(f"{path}: нет сеансов")
+    return sessions
+
+
+def synthetic_sessions(count, seed=1):
+    """Сеансы по синтетическим пациентам: анкета целиком, иногда возврат со
+    страницы результата и просмотр истории"""
+    from kURS import FACTOR_GROUP_BITS, FACTOR_PAGES
+
+    rng = random.Random(seed)
+    for i in range(count):
+        age, is_female, weight, height, mask = patient(rng)
+        steps = [["type", "age", str(age)]]
+        if is_female:
+            steps.append(["select", "gender", "Женский"])
+        steps += [["type", "weight", str(weight)], ["type", "height", str(height)], ["next"]]
+        for groups in FACTOR_PAGES:
+            for group in groups:
+                steps += [["toggle", risk_engine.FACTORS[bit].key]
+                          for bit in FACTOR_GROUP_BITS[group] if mask >> bit & 1]
+            steps.append(["next"])
+        if rng.random() < 0.1:
+            steps += [["back"], ["next"]]
+        if rng.random() < 0.02:
+            steps.append(["history"])
+        yield {"name": f"{rng.choice(SURNAMES)} {rng.choice(NAMES)} {i}", "steps": steps}
+
+
+class _ModalAnswer:
+    """Ответ на модальное окно, которое откроет шаг: exec_ не вернётся, пока
+    окно не закрыто, поэтому ответ ставится таймером до шага"""
+
+    def __init__(self, answer):
+        from PyQt5.QtCore import QTimer
+        from PyQt5.QtWidgets import QApplication
+
+        self.answer = answer
+        self.active = QApplication.activeModalWidget
+        self.timer = QTimer.singleShot
+        self.done = False
+        self.timer(0, self.poll)
+
+    def poll(self):
+        if self.done:
+            return
+        dialog = self.active()
+        if dialog is None:
+            self.timer(0, self.poll)  # окно ещё не показано
+            return
+        self.done = True
+        self.answer(dialog)
+
+    def cancel(self):
+        self.done = True
+
+
+def _qt_message(mode, context, message):
+    # Платформа offscreen предупреждает при каждом показе окна
+    if "propagateSizeHints" not in message:
+        print(message, file=sys.stderr)
+
+
+class Replayer:
+    """Окно калькулятора и проигрывание в нём шагов сеансов"""
+
+    def __init__(self, directory, first_name):
+        from PyQt5.QtCore import qInstallMessageHandler
+        from PyQt5.QtTest import QTest
+        from PyQt5.QtWidgets import QApplication
+        from kURS import CovidRiskApp
+
+        qInstallMessageHandler(_qt_message)
+        self.qt = QApplication.instance() or QApplication([])
+        self.key_clicks = QTest.keyClicks
+        started = time.perf_counter()
+        # Файл модели во временном каталоге отсутствует - встроенная модель
+        self.app = CovidRiskApp(user_name=first_name,
+                                history_path=os.path.join(directory, "history.db"),
+                                model_path=os.path.join(directory, "model.json"))
+        self.app.show()
+        self.qt.processEvents()
+        self.startup_ms = (time.perf_counter() - started) * 1000
+
+    def run(self, label, action, modal=None):
+        """(подпись шага, время в мс) для action с обработкой событий"""
+        answer = _ModalAnswer(modal) if modal else None
+        started = time.perf_counter()
+        try:
+            action()
+            self.qt.processEvents()
+        finally:
+            if answer is not None:
+                answer.cancel()
+        return label, (time.perf_counter() - started) * 1000
+
+    def finish(self, name):
+        """Переход к следующему пациенту: «Завершить» и ввод ФИО"""
+        app = self.app
+
+        def enter_name(dialog):
+            dialog.name_input.setText(name)
+            dialog.start_btn.click()
+
+        # Со страницы анкеты кнопки «Завершить» нет - сеанс прерван
+        action = app.btn_next.click if app.current_page == 3 else app.reset_to_start
+        return self.run("finish", action, enter_name)
+
+    def step(self, step):
+        app = self.app
+        op = step[0]
+        if op == "type":
+            widget = getattr(app, TEXT_FIELDS[step[1]])
+
+            def action():
+                widget.clear()
+                self.key_clicks(widget, step[2])
+
+            return self.run(f"type {step[1]}", action)
+        if op == "select":
+            widget = getattr(app, SELECT_FIELDS[step[1]])
+            if widget.findText(step[2]) < 0:
+                raise ReplayError(f"нет значения в списке: {step!r}")
+            return self.run(f"select {step[1]}", lambda: widget.setCurrentText(step[2]))
+        if op == "toggle":
+            checkbox = app.factor_checks[risk_engine.FACTOR_BITS[step[1]]]
+            if checkbox is None or not checkbox.isVisible():
+                raise ReplayError(f"фактора нет на текущей странице: {step!r}")
+            return self.run("toggle", checkbox.click)
+        if op == "next":
+            label, ms = self.run("next", app.btn_next.click)
+        elif op == "back":
+            label, ms = self.run("back", app.btn_back.click)
+        else:
+            # Пустая история - окно сообщения, иначе окно истории
+            return self.run("history", app.btn_history.click, lambda dialog: dialog.reject())
+        return f"{label} {app.current_page + 1}", ms
+
+    def widgets(self):
+        return len(self.qt.allWidgets())
+
+    def close(self):
+        self.app.close()
+        self.app.deleteLater()
+        self.qt.processEvents()
+
+
+def replay(sessions, warmup=WARMUP):
+    """Проигрывает сеансы подряд в одном окне. Возвращает отчёт: перцентили
+    шагов и сеансов и прирост памяти на сеанс после warmup сеансов"""
+    steps = {}
+    session_ms = []
+    memory = None
+    count = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        replayer = None
+        try:
+            for count, session in enumerate(sessions, 1):
+                if count == warmup + 1 and replayer is not None:
+                    gc.collect()
+                    memory = (rss_kb(), replayer.widgets())
+                if replayer is None:
+                    replayer = Replayer(tmp, session["name"])
+                    timings = []
+                else:
+                    timings = [replayer.finish(session["name"])]
+                try:
+                    for step in session["steps"]:
+                        timings.append(replayer.step(step))
+                except ReplayError as e:
+                    raise ReplayError(f"сеанс {count}: {e}") from None
+                for label, ms in timings:
+                    steps.setdefault(label, []).append(ms)
+                session_ms.append(sum(ms for _, ms in timings))
+            gc.collect()
+            end = (rss_kb(), replayer.widgets()) if replayer else None
+        finally:
+            if replayer is not None:
+                replayer.close()
+
+    report = {
+        "sessions": count,
+        "startup_ms": replayer.startup_ms if replayer else None,
+        "session": percentiles(session_ms) if session_ms else None,
+        "steps": {label: dict(count=len(samples), max_ms=max(samples), **percentiles(samples))
+                  for label, samples in sorted(steps.items())},
+        "memory": None,
+    }
+    if memory is not None:
+        measured = count - warmup
+        report["memory"] = {
+            "rss_start_kb": memory[0],
+            "rss_end_kb": end[0],
+            "session_kb": (end[0] - memory[0]) / measured,
+            "session_widgets": (end[1] - memory[1]) / measured,
+        }
+    return report
+
+
+def load_budget(path=None):
+    """DEFAULT_BUDGET с заменами из файла JSON того же вида"""
+    budget = json.loads(json.dumps(DEFAULT_BUDGET))
+    if path:
+        with open(path, encoding="utf-8") as f:
+            overrides = json.load(f)
+        for label, limits in overrides.pop("steps", {}).items():
+            budget["steps"].setdefault(label, {}).update(limits)
+        budget.update(overrides)
+    return budget
+
+
+def check_budget(report, budget):
+    """Список превышений бюджета (пустой - отчёт в бюджете)"""
+    breaches = []
+    for label, result in report["steps"].items():
+        limits = budget["steps"].get(label, budget["steps"].get("*", {}))
+        for key, limit in sorted(limits.items()):
+            if result[key] > limit:
+                breaches.append(f"{label}: {key} = {result[key]:.1f} > {limit}")
+    memory = report["memory"]
+    for key in ("session_kb", "session_widgets"):
+        if memory is not None and budget.get(key) is not None and memory[key] > budget[key]:
+            breaches.append(f"{key} = {memory[key]:.2f} > {budget[key]}")
+    return breaches
+
+
+def bench_replay(quick):
+    """Для benchmarks/run.py: синтетические сеансы без проверки бюджета"""
+    return replay(synthetic_sessions(200 if quick else 2000))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Воспроизведение сеансов окна калькулятора")
+    parser.add_argument("sessions", nargs="?", help="файл сеансов JSONL")
+    parser.add_argument("--synthetic", type=int, default=2000,
+                        help="без файла - столько синтетических сеансов (по умолчанию %(default)s)")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="сколько раз проиграть файл сеансов (по умолчанию %(default)s)")
+    parser.add_argument("--warmup", type=int, default=WARMUP,
+                        help="сеансов до замера памяти (по умолчанию %(default)s)")
+    parser.add_argument("--budget", help="файл бюджета JSON (замены DEFAULT_BUDGET)")
+    parser.add_argument("--save", help="записать сеансы в JSONL вместо проигрывания")
+    parser.add_argument("-o", "--output", help="файл отчёта JSON (по умолчанию stdout)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.sessions:
+            sessions = load_sessions(args.sessions) * args.repeat
+        else:
+            sessions = list(synthetic_sessions(args.synthetic))
+        budget = load_budget(args.budget)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            for session in sessions:
+                f.write(json.dumps(session, ensure_ascii=False) + "\n")
+        return 0
+
+    try:
+        report = replay(sessions, args.warmup)
+    except ReplayError as e:
+        print(f"Ошибка сеанса: {e}", file=sys.stderr)
+        return 2
+    report["breaches"] = check_budget(report, budget)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    for breach in report["breaches"]:
+        print(f"Превышен бюджет: {breach}", file=sys.stderr)
+    return 1 if report["breaches"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
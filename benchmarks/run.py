@@ -0,0 +1,564 @@
+"""Замеры производительности калькулятора. Результаты - JSON.
+
+    python benchmarks/run.py -o bench.json
+    python benchmarks/run.py --only scoring startup --quick
+
+Окно Qt создаётся на платформе offscreen, дисплей не нужен.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import risk_engine  # noqa: E402
+from benchmarks.replay import bench_replay, percentiles as _percentiles  # noqa: E402
+from benchmarks.synthetic import history_records, patient  # noqa: E402
+
+
+def _rate(count, seconds):
+    return count / seconds if seconds > 0 else float("inf")
+
+
+_app = None
+
+
+def _qt_app():
+    # Ссылка хранится в модуле: без неё QApplication удаляется сборщиком мусора
+    global _app
+    if _app is None:
+        from PyQt5.QtWidgets import QApplication
+        _app = QApplication.instance() or QApplication([])
+    return _app
+
+
+def bench_scoring(quick):
+    import random
+    import numpy as np
+
+    rng = random.Random(1)
+    patients = [patient(rng) for _ in range(20000 if quick else 200000)]
+    bmis = [weight / (height / 100) ** 2 for _, _, weight, height, _ in patients]
+
+    started = time.perf_counter()
+    for (age, is_female, _, _, mask), bmi in zip(patients, bmis):
+        risk_engine.score(age, bmi, is_female, mask)
+    scalar = _rate(len(patients), time.perf_counter() - started)
+
+    count = 100000 if quick else 1000000
+    nrng = np.random.default_rng(1)
+    age = nrng.integers(18, 95, count)
+    bmi = nrng.uniform(16, 45, count)
+    female = nrng.random(count) < 0.5
+    mask = nrng.integers(0, 1 << len(risk_engine.FACTORS), count, dtype=np.uint32)
+    risk_engine.score_batch(age[:10], bmi[:10], female[:10], mask[:10])  # таблицы и импорт
+    runs = []
+    for _ in range(5):
+        started = time.perf_counter()
+        scores = risk_engine.score_batch(age, bmi, female, mask)
+        risk_engine.tier_batch(scores)
+        runs.append(time.perf_counter() - started)
+    return {
+        "scalar_records_per_s": scalar,
+        "batch_records": count,
+        "batch_records_per_s": _rate(count, statistics.median(runs)),
+    }
+
+
+def bench_what_if(quick):
+    """Все одиночные и парные изменения модифицируемых факторов для когорты"""
+    import numpy as np
+
+    count = 10000 if quick else 100000
+    nrng = np.random.default_rng(1)
+    age = nrng.integers(18, 95, count)
+    bmi = nrng.uniform(16, 45, count)
+    female = nrng.random(count) < 0.5
+    mask = nrng.integers(0, 1 << len(risk_engine.FACTORS), count, dtype=np.uint32)
+    risk_engine.what_if_batch(age[:10], bmi[:10], female[:10], mask[:10])
+    runs = []
+    for _ in range(5):
+        started = time.perf_counter()
+        risk_engine.what_if_batch(age, bmi, female, mask)
+        runs.append(time.perf_counter() - started)
+
+    samples = []
+    for i in range(200):
+        started = time.perf_counter()
+        risk_engine.what_if(int(age[i]), float(bmi[i]), bool(female[i]), int(mask[i]), 3)
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "variants": len(risk_engine.WHAT_IF_TOGGLES),
+        "cohort_records": count,
+        "cohort_records_per_s": _rate(count, statistics.median(runs)),
+        "single_patient_ms": statistics.median(samples),
+    }
+
+
+def bench_calibrate(quick):
+    """AUC случайных конфигураций по размеченной когорте, один процесс"""
+    import numpy as np
+    import calibrate
+
+    count = 100000 if quick else 1000000
+    nrng = np.random.default_rng(1)
+    age = nrng.integers(18, 95, count)
+    bmi = nrng.uniform(16, 45, count)
+    female = nrng.random(count) < 0.5
+    # Около 3 факторов на пациента, как в synthetic.patient
+    mask = (nrng.random((count, len(risk_engine.FACTORS))) < 0.1) @ (
+        1 << np.arange(len(risk_engine.FACTORS), dtype=np.int64))
+    scores = risk_engine.score_batch(age, bmi, female, mask)
+    outcome = nrng.random(count) < 1 / (1 + np.exp(-(scores - 8) / 3))
+
+    started = time.perf_counter()
+    patterns = calibrate.Patterns.from_columns(age, bmi, female, mask, outcome)
+    evaluator = calibrate.Evaluator(patterns)
+    prepare = time.perf_counter() - started
+
+    configs = calibrate.random_configs(calibrate.current_config(), 200 if quick else 500,
+                                       calibrate.DEFAULT_SPREAD, nrng)
+    started = time.perf_counter()
+    evaluator.auc(configs)
+    rate = _rate(len(configs), time.perf_counter() - started)
+    return {
+        "patients": count,
+        "patterns": len(patterns),
+        "prepare_s": prepare,
+        "configs_per_s": rate,
+        "seconds_per_100k_configs_per_worker": 100000 / rate,
+    }
+
+
+def bench_metrics(quick):
+    """Цена замера metrics.timed на вызов, когда замеры включены
+    (выключенный декоратор возвращает функцию без изменений)"""
+    import metrics
+
+    def operation():
+        pass
+
+    wrapped = metrics.instrument(operation, "bench", metrics.Registry())
+    count = 100000 if quick else 1000000
+    result = {}
+    for name, func in (("plain", operation), ("timed", wrapped)):
+        started = time.perf_counter()
+        for _ in range(count):
+            func()
+        result[name + "_ns"] = (time.perf_counter() - started) * 1e9 / count
+    result["overhead_ns"] = result["timed_ns"] - result["plain_ns"]
+    return result
+
+
+def bench_startup(quick):
+    """Время от запуска процесса до показа окна ввода ФИО"""
+    samples = []
+    for _ in range(3 if quick else 10):
+        output = subprocess.run(
+            [sys.executable, os.path.join(ROOT, "kURS.py"), "--startup-time"],
+            capture_output=True, text=True, check=True, cwd=tempfile.gettempdir(),
+        ).stdout
+        samples.append(float(output.split(":")[1].split()[0]))
+    return {"time_to_name_dialog_ms": statistics.median(samples),
+            "min_ms": min(samples), "max_ms": max(samples)}
+
+
+def bench_save_to_history(quick, sizes):
+    """Стоимость save_to_history при разном размере уже накопленной истории:
+    submit_ms - в потоке окна, append_ms - до записи на диск потоком записи"""
+    from kURS import CovidRiskApp
+    from history_store import HistoryStore
+
+    _qt_app()
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "history.db")
+            store = HistoryStore(path)
+            store.append_many(history_records(size))
+            store.close()
+
+            app = CovidRiskApp(user_name="Иванов Иван", history_path=path)
+            app.age_input.setText("70")
+            app.weight_input.setText("100")
+            app.height_input.setText("170")
+            for _ in range(3):
+                app.next_page()
+            app.flush_writer()
+            before = app.history.count()
+            repeats = 50 if quick else 200
+            submit = append = 0.0
+            for i in range(repeats):
+                app.weight_input.setText(f"{101 + i / 10:.1f}")
+                app.calculate_risk()
+                started = time.perf_counter()
+                app.save_to_history()
+                submitted = time.perf_counter()
+                if not app._writer.flush(wait=True):
+                    raise RuntimeError(f"запись истории не завершилась: {app._writer.error}")
+                submit += submitted - started
+                append += time.perf_counter() - started
+            if app.history.count() - before != repeats:
+                raise RuntimeError("не все оценки записаны в историю")
+            results[str(size)] = {"submit_ms": submit * 1000 / repeats,
+                                  "append_ms": append * 1000 / repeats}
+            app.close()
+    return results
+
+
+def bench_history_view(quick, sizes):
+    """Время открытия окна истории: создание, первая страница, отрисовка"""
+    from history_store import HistoryStore
+    from history_view import HistoryDialog
+
+    app = _qt_app()
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = HistoryStore(os.path.join(tmp, "history.db"))
+            store.append_many(history_records(size))
+            samples = []
+            for _ in range(5):
+                started = time.perf_counter()
+                dialog = HistoryDialog(store)
+                dialog.show()
+                app.processEvents()
+                samples.append((time.perf_counter() - started) * 1000)
+                dialog.close()
+                dialog.deleteLater()
+            store.close()
+            results[str(size)] = {"open_ms": statistics.median(samples)}
+    return results
+
+
+def bench_history_search(quick, sizes):
+    """Поиск по истории: медиана времени первой страницы по каждому запросу"""
+    from history_store import HistoryStore
+
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = HistoryStore(os.path.join(tmp, "history.db"))
+            start_ts = int(time.time()) - size * 60
+            store.append_many(history_records(size, start_ts=start_ts))
+            middle = start_ts + size * 30
+            queries = {
+                "name_prefix": {"name": "иванов"},
+                "name_exact": {"name": "Орлов Юрий 1"},
+                "tier": {"tier": 0},
+                "factor": {"factor": "hiv"},
+                "date_range": {"date_from": middle, "date_to": middle + 86400},
+                "factor_tier": {"factor": "hiv", "tier": 4},
+                "name_factor": {"name": "петров", "factor": "cancer"},
+                "all": {"name": "иванов", "date_from": start_ts, "date_to": middle,
+                        "tier": 1, "factor": "diabetes"},
+            }
+            result = {}
+            for name, query in queries.items():
+                samples = []
+                for _ in range(5 if quick else 20):
+                    started = time.perf_counter()
+                    store.search(**query)
+                    samples.append((time.perf_counter() - started) * 1000)
+                result[name + "_ms"] = statistics.median(samples)
+            store.close()
+            results[str(size)] = result
+    return results
+
+
+def _shared_writer(path, worker, seconds, full, results):
+    # Процесс-писатель: по записи на транзакцию, как копия программы без
+    # накопления (full - вместе с архивом и статистикой, как поток записи)
+    from history_store import HistoryStore
+    from history_writer import open_archive, write_records
+
+    store = HistoryStore(path)
+    base = path.rsplit(".", 1)[0]
+    archive = open_archive(store, base + "_archive") if full else None
+    latencies, errors = [], 0
+    records = history_records(1000000, seed=worker)
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        record = next(records)
+        record.name += f" к{worker}"
+        started = time.perf_counter()
+        try:
+            if full:
+                write_records(store, archive, base + "_stats.json", [record])
+            else:
+                store.append(record)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+    store.close()
+    if archive is not None:
+        archive.close()
+    results.put(("write", latencies, errors))
+
+
+def _shared_reader(path, seconds, results):
+    # Процесс-читатель: первая страница, поиск и подсчёт записей по кругу
+    from history_store import HistoryStore
+
+    store = HistoryStore(path)
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            store.page()
+            store.search(name="иванов")
+            store.count()
+        except Exception:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+    store.close()
+    results.put(("read", latencies, errors))
+
+
+def bench_shared_history(quick, writers=10, readers=2):
+    """Общая история: writers процессов дописывают по записи на транзакцию,
+    readers процессов одновременно читают. Режим store - только база,
+    full - база, архив и статистика, как у потока записи окна"""
+    import multiprocessing
+    from archive import ColumnArchive
+    from history_store import HistoryStore
+    from stats import PopulationStats
+
+    seconds = 3 if quick else 10
+    results = {}
+    for mode in ("store", "full"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "history.db")
+            store = HistoryStore(path)
+            store.append_many(history_records(10000 if quick else 100000))
+            before = store.count()
+            store.close()
+            PopulationStats().save(os.path.join(tmp, "history_stats.json"))
+
+            queue = multiprocessing.Queue()
+            processes = [multiprocessing.Process(target=_shared_writer,
+                                                 args=(path, i, seconds, mode == "full", queue))
+                         for i in range(writers)]
+            processes += [multiprocessing.Process(target=_shared_reader,
+                                                  args=(path, seconds, queue))
+                          for _ in range(readers)]
+            for process in processes:
+                process.start()
+            collected = {"write": ([], 0), "read": ([], 0)}
+            for _ in processes:
+                kind, latencies, errors = queue.get()
+                total, errors_total = collected[kind]
+                collected[kind] = (total + latencies, errors_total + errors)
+            for process in processes:
+                process.join()
+
+            store = HistoryStore(path)
+            added = store.count() - before
+            store.close()
+            writes, write_errors = collected["write"]
+            reads, read_errors = collected["read"]
+            result = {
+                "writers": writers, "readers": readers, "seconds": seconds,
+                "appends": len(writes), "appends_per_s": _rate(len(writes), seconds),
+                "append": _percentiles(writes) if writes else None,
+                "write_errors": write_errors, "lost_appends": len(writes) - added,
+                "reads_per_s": _rate(len(reads), seconds),
+                "read": _percentiles(reads) if reads else None, "read_errors": read_errors,
+            }
+            if mode == "full":
+                stats = PopulationStats.load(os.path.join(tmp, "history_stats.json"))
+                archive = ColumnArchive(os.path.join(tmp, "history_archive"), repair=False)
+                result["stats_lost_appends"] = len(writes) - stats.count
+                result["archive_lost_appends"] = len(writes) - archive.count()
+                archive.close()
+            results[mode] = result
+    return results
+
+
+def bench_export(quick):
+    """Выгрузка истории в каждый формат: скорость и пик памяти Python
+    (не должен расти с размером истории)"""
+    import tracemalloc
+    from export import FORMATS, export_history
+    from history_store import HistoryStore
+
+    size = 100000 if quick else 1000000
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        history_path = os.path.join(tmp, "history.db")
+        store = HistoryStore(history_path)
+        store.append_many(history_records(size))
+        store.close()
+        for fmt in FORMATS:
+            path = os.path.join(tmp, f"export.{fmt}")
+            started = time.perf_counter()
+            export_history(path, fmt, history_path)
+            seconds = time.perf_counter() - started
+            # Пик памяти - отдельным проходом: трассировка замедляет выгрузку
+            tracemalloc.start()
+            export_history(path, fmt, history_path)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[fmt] = {"records": size, "seconds": seconds,
+                            "records_per_s": _rate(size, seconds), "peak_kb": peak / 1024}
+    return results
+
+
+def bench_import(quick):
+    """Импорт выгрузки в виде словарей save_to_history в новую базу и
+    повторный импорт того же файла (все записи - дубли)"""
+    from history_import import Importer
+
+    size = 100000 if quick else 1000000
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "dump.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for record in history_records(size):
+                f.write(json.dumps(record.to_dict(), ensure_ascii=False) + "\n")
+        for name in ("new", "duplicates"):
+            started = time.perf_counter()
+            importer = Importer(os.path.join(tmp, "history.db"))
+            with open(path, encoding="utf-8") as src:
+                importer.import_stream(src, "jsonl")
+            finishing = time.perf_counter()
+            importer.close()
+            seconds = time.perf_counter() - started
+            results[name] = {"records": size, "added": importer.added, "seconds": seconds,
+                             "records_per_s": _rate(size, seconds),
+                             "indexes_s": time.perf_counter() - finishing}
+    return results
+
+
+def bench_reports(quick):
+    """Листы результатов: HTML в каталог и в .zip, PDF на малой выборке.
+    Один процесс; с -j скорость отрисовки растёт с числом ядер"""
+    import csv
+    import io
+    import random
+    import reports
+
+    rng = random.Random(1)
+    text = io.StringIO()
+    out = csv.writer(text)
+    out.writerow(("name", "age", "sex", "weight", "height", "factors"))
+    count = 5000 if quick else 50000
+    for i in range(count):
+        age, is_female, weight, height, mask = patient(rng)
+        out.writerow((f"Пациент {i}", age, "ж" if is_female else "м", weight, height,
+                      ";".join(risk_engine.factor_keys(mask))))
+    text = text.getvalue()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, path, pdf, rows in (("html_dir", "sheets", False, count),
+                                      ("html_zip", "sheets.zip", False, count),
+                                      ("pdf_dir", "pdf", True, 100)):
+            src = io.StringIO("\n".join(text.splitlines()[:rows + 1]))
+            output = reports.open_output(os.path.join(tmp, path))
+            started = time.perf_counter()
+            reports.report_stream(src, output, "csv", pdf=pdf)
+            output.close()
+            results[name + "_sheets_per_s"] = _rate(rows, time.perf_counter() - started)
+    return results
+
+
+def bench_archive_scan(quick, rows):
+    """Полный агрегат по столбцовому архиву (archive.ColumnArchive.summary)"""
+    import numpy as np
+    from archive import ColumnArchive
+
+    rows = min(rows, 1000000) if quick else rows
+    rng = np.random.default_rng(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = ColumnArchive(os.path.join(tmp, "archive"))
+        started = time.perf_counter()
+        for start in range(0, rows, 1000000):
+            n = min(1000000, rows - start)
+            age = rng.integers(18, 95, n)
+            weight = rng.uniform(45, 140, n)
+            height = rng.uniform(150, 200, n)
+            female = rng.random(n) < 0.5
+            mask = rng.integers(0, 1 << len(risk_engine.FACTORS), n, dtype=np.uint32)
+            score = risk_engine.score_batch(age, weight / (height / 100) ** 2, female, mask)
+            archive.append_columns({
+                "ts": np.arange(start, start + n), "age": age, "female": female,
+                "weight": weight, "height": height, "factors": mask,
+                "score": score, "tier": risk_engine.tier_batch(score),
+            })
+        write_s = time.perf_counter() - started
+        archive.close()
+
+        archive = ColumnArchive(os.path.join(tmp, "archive"))
+        started = time.perf_counter()
+        archive.summary()
+        scan_s = time.perf_counter() - started
+        archive.close()
+    return {"rows": rows, "write_s": write_s, "scan_s": scan_s,
+            "scan_rows_per_s": _rate(rows, scan_s)}
+
+
+BENCHMARKS = {
+    "scoring": lambda args: bench_scoring(args.quick),
+    "what_if": lambda args: bench_what_if(args.quick),
+    "calibrate": lambda args: bench_calibrate(args.quick),
+    "reports": lambda args: bench_reports(args.quick),
+    "startup": lambda args: bench_startup(args.quick),
+    "metrics": lambda args: bench_metrics(args.quick),
+    "replay": lambda args: bench_replay(args.quick),
+    "save_to_history": lambda args: bench_save_to_history(args.quick, args.sizes),
+    "history_view": lambda args: bench_history_view(args.quick, args.sizes),
+    "history_search": lambda args: bench_history_search(args.quick, args.sizes),
+    "export": lambda args: bench_export(args.quick),
+    "import": lambda args: bench_import(args.quick),
+    "shared_history": lambda args: bench_shared_history(args.quick),
+    "archive_scan": lambda args: bench_archive_scan(args.quick, args.archive_rows),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности")
+    parser.add_argument("-o", "--output", help="файл JSON (по умолчанию stdout)")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="выбранные замеры")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 100000, 1000000],
+                        help="размеры истории (по умолчанию %(default)s)")
+    parser.add_argument("--archive-rows", type=int, default=50000000,
+                        help="записей в архиве для archive_scan (по умолчанию %(default)s)")
+    parser.add_argument("--quick", action="store_true", help="меньше повторов и данных")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": {},
+    }
+    for name in args.only or BENCHMARKS:
+        print(f"{name}...", file=sys.stderr)
+        report["results"][name] = BENCHMARKS[name](args)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,31 @@
+"""Синтетические пациенты и записи истории для замеров"""
+import random
+import time
+
+import risk_engine
+from history_store import HistoryRecord
+
+
+SURNAMES = ("Иванов", "Петров", "Сидоров", "Кузнецов", "Смирнов", "Попов", "Соколов",
+            "Лебедев", "Козлов", "Новиков", "Морозов", "Волков", "Алексеев", "Орлов")
+NAMES = ("Иван", "Пётр", "Сергей", "Алексей", "Дмитрий", "Андрей", "Михаил", "Юрий")
+
+
+def patient(rng):
+    """(возраст, пол, вес, рост, маска факторов)"""
+    mask = 0
+    for i in rng.sample(range(len(risk_engine.FACTORS)), rng.randint(0, 6)):
+        mask |= 1 << i
+    return rng.randint(18, 95), rng.random() < 0.5, rng.randint(45, 140), rng.randint(150, 200), mask
+
+
+def history_records(count, seed=1, start_ts=None):
+    """Записи истории с возрастающим временем, по минуте на запись"""
+    rng = random.Random(seed)
+    ts = int(time.time()) - count * 60 if start_ts is None else start_ts
+    for i in range(count):
+        age, is_female, weight, height, mask = patient(rng)
+        score = risk_engine.score(age, weight / (height / 100) ** 2, is_female, mask)
+        name = f"{rng.choice(SURNAMES)} {rng.choice(NAMES)} {i}"
+        yield HistoryRecord(name, ts + i * 60, age, is_female, float(weight), float(height),
+                            mask, score)
@@ -0,0 +1,444 @@
+"""Подбор баллов риска и порогов уровней по размеченным исходам.
+
+Вход - CSV/JSONL как у пакетной оценки (batch) с дополнительным столбцом
+исхода (по умолчанию outcome: 1/0, да/нет). Пациенты с одинаковыми
+признаками - диапазон возраста, диапазон ИМТ и маска факторов - сводятся
+в один шаблон с числом положительных и отрицательных исходов.
+
+Конфигурация - баллы всех факторов и диапазонов. Случайные конфигурации
+вокруг текущей модели оцениваются по AUC: суммы баллов блока конфигураций
+считаются одним умножением матриц, AUC - по гистограммам сумм. Блоки
+считаются в пуле процессов. Для лучшей конфигурации подбираются пороги
+уровней риска, и она сохраняется файлом модели JSON (см. model.py).
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+import batch
+import model
+import risk_engine
+
+
+DEFAULT_CONFIGS = 100000
+DEFAULT_SPREAD = 2
+DEFAULT_ROUNDS = 2
+# Элементов матрицы (шаблоны x конфигурации) в одном блоке
+BLOCK_ELEMENTS = 1 << 22
+# Наименьшая доля пациентов в уровне риска при подборе порогов
+MIN_TIER_SHARE = 0.01
+
+OUTCOMES = {
+    "1": True, "true": True, "yes": True, "да": True,
+    "0": False, "false": False, "no": False, "нет": False,
+}
+
+# Границы диапазонов по возрастанию
+AGE_LOWERS = tuple(lower for lower, _ in reversed(risk_engine.AGE_BANDS))
+BMI_LOWERS = tuple(lower for lower, _ in reversed(risk_engine.BMI_BANDS))
+FACTOR_COUNT = len(risk_engine.FACTORS)
+# Конфигурация - вектор: баллы факторов в порядке реестра, затем баллы
+# диапазонов возраста и ИМТ от младшего к старшему (у нулевого диапазона
+# баллов нет)
+PARAM_COUNT = FACTOR_COUNT + len(AGE_LOWERS) + len(BMI_LOWERS)
+_AGE_SLICE = slice(FACTOR_COUNT, FACTOR_COUNT + len(AGE_LOWERS))
+_BMI_SLICE = slice(_AGE_SLICE.stop, PARAM_COUNT)
+# Ключ шаблона: маска факторов, номер диапазона возраста (3 бита) и ИМТ
+_AGE_SHIFT = 32
+_BMI_SHIFT = 35
+
+
+def parse_outcome(value):
+    try:
+        return OUTCOMES[str(value).strip().lower()]
+    except KeyError:
+        raise ValueError(f"неизвестное значение исхода: {value!r}") from None
+
+
+def _band_index(values, lowers):
+    # Сравнения, как в risk_engine: NaN не попадает ни в один диапазон
+    return sum((values >= lower).astype(np.int64) for lower in lowers)
+
+
+def current_config():
+    """Баллы действующей модели в виде вектора конфигурации"""
+    return np.array(
+        risk_engine.FACTOR_WEIGHTS
+        + tuple(points for _, points in reversed(risk_engine.AGE_BANDS))
+        + tuple(points for _, points in reversed(risk_engine.BMI_BANDS)),
+        dtype=np.int32,
+    )
+
+
+def current_thresholds():
+    return [lower for lower, _, _ in risk_engine.TIERS[:-1]]
+
+
+class Patterns:
+    """Уникальные сочетания признаков с числом исходов каждого вида"""
+
+    def __init__(self, keys, positive, negative, rejected=0):
+        self.keys = keys
+        self.positive = positive
+        self.negative = negative
+        self.rejected = rejected
+
+    @classmethod
+    def from_columns(cls, ages, bmis, females, masks, outcomes):
+        masks = np.asarray(masks, dtype=np.int64)
+        masks = np.where(females, masks, masks & ~risk_engine.PREGNANCY_BIT)
+        keys = (masks | _band_index(np.asarray(ages), AGE_LOWERS) << _AGE_SHIFT
+                | _band_index(np.asarray(bmis, dtype=np.float64), BMI_LOWERS) << _BMI_SHIFT)
+        outcomes = np.asarray(outcomes, dtype=bool)
+        return cls.merge([(keys, outcomes.astype(np.int64), (~outcomes).astype(np.int64))])
+
+    @classmethod
+    def merge(cls, parts, rejected=0):
+        """Сводит наборы (ключи, положительных, отрицательных) в шаблоны"""
+        keys = np.concatenate([part[0] for part in parts])
+        keys, inverse = np.unique(keys, return_inverse=True)
+        positive = np.bincount(inverse, np.concatenate([part[1] for part in parts]),
+                               len(keys)).astype(np.int64)
+        negative = np.bincount(inverse, np.concatenate([part[2] for part in parts]),
+                               len(keys)).astype(np.int64)
+        return cls(keys, positive, negative, rejected)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def patients(self):
+        return int(self.positive.sum() + self.negative.sum())
+
+    def features(self):
+        """Матрица (шаблоны x PARAM_COUNT): сумма баллов шаблона при
+        конфигурации config - features() @ config"""
+        features = np.zeros((len(self), PARAM_COUNT), dtype=np.float32)
+        features[:, :FACTOR_COUNT] = (self.keys[:, None] >> np.arange(FACTOR_COUNT)) & 1
+        ages = self.keys >> _AGE_SHIFT & 7
+        bmis = self.keys >> _BMI_SHIFT & 7
+        features[:, _AGE_SLICE] = ages[:, None] == np.arange(1, len(AGE_LOWERS) + 1)
+        features[:, _BMI_SLICE] = bmis[:, None] == np.arange(1, len(BMI_LOWERS) + 1)
+        return features
+
+
+def read_patterns(stream, fmt, label="outcome", chunk_size=batch.CHUNK_SIZE):
+    """Шаблоны из размеченного файла. Записи без исхода или с ошибкой
+    разбора считаются отклонёнными."""
+    records = batch.read_records(stream, fmt)
+    parts, total, rejected = [], 0, 0
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        rows, _, ages, bmis, females, masks, bad = batch.parse_chunk(chunk, total)
+        rejected += bad
+        keep, outcomes = [], []
+        for i, row in enumerate(rows):
+            try:
+                outcomes.append(parse_outcome(chunk[row - total][label]))
+            except (KeyError, ValueError):
+                rejected += 1
+                continue
+            keep.append(i)
+        total += len(chunk)
+        if keep:
+            patterns = Patterns.from_columns(
+                batch.clip_ages([ages[i] for i in keep]), [bmis[i] for i in keep],
+                [females[i] for i in keep], [masks[i] for i in keep], outcomes)
+            parts.append((patterns.keys, patterns.positive, patterns.negative))
+    if not parts:
+        return Patterns(np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.int64),
+                        rejected)
+    return Patterns.merge(parts, rejected)
+
+
+# --- Оценка конфигураций ---------------------------------------------------
+
+class _Side:
+    """Шаблоны с исходами одного вида. Шаблоны с одним пациентом (обычно
+    их большинство) дают гистограмму без весов, остальные - с весами."""
+
+    def __init__(self, features, counts):
+        self.total = int(counts.sum())
+        single = counts == 1
+        many = counts > 1
+        self.groups = [(np.ascontiguousarray(features[part]),
+                        None if part is single else counts[part].astype(np.float64))
+                       for part in (single, many) if part.any()]
+
+
+def _block_size(patterns):
+    return max(1, BLOCK_ELEMENTS // max(len(patterns), 1))
+
+
+class Evaluator:
+    def __init__(self, patterns):
+        features = patterns.features()
+        self.positive = _Side(features, patterns.positive)
+        self.negative = _Side(features, patterns.negative)
+        self.pairs = float(self.positive.total) * float(self.negative.total)
+        self.block = _block_size(patterns)
+
+    def histograms(self, configs):
+        """Гистограммы сумм баллов (конфигурации x баллы) для положительных
+        и отрицательных исходов; возвращает (pos, neg, наименьшая сумма)"""
+        # Баллы - небольшие целые, в float32 умножение матриц точное
+        weights = configs.T.astype(np.float32)
+        sides = [[((features @ weights).astype(np.intp), counts)
+                  for features, counts in side.groups]
+                 for side in (self.positive, self.negative)]
+        scores = [group[0] for side in sides for group in side]
+        low = min(group.min() for group in scores)
+        width = max(group.max() for group in scores) - low + 1
+        # Одна гистограмма на весь блок: суммы каждой конфигурации сдвинуты
+        # в свой диапазон корзин
+        offsets = np.arange(len(configs), dtype=np.intp) * width - low
+        size = len(configs) * width
+        histograms = []
+        for side in sides:
+            histogram = np.zeros(size)
+            for group, counts in side:
+                group += offsets
+                if counts is not None:
+                    counts = np.repeat(counts, len(configs))
+                histogram += np.bincount(group.ravel(), counts, size)
+            histograms.append(histogram.reshape(len(configs), width))
+        return histograms[0], histograms[1], int(low)
+
+    def auc(self, configs):
+        """AUC каждой конфигурации: доля пар (положительный, отрицательный),
+        где у положительного сумма больше; равные суммы - половина пары"""
+        aucs = np.empty(len(configs))
+        for start in range(0, len(configs), self.block):
+            pos, neg, _ = self.histograms(configs[start:start + self.block])
+            below = np.cumsum(neg, axis=1) - neg
+            aucs[start:start + self.block] = (pos * (below + 0.5 * neg)).sum(axis=1) / self.pairs
+        return aucs
+
+
+_evaluator = None
+
+
+def _init_worker(patterns):
+    global _evaluator
+    _evaluator = Evaluator(patterns)
+
+
+def _evaluate(configs):
+    return _evaluator.auc(configs)
+
+
+def random_configs(center, count, spread, rng):
+    """count конфигураций вокруг center; первая - сама center.
+
+    Каждый балл сдвигается на целое из [-spread, spread]. Знак балла
+    фактора сохраняется (вакцинация не может повышать риск), баллы
+    диапазонов неотрицательны и не убывают к старшему диапазону.
+    """
+    configs = center + rng.integers(-spread, spread + 1, (count, PARAM_COUNT), dtype=np.int32)
+    configs[0] = center
+    base = current_config()[:FACTOR_COUNT]
+    factors = configs[:, :FACTOR_COUNT]
+    factors[:] = np.where(base > 0, np.maximum(factors, 0), np.minimum(factors, 0))
+    for part in (_AGE_SLICE, _BMI_SLICE):
+        configs[:, part] = np.sort(np.maximum(configs[:, part], 0), axis=1)
+    return configs
+
+
+def search(patterns, count=DEFAULT_CONFIGS, spread=DEFAULT_SPREAD, rounds=DEFAULT_ROUNDS,
+           workers=1, seed=1, progress=None):
+    """Случайный поиск: каждый раунд - count / rounds конфигураций вокруг
+    лучшей найденной. Возвращает (конфигурация, AUC, AUC действующей модели)."""
+    rng = np.random.default_rng(seed)
+    best = current_config()
+    per_round = max(count // rounds, 1)
+    pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(patterns,)) \
+        if workers != 1 else None
+    if pool is None:
+        _init_worker(patterns)
+    block = _block_size(patterns)
+    try:
+        best_auc = base_auc = None
+        done = 0
+        for _ in range(rounds):
+            configs = random_configs(best, per_round, spread, rng)
+            blocks = [configs[i:i + block] for i in range(0, len(configs), block)]
+            results = []
+            for aucs in (pool.map(_evaluate, blocks) if pool else map(_evaluate, blocks)):
+                results.append(aucs)
+                done += len(aucs)
+                if progress is not None:
+                    progress(done, per_round * rounds)
+            aucs = np.concatenate(results)
+            if base_auc is None:
+                base_auc = float(aucs[0])
+            # При равной AUC остаётся прежняя конфигурация (она первая)
+            index = int(aucs.argmax())
+            best, best_auc = configs[index].copy(), float(aucs[index])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return best, best_auc, base_auc
+
+
+# --- Уровни риска -------------------------------------------------------------
+
+def score_histogram(patterns, config):
+    """(положительных, отрицательных по суммам баллов, наименьшая сумма)"""
+    pos, neg, low = Evaluator(patterns).histograms(config[None, :])
+    return pos[0], neg[0], low
+
+
+def fit_thresholds(patterns, config, tiers=len(risk_engine.TIERS), min_share=MIN_TIER_SHARE):
+    """Пороги уровней риска (по убыванию, как в risk_engine.TIERS).
+
+    Уровни - отрезки сумм баллов; пороги выбираются так, чтобы доля
+    исходов внутри уровней различалась как можно сильнее: минимум суммы
+    n * p * (1 - p) по уровням. В каждом уровне не меньше min_share
+    пациентов. None, если различных сумм слишком мало.
+    """
+    pos, neg, low = score_histogram(patterns, config)
+    pos_sum = np.concatenate([[0], np.cumsum(pos)])
+    neg_sum = np.concatenate([[0], np.cumsum(neg)])
+    min_count = min_share * patterns.patients
+    bins = len(pos)
+
+    def cost(a, b):
+        p, q = pos_sum[b] - pos_sum[a], neg_sum[b] - neg_sum[a]
+        if p + q < max(min_count, 1):
+            return None
+        return p * q / (p + q)
+
+    # best[k][j] - (стоимость, начало последнего отрезка) для корзин [0, j) из k отрезков
+    inf = float("inf")
+    best = [[(inf, None)] * (bins + 1) for _ in range(tiers + 1)]
+    best[0][0] = (0.0, None)
+    for k in range(1, tiers + 1):
+        for j in range(k, bins + 1):
+            for i in range(k - 1, j):
+                if best[k - 1][i][0] == inf:
+                    continue
+                c = cost(i, j)
+                if c is not None and best[k - 1][i][0] + c < best[k][j][0]:
+                    best[k][j] = (best[k - 1][i][0] + c, i)
+    if best[tiers][bins][0] == inf:
+        return None
+    starts, j = [], bins
+    for k in range(tiers, 0, -1):
+        j = best[k][j][1]
+        starts.append(j)
+    # Начала всех отрезков, кроме нижнего, - пороги от старшего уровня
+    return [low + start for start in starts[:-1]]
+
+
+def tier_report(patterns, config, thresholds):
+    """Калибровка по уровням: [(подпись, пациентов, доля, доля исходов)]"""
+    pos, neg, low = score_histogram(patterns, config)
+    total = patterns.patients
+    scores = np.arange(low, low + len(pos))
+    rows = []
+    upper = None
+    for (_, label, _), lower in zip(risk_engine.TIERS, list(thresholds) + [None]):
+        inside = np.ones(len(scores), dtype=bool)
+        if lower is not None:
+            inside &= scores >= lower
+        if upper is not None:
+            inside &= scores < upper
+        p, n = int(pos[inside].sum()), int(neg[inside].sum())
+        rows.append((label, p + n, (p + n) / total if total else 0.0,
+                     p / (p + n) if p + n else None))
+        upper = lower
+    return rows
+
+
+# --- Файл модели ----------------------------------------------------------
+
+def model_dict(config, thresholds, auc=None, patients=None, version=None):
+    config = [int(value) for value in config]
+    ages = config[_AGE_SLICE]
+    bmis = config[_BMI_SLICE]
+    return {
+        "format": model.FORMAT_VERSION,
+        "version": version or time.strftime("%Y%m%d-%H%M%S"),
+        "created": int(time.time()),
+        "auc": auc,
+        "patients": patients,
+        # По убыванию границы, как AGE_BANDS/BMI_BANDS в risk_engine
+        "age_bands": [[lower, points] for lower, points in reversed(list(zip(AGE_LOWERS, ages)))],
+        "bmi_bands": [[lower, points] for lower, points in reversed(list(zip(BMI_LOWERS, bmis)))],
+        # По ключу: порядок факторов в реестре может поменяться
+        "weights": {factor.key: w for factor, w in zip(risk_engine.FACTORS, config)},
+        "tiers": [int(lower) for lower in thresholds],
+    }
+
+
+def print_report(title, auc, rows, stream=sys.stderr):
+    print(f"{title}: AUC {auc:.4f}", file=stream)
+    for label, count, share, rate in rows:
+        rate = "-" if rate is None else f"{rate:.1%}"
+        print(f"  {label:<16} пациентов {count:>9} ({share:6.1%}), исходов {rate}", file=stream)
+
+
+def run(args):
+    fmt = args.format or batch.detect_format(args.input)
+    started = time.perf_counter()
+    with batch._open_input(args.input) as src:
+        patterns = read_patterns(src, fmt, args.label, args.chunk_size)
+    print(f"Пациентов: {patterns.patients}, шаблонов: {len(patterns)}, "
+          f"отклонено: {patterns.rejected}", file=sys.stderr)
+    if not patterns.positive.any() or not patterns.negative.any():
+        print("Нужны пациенты с обоими исходами", file=sys.stderr)
+        return 2
+
+    shown = [-1]
+
+    def progress(done, total):
+        percent = done * 100 // total
+        if percent != shown[0]:
+            shown[0] = percent
+            print(f"\rКонфигураций: {done}/{total} ({percent}%)", end="", file=sys.stderr,
+                  flush=True)
+
+    workers = args.workers or os.cpu_count() or 1
+    config, auc, base_auc = search(patterns, args.configs, args.spread, args.rounds,
+                                   workers, args.seed, progress)
+    print(file=sys.stderr)
+    thresholds = fit_thresholds(patterns, config) or current_thresholds()
+
+    print_report("Действующая модель", base_auc,
+                 tier_report(patterns, current_config(), current_thresholds()))
+    print_report("Подобранная модель", auc, tier_report(patterns, config, thresholds))
+    model.save(model_dict(config, thresholds, auc, patterns.patients, args.version), args.output)
+    print(f"Модель сохранена: {args.output} за {time.perf_counter() - started:.1f} с",
+          file=sys.stderr)
+    return 0
+
+
+def add_arguments(parser):
+    parser.add_argument("input", nargs="?", default="-",
+                        help="размеченный файл CSV/JSONL (по умолчанию stdin)")
+    parser.add_argument("-o", "--output", default=model.DEFAULT_PATH,
+                        help="файл модели (по умолчанию %(default)s)")
+    parser.add_argument("-f", "--format", choices=batch.FORMATS,
+                        help="формат входа (по умолчанию по расширению, иначе csv)")
+    parser.add_argument("--label", default="outcome",
+                        help="столбец исхода (по умолчанию %(default)s)")
+    parser.add_argument("-n", "--configs", type=int, default=DEFAULT_CONFIGS,
+                        help="число проверяемых конфигураций (по умолчанию %(default)s)")
+    parser.add_argument("--spread", type=int, default=DEFAULT_SPREAD,
+                        help="наибольший сдвиг балла (по умолчанию %(default)s)")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS,
+                        help="раундов поиска (по умолчанию %(default)s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--version", help="версия модели (по умолчанию дата и время)")
+    parser.add_argument("--chunk-size", type=batch.count_argument(1),
+                        default=batch.CHUNK_SIZE,
+                        help="число строк в блоке (по умолчанию %(default)s)")
+    parser.add_argument("-j", "--workers", type=batch.count_argument(0), default=0,
+                        help="число процессов; 0 - по числу ядер (по умолчанию %(default)s)")
+    parser.set_defaults(func=run)
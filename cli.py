@@ -0,0 +1,55 @@
+"""Консольные режимы калькулятора риска COVID-19 (без графического интерфейса).
+
+    python cli.py score patients.csv -o results.csv
+    python cli.py serve --port 8080
+    python cli.py archive-stats history_archive
+    python cli.py export history.xlsx
+    python cli.py what-if patients.csv -o what_if.csv
+    python cli.py calibrate outcomes.csv -o model.json
+    python cli.py report patients.csv -o reports.zip
+    python cli.py import kiosk1.jsonl kiosk2.csv --history history.db
+"""
+import argparse
+import sys
+
+import archive
+import batch
+import calibrate
+import export
+import history_import
+import reports
+import service
+import whatif
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="kURS", description="Калькулятор риска COVID-19")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch.add_arguments(commands.add_parser(
+        "score", help="пакетная оценка файла CSV/JSONL"))
+    service.add_arguments(commands.add_parser(
+        "serve", help="HTTP-сервис оценки риска"))
+    archive.add_arguments(commands.add_parser(
+        "archive-stats", help="сводка по архиву всех оценок"))
+    export.add_arguments(commands.add_parser(
+        "export", help="выгрузка истории в CSV/JSONL/XLSX"))
+    whatif.add_arguments(commands.add_parser(
+        "what-if", help="как изменится риск при изменении образа жизни"))
+    calibrate.add_arguments(commands.add_parser(
+        "calibrate", help="подбор баллов и порогов по размеченным исходам"))
+    reports.add_arguments(commands.add_parser(
+        "report", help="листы результатов HTML/PDF для каждого пациента"))
+    history_import.add_arguments(commands.add_parser(
+        "import", help="импорт выгрузок истории JSONL/CSV без дублей"))
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""Выгрузка истории оценок в CSV, JSONL или XLSX.
+
+Записи читаются курсором по одной и сразу пишутся в файл, поэтому память не
+зависит от размера истории. XLSX собирается вручную через zipfile: лист
+пишется потоком со строками прямо в ячейках (inlineStr), без общей таблицы
+строк; каждые XLSX_MAX_ROWS записей начинается новый лист. Столбцы name,
+age, sex, weight, height и factors совпадают с входом пакетной оценки
+(batch), так что выгрузку можно пересчитать командой score.
+"""
+import csv
+import json
+import os
+import re
+import sys
+import zipfile
+from xml.sax.saxutils import escape
+
+import risk_engine
+from history_store import HistoryStore, DEFAULT_PATH
+
+
+FORMATS = ("csv", "jsonl", "xlsx")
+FIELDS = ("date", "name", "age", "sex", "weight", "height", "factors", "score", "tier",
+          "model")
+PROGRESS_EVERY = 10000
+# Строк на листе Excel, включая заголовок
+XLSX_MAX_ROWS = 1048576
+
+
+class Cancelled(Exception):
+    pass
+
+
+def detect_format(path, default="csv"):
+    ext = os.path.splitext(path or "")[1].lower()
+    if ext in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if ext == ".xlsx":
+        return "xlsx"
+    if ext == ".csv":
+        return "csv"
+    return default
+
+
+# Ключи факторов для каждого значения каждого байта маски: маска
+# раскладывается в список за 4 обращения к таблице вместо перебора факторов
+_BYTE_KEYS = [
+    [tuple(risk_engine.factor_keys(value << shift)) for value in range(256)]
+    for shift in range(0, len(risk_engine.FACTORS), 8)
+]
+
+
+def _factor_keys(mask):
+    keys = ()
+    for table in _BYTE_KEYS:
+        keys += table[mask & 255]
+        mask >>= 8
+    return keys
+
+
+def _values(record, factors=None):
+    return (record.date, record.name, record.age, record.sex, record.weight, record.height,
+            ";".join(_factor_keys(record.factors)) if factors is None else factors,
+            record.score, risk_engine.TIERS[record.tier][1], record.model)
+
+
+class CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8-sig", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(FIELDS)
+
+    def write(self, record):
+        self.writer.writerow(_values(record))
+
+    def close(self):
+        self.file.close()
+
+
+class JsonlWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8", newline="\n")
+
+    def write(self, record):
+        values = dict(zip(FIELDS, _values(record, list(_factor_keys(record.factors)))))
+        self.file.write(json.dumps(values, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+# Символы, недопустимые в XML 1.0
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '{sheets}</Types>'
+)
+_SHEET_TYPE = ('<Override PartName="/xl/worksheets/sheet{n}.xml" '
+               'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>')
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets></workbook>'
+)
+_WORKBOOK_SHEET = '<sheet name="История {n}" sheetId="{n}" r:id="rId{n}"/>'
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{sheets}</Relationships>'
+)
+_WORKBOOK_REL = ('<Relationship Id="rId{n}" Target="worksheets/sheet{n}.xml" '
+                 'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>')
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+# Строк, которые копятся перед записью в архив
+_XLSX_BUFFER_ROWS = 1000
+
+
+def _cell(value):
+    if isinstance(value, str):
+        return f'<c t="inlineStr"><is><t>{escape(_XML_INVALID.sub("", value))}</t></is></c>'
+    return f'<c><v>{value}</v></c>'
+
+
+def _xlsx_row(values):
+    return "<row>" + "".join(_cell(value) for value in values) + "</row>"
+
+
+class XlsxWriter:
+    def __init__(self, path):
+        # Быстрое сжатие: выгрузка упирается в процессор, а не в диск
+        self.zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=1)
+        self.sheets = 0
+        self.sheet = None
+        self.rows = 0
+        self.buffer = []
+        self.new_sheet()
+
+    def new_sheet(self):
+        self.end_sheet()
+        self.sheets += 1
+        self.sheet = self.zip.open(f"xl/worksheets/sheet{self.sheets}.xml", "w",
+                                   force_zip64=True)
+        self.buffer = [_SHEET_HEAD, _xlsx_row(FIELDS)]
+        self.rows = 1
+
+    def end_sheet(self):
+        if self.sheet is None:
+            return
+        self.buffer.append(_SHEET_TAIL)
+        self.flush()
+        self.sheet.close()
+        self.sheet = None
+
+    def flush(self):
+        self.sheet.write("".join(self.buffer).encode("utf-8"))
+        self.buffer = []
+
+    def write(self, record):
+        if self.rows == XLSX_MAX_ROWS:
+            self.new_sheet()
+        self.buffer.append(_xlsx_row(_values(record)))
+        self.rows += 1
+        if len(self.buffer) >= _XLSX_BUFFER_ROWS:
+            self.flush()
+
+    def close(self):
+        self.end_sheet()
+        numbers = range(1, self.sheets + 1)
+        self.zip.writestr("[Content_Types].xml", _CONTENT_TYPES.format(
+            sheets="".join(_SHEET_TYPE.format(n=n) for n in numbers)))
+        self.zip.writestr("_rels/.rels", _ROOT_RELS)
+        self.zip.writestr("xl/workbook.xml", _WORKBOOK.format(
+            sheets="".join(_WORKBOOK_SHEET.format(n=n) for n in numbers)))
+        self.zip.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS.format(
+            sheets="".join(_WORKBOOK_REL.format(n=n) for n in numbers)))
+        self.zip.close()
+
+
+WRITERS = {"csv": CsvWriter, "jsonl": JsonlWriter, "xlsx": XlsxWriter}
+
+
+def export_records(records, path, fmt, total=None, progress=None, cancelled=None):
+    """Пишет записи в файл path. Возвращает число записей.
+
+    progress(сделано, всего) вызывается каждые PROGRESS_EVERY записей и в
+    конце; если cancelled() вернула True, недописанный файл удаляется и
+    выбрасывается Cancelled.
+    """
+    writer = WRITERS[fmt](path)
+    count = 0
+    try:
+        for record in records:
+            writer.write(record)
+            count += 1
+            if count % PROGRESS_EVERY == 0:
+                if cancelled is not None and cancelled():
+                    raise Cancelled()
+                if progress is not None:
+                    progress(count, total)
+        writer.close()
+    except BaseException:
+        writer.close()
+        os.remove(path)
+        raise
+    if progress is not None:
+        progress(count, total)
+    return count
+
+
+def export_history(path, fmt=None, history_path=DEFAULT_PATH, progress=None, cancelled=None):
+    """Выгрузка всей истории от старых записей к новым"""
+    store = HistoryStore(history_path)
+    try:
+        return export_records(store.iter_records(newest_first=False), path,
+                              fmt or detect_format(path), store.count(), progress, cancelled)
+    finally:
+        store.close()
+
+
+def run(args):
+    count = export_history(args.output, args.format, args.history)
+    print(f"Выгружено записей: {count}", file=sys.stderr)
+    return 0
+
+
+def add_arguments(parser):
+    parser.add_argument("output", help="файл выгрузки (.csv, .jsonl или .xlsx)")
+    parser.add_argument("-f", "--format", choices=FORMATS,
+                        help="формат (по умолчанию - по расширению файла)")
+    parser.add_argument("--history", default=DEFAULT_PATH,
+                        help="файл истории (по умолчанию %(default)s)")
+    parser.set_defaults(func=run)
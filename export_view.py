@@ -0,0 +1,41 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+import export
+
+
+class ExportWorker(QThread):
+    """Выгрузка истории в отдельном потоке. Поток открывает своё соединение
+    с базой; окно получает только сигналы о ходе выгрузки"""
+
+    progress = pyqtSignal(int, int)
+    done = pyqtSignal(int)
+    cancelled = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, fmt, history_path, writer=None, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.fmt = fmt
+        self.history_path = history_path
+        # Фоновая запись истории: её очередь дописывается до начала выгрузки
+        self.writer = writer
+        self.cancel_requested = False
+
+    def cancel(self):
+        self.cancel_requested = True
+
+    def run(self):
+        if self.writer is not None:
+            self.writer.flush(wait=True)
+        try:
+            count = export.export_history(
+                self.path, self.fmt, self.history_path,
+                progress=lambda count, total: self.progress.emit(count, total or 0),
+                cancelled=lambda: self.cancel_requested,
+            )
+        except export.Cancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.done.emit(count)
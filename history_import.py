@@ -0,0 +1,238 @@
+"""Импорт истории оценок из выгрузок JSONL/CSV, например с нескольких киосков.
+
+Принимаются записи в виде словаря save_to_history (ФИО, дата, данные,
+результат - как HistoryRecord.to_dict), те же поля без вложенности (CSV) и
+выгрузки export (date, name, age, ...). В ранних выгрузках save_to_history
+нет поля баллов - они пересчитываются по данным записи (parse_score). Дубли
+отбрасываются по хешу содержимого нормализованной записи
+(history_store.content_hash): так отсекаются и записи, которые уже есть в
+базе, и повторы между файлами.
+
+Файлы читаются потоком, блок из BATCH_SIZE записей добавляется одной
+транзакцией. На время импорта индексы поиска и триггер таблицы факторов
+снимаются (HistoryStore.bulk_begin) и строятся один раз в конце, поэтому
+память ограничена блоком. Добавленные записи учитываются в статистике и
+архиве оценок рядом с базой, как если бы их сохранило окно.
+"""
+import math
+import re
+import sys
+import time
+from functools import lru_cache
+
+import batch
+import risk_engine
+from history_store import DEFAULT_PATH, HistoryRecord, HistoryStore
+from history_writer import open_archive, write_records
+
+
+BATCH_SIZE = 100000
+CACHE_KB = 65536
+# Поля словаря save_to_history -> поля выгрузки export
+LEGACY_FIELDS = {
+    "ФИО": "name", "дата": "date", "возраст": "age", "пол": "sex", "вес": "weight",
+    "рост": "height", "факторы": "factors", "баллы": "score", "текст": "tier",
+    "модель": "model",
+}
+# Фактор указывается ключом (export) или подписью (save_to_history)
+_FACTOR_BITS = dict(risk_engine.FACTOR_BITS)
+_FACTOR_BITS.update((name, bit) for bit, name in enumerate(risk_engine.FACTOR_NAMES))
+# Границы INTEGER SQLite; баллы хранятся в архиве как int16
+_AGE_LIMIT = 1 << 63
+_SCORE_LIMIT = 1 << 15
+# Баллы в тексте результата (risk_engine.result_html): "... (баллов: 8)"
+_SCORE_TEXT = re.compile(r"\(баллов:\s*(-?\d+)\)")
+
+
+def _fields(record):
+    # Поля "данные" и "результат" словаря save_to_history вложенные
+    if "name" in record:
+        return record  # выгрузка export
+    fields = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            for inner, inner_value in value.items():
+                fields[LEGACY_FIELDS.get(inner, inner)] = inner_value
+        else:
+            fields[LEGACY_FIELDS.get(key, key)] = value
+    return fields
+
+
+@lru_cache(maxsize=65536)
+def parse_date(text):
+    """Время по дате history_store.DATE_FORMAT ("dd.mm.yyyy hh:mm", местное).
+    В выгрузке даты идут подряд и повторяются, поэтому разбор кэшируется"""
+    text = text.strip()
+    if len(text) != 16 or text[2] != "." or text[5] != "." or text[13] != ":":
+        raise ValueError(f"неверная дата: {text!r}")
+    day, month, year = int(text[:2]), int(text[3:5]), int(text[6:10])
+    hour, minute = int(text[11:13]), int(text[14:16])
+    if not (1 <= day <= 31 and 1 <= month <= 12 and hour < 24 and minute < 60):
+        raise ValueError(f"неверная дата: {text!r}")
+    return int(time.mktime((year, month, day, hour, minute, 0, 0, 0, -1)))
+
+
+def parse_factors(value):
+    if value is None or value == "":
+        return 0
+    if isinstance(value, str):
+        value = value.split(";")
+    mask = 0
+    for item in value:
+        item = item.strip()
+        if item and item != risk_engine.NO_FACTORS:
+            try:
+                mask |= 1 << _FACTOR_BITS[item]
+            except KeyError:
+                raise ValueError(f"неизвестный фактор риска: {item!r}") from None
+    return mask
+
+
+def parse_tier(text, risk_score, model):
+    # Уровень - по подписи в тексте результата; без неё его можно
+    # восстановить по баллам только для встроенной модели
+    if text:
+        for i, (_, label, _) in enumerate(risk_engine.TIERS):
+            if label in text:
+                return i
+    if model == risk_engine.BUILTIN_MODEL:
+        return risk_engine.tier_index(risk_score)
+    raise ValueError("не указан уровень риска")
+
+
+def parse_score(fields, age, is_female, weight, height, mask, model):
+    """(баллы, номер строки TIERS). Баллы - из поля score. В первых версиях
+    save_to_history его не было, а запись сохранялась до расчёта, так что
+    текст результата в ней - от предыдущего пациента. Поэтому баллы и
+    уровень встроенной модели пересчитываются по данным записи; текст
+    используется, только если пересчитать нельзя (модель из файла)"""
+    text = fields.get("tier")
+    value = fields.get("score")
+    if value is not None and value != "":
+        risk_score = _integer(value, _SCORE_LIMIT)
+        return risk_score, parse_tier(text, risk_score, model)
+    if model == risk_engine.BUILTIN_MODEL:
+        risk_score = risk_engine.score(age, risk_engine.parse_bmi(weight, height), is_female,
+                                       mask)
+        return risk_score, risk_engine.tier_index(risk_score)
+    found = _SCORE_TEXT.search(text or "")
+    if found:
+        risk_score = _integer(found.group(1), _SCORE_LIMIT)
+        return risk_score, parse_tier(text, risk_score, model)
+    raise ValueError("не указаны баллы")
+
+
+def _integer(text, limit):
+    value = int(batch._text(text))
+    if not -limit <= value < limit:
+        raise ValueError(f"число вне диапазона: {value}")
+    return value
+
+
+def _real(text):
+    value = float(text)
+    if not math.isfinite(value):
+        raise ValueError(f"неверное число: {text!r}")
+    return value
+
+
+def parse_record(record):
+    """HistoryRecord из записи выгрузки или исключение. Оценки без баллов
+    (ошибка ввода) не импортируются, как и при переносе версии 1"""
+    fields = _fields(record)
+    name = " ".join(str(fields["name"]).split())
+    model = fields.get("model") or risk_engine.BUILTIN_MODEL
+    age = _integer(fields["age"], _AGE_LIMIT)
+    is_female = batch.parse_sex(fields["sex"])
+    weight, height = _real(fields["weight"]), _real(fields["height"])
+    mask = parse_factors(fields.get("factors"))
+    risk_score, tier = parse_score(fields, age, is_female, weight, height, mask, model)
+    return HistoryRecord(name, parse_date(fields["date"]), age, is_female, weight, height, mask,
+                         risk_score, tier, model)
+
+
+def parse_records(records):
+    """HistoryRecord по записям выгрузки; вместо отклонённой записи - None"""
+    for record in records:
+        try:
+            yield parse_record(record)
+        except (ValueError, ArithmeticError, KeyError, TypeError, AttributeError):
+            yield None
+
+
+class Importer:
+    """Импорт в базу history_path. Статистика и архив - рядом с базой, по тем
+    же правилам путей, что у окна; файл статистики обновляется, только если
+    он уже есть (иначе окно пересчитает её по истории)"""
+
+    def __init__(self, history_path=DEFAULT_PATH, batch_size=BATCH_SIZE):
+        self.store = HistoryStore(history_path)
+        # Индекс хешей растёт вместе с базой, вставки в него случайны
+        self.store.conn.execute(f"PRAGMA cache_size = -{CACHE_KB}")
+        self.batch_size = batch_size
+        base = history_path.rsplit(".", 1)[0]
+        self.stats_path = base + "_stats.json"
+        self.archive = open_archive(self.store, base + "_archive")
+        self.total = self.added = self.rejected = 0
+        self.store.bulk_begin()
+
+    def import_stream(self, src, fmt):
+        # Записи разбираются по мере чтения: в памяти держится блок
+        # компактных HistoryRecord, а не словарей выгрузки
+        parsed = []
+        for record in parse_records(batch.read_records(src, fmt)):
+            self.total += 1
+            if record is None:
+                self.rejected += 1
+                continue
+            parsed.append(record)
+            if len(parsed) == self.batch_size:
+                self._add(parsed)
+                parsed = []
+        self._add(parsed)
+
+    def _add(self, records):
+        # Как у потока записи окна: база, архив и статистика - под одной
+        # блокировкой записи
+        with self.store.transaction():
+            self.store.bulk_touch()
+            self.added += len(write_records(self.store, self.archive, self.stats_path, records,
+                                            deduplicate=True))
+
+    def close(self):
+        """Строит индексы"""
+        self.store.bulk_end()
+        self.store.close()
+        self.archive.close()
+
+    @property
+    def duplicates(self):
+        return self.total - self.rejected - self.added
+
+
+def run(args):
+    started = time.perf_counter()
+    importer = Importer(args.history, args.batch_size)
+    try:
+        for path in args.inputs:
+            fmt = args.format or batch.detect_format(path)
+            with batch._open_input(path) as src:
+                importer.import_stream(src, fmt)
+    finally:
+        importer.close()
+    batch.report(importer.total, importer.rejected, time.perf_counter() - started)
+    print(f"Добавлено записей: {importer.added}, дублей: {importer.duplicates}",
+          file=sys.stderr)
+    return 0
+
+
+def add_arguments(parser):
+    parser.add_argument("inputs", nargs="+", metavar="input",
+                        help="файлы выгрузки JSONL/CSV ('-' - stdin)")
+    parser.add_argument("--history", default=DEFAULT_PATH,
+                        help="файл истории (по умолчанию %(default)s)")
+    parser.add_argument("-f", "--format", choices=batch.FORMATS,
+                        help="формат входа (по умолчанию по расширению, иначе csv)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="записей в одной транзакции (по умолчанию %(default)s)")
+    parser.set_defaults(func=run)
@@ -0,0 +1,621 @@
+"""Хранилище истории оценок в SQLite.
+
+Запись истории - компактная HistoryRecord: числовые поля и 32-битная маска
+факторов; подписи факторов, текст и цвет результата восстанавливаются
+только при показе. База открывается в режиме WAL, при открытии история не
+читается; добавление записи - одна вставка в конец таблицы, стоимость не
+зависит от её размера.
+
+Поиск (HistoryStore.search) идёт только по индексам: ключ ФИО без учёта
+регистра (name_key), время, уровень риска и таблица history_factors - по
+строке на каждый отмеченный фактор, которую заполняет триггер. Из индексов,
+подходящих к запросу, выбирается тот, по которому нашлось меньше записей.
+
+Каждая запись хранит уровень риска и версию модели оценки (model.py), по
+которой она получена; версии лежат в таблице models, в записи - номер
+строки, у встроенной модели - NULL.
+
+Для поиска дублей при импорте (history_import) у записи есть хеш содержимого
+(content_hash) с индексом: импортируемая запись с тем же содержимым не
+добавляется (append с deduplicate). Оценки, сохранённые окном, добавляются
+всегда - две одинаковые оценки за минуту остаются двумя записями. Массовая
+загрузка (bulk_begin/bulk_end) снимает индексы поиска и триггер
+history_factors и строит их заново один раз в конце.
+
+Таблица sinks хранит число записей в архиве и файле статистики
+(history_writer) на момент фиксации транзакции: они дописываются до неё, и
+по этому числу следующая запись находит строки откатившейся транзакции.
+
+Одну базу могут одновременно читать и дополнять несколько копий программы и
+консольных команд. У каждого потока своё соединение (HistoryStore.conn);
+запись идёт транзакциями transaction(), которые берут блокировку записи
+сразу и при занятой базе ждут и повторяют попытку. В режиме WAL читатели не
+блокируют писателей и не ждут их.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import risk_engine
+
+
+DEFAULT_PATH = "history.db"
+SCHEMA_VERSION = 7
+DATE_FORMAT = "%d.%m.%Y %H:%M"  # как "dd.MM.yyyy hh:mm" в Qt
+# Сколько секунд ждать блокировку записи, занятую другим соединением, и
+# сколько раз после этого повторить попытку
+BUSY_TIMEOUT = 10.0
+WRITE_ATTEMPTS = 5
+# Массовая загрузка, которая столько секунд не добавляла записей, считается
+# прерванной: её завершает следующее открытие базы
+BULK_STALE = 600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    age INTEGER NOT NULL,
+    female INTEGER NOT NULL,
+    weight REAL NOT NULL,
+    height REAL NOT NULL,
+    factors INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    tier INTEGER NOT NULL,
+    name_key TEXT NOT NULL DEFAULT '',
+    model INTEGER,
+    hash INTEGER
+);
+CREATE TABLE IF NOT EXISTS models (
+    id INTEGER PRIMARY KEY,
+    version TEXT NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS history_ts ON history (ts);
+CREATE INDEX IF NOT EXISTS history_name_key ON history (name_key, ts);
+CREATE INDEX IF NOT EXISTS history_tier_ts ON history (tier, ts);
+CREATE INDEX IF NOT EXISTS history_score ON history (score);
+CREATE INDEX IF NOT EXISTS history_hash ON history (hash);
+CREATE TABLE IF NOT EXISTS history_factors (
+    factor INTEGER NOT NULL,
+    tier INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    PRIMARY KEY (factor, tier, ts, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS factor_bits (bit INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS sinks (
+    path TEXT PRIMARY KEY,
+    rows INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO factor_bits (bit) VALUES {bits};
+CREATE TRIGGER IF NOT EXISTS history_factors_insert AFTER INSERT ON history BEGIN
+    INSERT INTO history_factors (factor, tier, ts, id)
+    SELECT bit, NEW.tier, NEW.ts, NEW.id FROM factor_bits WHERE NEW.factors >> bit & 1;
+END
+""".replace("{bits}", ", ".join(f"({bit})" for bit in range(32)))
+
+_RECORD_COLUMNS = ("name", "ts", "age", "female", "weight", "height", "factors", "score",
+                   "tier", "model")
+_COLUMNS = _RECORD_COLUMNS + ("name_key", "hash")
+_INSERT = (f"INSERT INTO history ({', '.join(_COLUMNS)}) "
+           f"VALUES ({', '.join('?' * len(_COLUMNS))})")
+# Импорт: запись с тем же хешем содержимого уже есть - дубль пропускается
+_INSERT_NEW = (f"INSERT INTO history ({', '.join(_COLUMNS)}) "
+               f"SELECT {', '.join('?' * len(_COLUMNS))} "
+               f"WHERE NOT EXISTS (SELECT 1 FROM history WHERE hash = ?)")
+_SELECT = f"SELECT {', '.join(_RECORD_COLUMNS)} FROM history"
+# Индексы и триггер, которые снимаются на время массовой загрузки;
+# bulk_end создаёт их заново по _SCHEMA
+_BULK_INDEXES = ("history_ts", "history_name_key", "history_tier_ts", "history_score")
+_BULK_TRIGGER = "history_factors_insert"
+
+PAGE_SIZE = 200
+# Индекс поиска, по которому нашлось не больше записей, читается целиком и
+# сортируется; если таких нет - записи просматриваются от новых к старым
+SEARCH_SCAN_LIMIT = 2000
+# Ключи сортировки для постраничного чтения
+SORT_KEYS = {
+    "date": "ts",
+    "score": "score",
+}
+
+
+class HistoryRecord:
+    """Одна оценка. Факторы - битовая маска по risk_engine.FACTORS; tier -
+    уровень риска по модели model (по умолчанию - встроенной)"""
+
+    __slots__ = ("name", "ts", "age", "is_female", "weight", "height", "factors", "score",
+                 "tier", "model")
+
+    def __init__(self, name, ts, age, is_female, weight, height, factors, score, tier=None,
+                 model=risk_engine.BUILTIN_MODEL):
+        self.name = name
+        self.ts = ts
+        self.age = age
+        self.is_female = is_female
+        self.weight = weight
+        self.height = height
+        self.factors = factors
+        self.score = score
+        self.tier = risk_engine.tier_index(score) if tier is None else tier
+        self.model = model
+
+    def has_factor(self, key):
+        return bool(self.factors >> risk_engine.FACTOR_BITS[key] & 1)
+
+    @property
+    def date(self):
+        return time.strftime(DATE_FORMAT, time.localtime(self.ts))
+
+    @property
+    def sex(self):
+        return "Женский" if self.is_female else "Мужской"
+
+    @property
+    def color(self):
+        return risk_engine.TIERS[self.tier][2]
+
+    @property
+    def result_text(self):
+        return f"{risk_engine.TIERS[self.tier][1]} риск (баллов: {self.score})"
+
+    def factor_names(self):
+        return risk_engine.factor_names(self.factors)
+
+    def to_dict(self):
+        """Запись в прежнем виде словаря save_to_history"""
+        return {
+            "ФИО": self.name,
+            "дата": self.date,
+            "данные": {
+                "возраст": str(self.age),
+                "пол": self.sex,
+                "вес": f"{self.weight:g}",
+                "рост": f"{self.height:g}",
+                "факторы": self.factor_names(),
+            },
+            "результат": {
+                "текст": risk_engine.result_html(self.score, self.tier),
+                "цвет": self.color,
+                "баллы": self.score,
+            },
+            "модель": self.model,
+        }
+
+
+def name_key(name):
+    """Ключ поиска по ФИО: без регистра, ё = е"""
+    return " ".join(name.split()).casefold().replace("ё", "е")
+
+
+def content_hash(name, ts, age, is_female, weight, height, factors, score,
+                 model=risk_engine.BUILTIN_MODEL):
+    """Хеш содержимого записи (64 бита со знаком, как INTEGER SQLite).
+
+    ФИО - без лишних пробелов, время - с точностью до минуты, как в поле
+    «дата» словаря записи, поэтому запись и её выгрузка дают один хеш.
+    """
+    text = "\x1f".join((" ".join(name.split()), str(ts // 60), str(age),
+                        "1" if is_female else "0", f"{weight:g}", f"{height:g}", str(factors),
+                        str(score), model or risk_engine.BUILTIN_MODEL))
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big",
+                          signed=True)
+
+
+def record_hash(record):
+    return content_hash(record.name, record.ts, record.age, record.is_female, record.weight,
+                        record.height, record.factors, record.score, record.model)
+
+
+def _prefix_end(prefix):
+    # Наименьшая строка больше всех строк, начинающихся с prefix
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _create_schema(conn):
+    # По одной команде, а не executescript: тот завершает текущую транзакцию.
+    # Тело триггера содержит ";", поэтому оно склеивается обратно
+    statement = ""
+    for part in _SCHEMA.split(";"):
+        statement += part
+        if "BEGIN" in statement and "END" not in statement:
+            statement += ";"
+            continue
+        if statement.strip():
+            conn.execute(statement)
+        statement = ""
+
+
+def _row(record, model_id=None):
+    return (record.name, record.ts, record.age, int(record.is_female), record.weight,
+            record.height, record.factors, record.score, record.tier, model_id,
+            name_key(record.name), record_hash(record))
+
+
+def connect(path):
+    # Соединение закрывается из любого потока (HistoryStore.close), но
+    # используется только своим
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _is_busy(error):
+    return "locked" in str(error) or "busy" in str(error)
+
+
+def _migrate_v1(conn):
+    # Версия 1 хранила словари save_to_history: числа текстом, факторы -
+    # JSON-списком подписей. Оценки с ошибкой ввода (без баллов) не переносятся
+    bits = {name: i for i, name in enumerate(risk_engine.FACTOR_NAMES)}
+    conn.execute("ALTER TABLE history RENAME TO history_v1")
+    for index in ("history_ts", "history_name", "history_tier", "history_score"):
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+    _create_schema(conn)
+    rows = conn.execute("SELECT name, ts, age, sex, weight, height, factors, score "
+                        "FROM history_v1 WHERE score IS NOT NULL ORDER BY id")
+    converted = []
+    for name, ts, age, sex, weight, height, factors, score in rows:
+        try:
+            mask = 0
+            for label in json.loads(factors):
+                if label in bits:
+                    mask |= 1 << bits[label]
+            record = HistoryRecord(name, ts, int(age), sex == "Женский", float(weight),
+                                   float(height), mask, score)
+        except ValueError:
+            continue
+        converted.append(_row(record))
+    conn.executemany(_INSERT, converted)
+    conn.execute("DROP TABLE history_v1")
+
+
+def _migrate_v2(conn):
+    # Версия 3 добавила ключ поиска по ФИО, составные индексы и таблицу
+    # факторов для поиска
+    conn.create_function("name_key", 1, name_key, deterministic=True)
+    conn.execute("ALTER TABLE history ADD COLUMN name_key TEXT NOT NULL DEFAULT ''")
+    conn.execute("UPDATE history SET name_key = name_key(name)")
+    for index in ("history_name", "history_tier"):
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+    _create_schema(conn)
+    conn.execute("INSERT INTO history_factors (factor, tier, ts, id) "
+                 "SELECT bit, tier, ts, id FROM history JOIN factor_bits ON factors >> bit & 1")
+
+
+def _migrate_v3(conn):
+    # Версия 4 добавила версию модели оценки; прежние записи получены
+    # встроенной моделью (NULL)
+    conn.execute("ALTER TABLE history ADD COLUMN model INTEGER")
+    conn.execute("CREATE TABLE models (id INTEGER PRIMARY KEY, version TEXT NOT NULL UNIQUE)")
+
+
+def _migrate_v4(conn):
+    # Версия 5 добавила хеш содержимого
+    conn.create_function("content_hash", 9, content_hash, deterministic=True)
+    conn.execute("ALTER TABLE history ADD COLUMN hash INTEGER")
+    conn.execute("UPDATE history SET hash = content_hash(name, ts, age, female, weight, "
+                 "height, factors, score, (SELECT version FROM models WHERE id = model))")
+
+
+def _migrate_v5(conn):
+    # В версии 5 индекс хешей был уникальным и отбрасывал одинаковые оценки,
+    # сохранённые окном за одну минуту; дубли отсекает только импорт
+    conn.execute("DROP INDEX IF EXISTS history_hash")
+
+
+class HistoryStore:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            # Создание и миграция схемы - одной транзакцией
+            with self.transaction():
+                # Базу могло уже обновить другое соединение, пока ждали блокировку
+                version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+                if version == 1:
+                    _migrate_v1(self.conn)
+                elif version >= 2:
+                    # Сначала новые столбцы: _migrate_v2 создаёт схему, а её
+                    # индексы ссылаются на них
+                    if version <= 3:
+                        _migrate_v3(self.conn)
+                    if version <= 4:
+                        _migrate_v4(self.conn)
+                    if version <= 5:
+                        _migrate_v5(self.conn)
+                    if version == 2:
+                        _migrate_v2(self.conn)
+                _create_schema(self.conn)
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        bulk = self._bulk_state()
+        if bulk is not None and time.time() - bulk[1] > BULK_STALE:
+            # Массовая загрузка прервалась - индексы и триггер восстанавливаются
+            self.bulk_end()
+
+        self._reset_models()
+
+    def _reset_models(self):
+        # Версия модели <-> номер строки models; встроенная модель - NULL
+        self.model_ids = {risk_engine.BUILTIN_MODEL: None}
+        self.model_versions = {None: risk_engine.BUILTIN_MODEL}
+
+    @property
+    def conn(self):
+        """Соединение текущего потока"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """Закрывает соединения всех потоков"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    @contextmanager
+    def transaction(self):
+        """Транзакция записи в соединении текущего потока.
+
+        Блокировка записи берётся сразу (BEGIN IMMEDIATE): другие писатели
+        ждут её до BUSY_TIMEOUT, затем попытка повторяется. Пока она
+        держится, копии программы по очереди дописывают и архив со
+        статистикой. Вложенный вызов продолжает внешнюю транзакцию.
+        """
+        conn = self.conn
+        if conn.in_transaction:
+            yield conn
+            return
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == WRITE_ATTEMPTS - 1:
+                    raise
+                time.sleep(0.1 * (attempt + 1))
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            # Номера версий моделей, добавленных в транзакции, недействительны
+            self._reset_models()
+            raise
+        conn.commit()
+
+    def model_id(self, version):
+        """Номер версии модели в таблице models (вызывается в транзакции)"""
+        try:
+            return self.model_ids[version]
+        except KeyError:
+            pass
+        self.conn.execute("INSERT OR IGNORE INTO models (version) VALUES (?)", (version,))
+        model_id = self.conn.execute("SELECT id FROM models WHERE version = ?",
+                                     (version,)).fetchone()[0]
+        self.model_ids[version] = model_id
+        self.model_versions[model_id] = version
+        return model_id
+
+    def _row(self, record):
+        return _row(record, self.model_id(record.model))
+
+    def _record(self, row):
+        name, ts, age, female, weight, height, factors, score, tier, model_id = row
+        version = self.model_versions.get(model_id)
+        if version is None:
+            # Версию могло добавить другое соединение
+            self.model_versions.update(self.conn.execute("SELECT id, version FROM models"))
+            version = self.model_versions.get(model_id, str(model_id))
+        return HistoryRecord(name, ts, age, bool(female), weight, height, factors, score, tier,
+                             version)
+
+    def _new_row(self, record):
+        # Для _INSERT_NEW: хеш ещё раз - для проверки дубля
+        row = self._row(record)
+        return row + (row[-1],)
+
+    def _insert(self, deduplicate):
+        return (_INSERT_NEW, self._new_row) if deduplicate else (_INSERT, self._row)
+
+    def append(self, record, deduplicate=False):
+        """Добавляет запись. С deduplicate (импорт) запись, содержимое
+        которой уже есть в истории, пропускается; False - если пропущена"""
+        sql, row = self._insert(deduplicate)
+        with self.transaction() as conn:
+            return conn.execute(sql, row(record)).rowcount > 0
+
+    def append_many(self, records, deduplicate=False):
+        """Добавляет записи одной транзакцией. Возвращает число добавленных
+        (с deduplicate - без дублей)"""
+        sql, row = self._insert(deduplicate)
+        with self.transaction() as conn:
+            return conn.executemany(sql, map(row, records)).rowcount
+
+    def sink_rows(self, path):
+        """Число записей в архиве или файле статистики path, которое
+        соответствует зафиксированной истории; None, если неизвестно"""
+        row = self.conn.execute("SELECT rows FROM sinks WHERE path = ?", (path,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_sink_rows(self, path, rows):
+        """В транзакции записи: rows - число записей в path вместе с
+        добавленными в ней; None - число неизвестно (файла нет)"""
+        if rows is None:
+            self.conn.execute("DELETE FROM sinks WHERE path = ?", (path,))
+        else:
+            self.conn.execute("INSERT OR REPLACE INTO sinks (path, rows) VALUES (?, ?)",
+                              (path, rows))
+
+    def bulk_begin(self):
+        """Режим массовой загрузки: индексы поиска и триггер history_factors
+        снимаются до bulk_end. Поиск в это время идёт без индексов, а по
+        факторам не видит загруженных записей. Загрузка, которая дольше
+        BULK_STALE не вызывала bulk_touch, завершается при открытии базы."""
+        with self.transaction() as conn:
+            if self._bulk_state() is None:
+                # Строки history_factors для записей начиная с first_id
+                # заполняются в bulk_end
+                conn.execute("CREATE TABLE history_bulk (first_id INTEGER NOT NULL, "
+                             "touched REAL NOT NULL)")
+                conn.execute("INSERT INTO history_bulk "
+                             "SELECT coalesce(max(id), 0) + 1, ? FROM history", (time.time(),))
+            for index in _BULK_INDEXES:
+                conn.execute(f"DROP INDEX IF EXISTS {index}")
+            conn.execute(f"DROP TRIGGER IF EXISTS {_BULK_TRIGGER}")
+
+    def bulk_touch(self):
+        """Отметка, что массовая загрузка продолжается"""
+        with self.transaction() as conn:
+            conn.execute("UPDATE history_bulk SET touched = ?", (time.time(),))
+
+    def bulk_end(self):
+        """Строит индексы и таблицу факторов для загруженных записей"""
+        with self.transaction() as conn:
+            if self._bulk_state() is None:
+                return  # загрузку уже завершило другое соединение
+            conn.execute("INSERT INTO history_factors (factor, tier, ts, id) "
+                         "SELECT bit, tier, ts, id FROM history JOIN factor_bits "
+                         "ON factors >> bit & 1 "
+                         "WHERE id >= (SELECT first_id FROM history_bulk)")
+            _create_schema(conn)
+            conn.execute("DROP TABLE history_bulk")
+
+    def _bulk_state(self):
+        # (first_id, touched) незавершённой массовой загрузки или None
+        try:
+            return self.conn.execute("SELECT first_id, touched FROM history_bulk").fetchone()
+        except sqlite3.OperationalError:
+            return None
+
+    def is_empty(self):
+        return self.conn.execute("SELECT 1 FROM history LIMIT 1").fetchone() is None
+
+    def count(self):
+        return self.conn.execute("SELECT count(*) FROM history").fetchone()[0]
+
+    def page(self, sort="date", descending=True, after=None, limit=PAGE_SIZE):
+        """Страница записей по индексу, без OFFSET.
+
+        Возвращает список (ключ, запись); ключ последней записи передаётся
+        в after для чтения следующей страницы.
+        """
+        key = SORT_KEYS[sort]
+        order, cmp = ("DESC", "<") if descending else ("ASC", ">")
+        sql = f"SELECT {key}, id, {_SELECT[len('SELECT '):]}"
+        params = []
+        if after is not None:
+            # Эквивалент ({key}, id) < (?, ?), но в такой записи SQLite
+            # использует индекс как диапазон, а не просматривает его с начала
+            sql += f" WHERE {key} {cmp}= ? AND ({key} {cmp} ? OR id {cmp} ?)"
+            params.extend((after[0], after[0], after[1]))
+        sql += f" ORDER BY {key} {order}, id {order} LIMIT ?"
+        params.append(limit)
+        return [((row[0], row[1]), self._record(row[2:]))
+                for row in self.conn.execute(sql, params)]
+
+    def search(self, name=None, date_from=None, date_to=None, tier=None, factor=None,
+               after=None, limit=PAGE_SIZE):
+        """Записи по условиям, от новых к старым, страницами как page().
+
+        name - начало ФИО (без учёта регистра), date_from/date_to - время
+        в секундах (date_to не включается), tier - номер risk_engine.TIERS,
+        factor - ключ фактора из risk_engine.FACTORS.
+        """
+        prefix = name_key(name) if name else ""
+        bit = None if factor is None else risk_engine.FACTOR_BITS[factor]
+        # Во время массовой загрузки индексов поиска нет
+        bulk = self._bulk_state() is not None
+
+        def indexed(index):
+            return "" if bulk else f" INDEXED BY {index}"
+
+        def dates(alias):
+            where, params = [], []
+            if date_from is not None:
+                where.append(f"{alias}.ts >= ?")
+                params.append(date_from)
+            if date_to is not None:
+                where.append(f"{alias}.ts < ?")
+                params.append(date_to)
+            return where, params
+
+        # (источник, псевдоним, условия по его индексу, параметры,
+        #  какие из условий запроса он покрывает)
+        plans = []
+        # Если все индексы дают много записей, они просматриваются в порядке
+        # времени по самому узкому из индексов, упорядоченных по времени
+        walk = ("history AS h" + indexed("history_ts"), "h") + dates("h") + (set(),)
+        if bit is not None:
+            where, params = dates("f")
+            covered = {"factor"}
+            if tier is not None:
+                where.insert(0, "f.tier = ?")
+                params.insert(0, tier)
+                covered.add("tier")
+            plans.append(("history_factors AS f", "f", ["f.factor = ?"] + where, [bit] + params,
+                          covered))
+        if prefix:
+            where, params = dates("h")
+            plans.append(("history AS h" + indexed("history_name_key"), "h",
+                          ["h.name_key >= ? AND h.name_key < ?"] + where,
+                          [prefix, _prefix_end(prefix)] + params, {"name"}))
+        if tier is not None:
+            where, params = dates("h")
+            plans.append(("history AS h" + indexed("history_tier_ts"), "h",
+                          ["h.tier = ?"] + where, [tier] + params, {"tier"}))
+            # При заданном уровне оба индекса упорядочены по времени;
+            # фактор вместе с уровнем отбирает меньше записей
+            walk = plans[0] if bit is not None else plans[-1]
+
+        best, best_count = walk, SEARCH_SCAN_LIMIT
+        for plan in plans:
+            source, _, where, params, _ = plan
+            count = self.conn.execute(
+                f"SELECT count(*) FROM (SELECT 1 FROM {source} WHERE {' AND '.join(where)} "
+                f"LIMIT {SEARCH_SCAN_LIMIT})", params).fetchone()[0]
+            if count < best_count:
+                best, best_count = plan, count
+        source, key, where, params, covered = best
+        where, params = list(where), list(params)
+
+        # Остальные условия проверяются по строке истории
+        if key == "f":
+            source += " JOIN history AS h ON h.id = f.id"
+        if bit is not None and "factor" not in covered:
+            where.append("h.factors >> ? & 1")
+            params.append(bit)
+        if prefix and "name" not in covered:
+            where.append("h.name_key >= ? AND h.name_key < ?")
+            params.extend((prefix, _prefix_end(prefix)))
+        if tier is not None and "tier" not in covered:
+            where.append("h.tier = ?")
+            params.append(tier)
+        if after is not None:
+            where.append(f"{key}.ts <= ? AND ({key}.ts < ? OR {key}.id < ?)")
+            params.extend((after[0], after[0], after[1]))
+
+        columns = ", ".join(f"h.{column}" for column in _RECORD_COLUMNS)
+        sql = f"SELECT {key}.ts, {key}.id, {columns} FROM {source}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {key}.ts DESC, {key}.id DESC LIMIT ?"
+        params.append(limit)
+        return [((row[0], row[1]), self._record(row[2:]))
+                for row in self.conn.execute(sql, params)]
+
+    def iter_records(self, newest_first=True):
+        order = "DESC" if newest_first else "ASC"
+        for row in self.conn.execute(f"{_SELECT} ORDER BY id {order}"):
+            yield self._record(row)
@@ -0,0 +1,194 @@
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTableView, QHeaderView,
+                             QAbstractItemView, QLineEdit, QComboBox, QCheckBox, QDateEdit)
+from PyQt5.QtGui import QColor
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QDate, QDateTime, QTimer
+
+import risk_engine
+from history_store import PAGE_SIZE
+
+# Пауза после ввода ФИО перед поиском, мс
+SEARCH_DELAY = 200
+
+
+class HistoryModel(QAbstractTableModel):
+    """Таблица истории, которая подгружает записи из HistoryStore страницами
+    по мере прокрутки (canFetchMore/fetchMore)"""
+
+    COLUMNS = ("Дата", "ФИО", "Возраст", "Пол", "Вес/рост", "Факторы", "Результат", "Модель")
+    # Столбец -> ключ сортировки HistoryStore.page
+    SORTABLE = {0: "date", 6: "score"}
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.sort_key = "date"
+        self.descending = True
+        # Условия HistoryStore.search; пока они заданы, записи идут от новых
+        # к старым независимо от выбранной сортировки
+        self.filters = {}
+        self.rows = []
+        self.last_key = None
+        self.exhausted = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            return self.display(record, column)
+        if role == Qt.ForegroundRole and column == 6:
+            return QColor(record.color)
+        return None
+
+    @staticmethod
+    def display(record, column):
+        # Подписи и тексты восстанавливаются из компактной записи только здесь,
+        # для видимых строк
+        if column == 0:
+            return record.date
+        if column == 1:
+            return record.name
+        if column == 2:
+            return str(record.age)
+        if column == 3:
+            return record.sex
+        if column == 4:
+            return f"{record.weight:g}кг/{record.height:g}см"
+        if column == 5:
+            return ", ".join(record.factor_names())
+        if column == 6:
+            return record.result_text
+        return record.model
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        if self.filters:
+            page = self.store.search(after=self.last_key, **self.filters)
+        else:
+            page = self.store.page(self.sort_key, self.descending, self.last_key)
+        if len(page) < PAGE_SIZE:
+            self.exhausted = True
+        if not page:
+            return
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+        self.rows.extend(record for _, record in page)
+        self.last_key = page[-1][0]
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column not in self.SORTABLE:
+            return
+        self.sort_key = self.SORTABLE[column]
+        self.descending = order == Qt.DescendingOrder
+        self.reload()
+
+    def set_filters(self, **filters):
+        self.filters = {key: value for key, value in filters.items() if value is not None}
+        self.reload()
+
+    def reload(self):
+        self.beginResetModel()
+        self.rows = []
+        self.last_key = None
+        self.exhausted = False
+        self.endResetModel()
+        self.fetchMore()
+
+
+class HistoryDialog(QDialog):
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("История оценок")
+        self.resize(900, 500)
+
+        self.model = HistoryModel(store, self)
+
+        # Панель поиска
+        self.name_input = QLineEdit()
+        self.name_input.setPlaceholderText("ФИО (начало)")
+        self.name_timer = QTimer(self)
+        self.name_timer.setSingleShot(True)
+        self.name_timer.setInterval(SEARCH_DELAY)
+        self.name_timer.timeout.connect(self.apply_filters)
+        self.name_input.textChanged.connect(self.name_timer.start)
+
+        self.period_check = QCheckBox("Период")
+        today = QDate.currentDate()
+        self.date_from = QDateEdit(today.addMonths(-1))
+        self.date_to = QDateEdit(today)
+        for edit in (self.date_from, self.date_to):
+            edit.setCalendarPopup(True)
+            edit.setDisplayFormat("dd.MM.yyyy")
+            edit.setEnabled(False)
+            edit.dateChanged.connect(self.apply_filters)
+        self.period_check.toggled.connect(self.date_from.setEnabled)
+        self.period_check.toggled.connect(self.date_to.setEnabled)
+        self.period_check.toggled.connect(self.apply_filters)
+
+        self.tier_combo = QComboBox()
+        self.tier_combo.addItem("Любой риск", None)
+        for i, (_, label, _) in enumerate(risk_engine.TIERS):
+            self.tier_combo.addItem(label, i)
+        self.tier_combo.currentIndexChanged.connect(self.apply_filters)
+
+        self.factor_combo = QComboBox()
+        self.factor_combo.addItem("Любой фактор", None)
+        for factor, name in zip(risk_engine.FACTORS, risk_engine.FACTOR_NAMES):
+            self.factor_combo.addItem(name, factor.key)
+        self.factor_combo.currentIndexChanged.connect(self.apply_filters)
+
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(self.name_input, 1)
+        search_layout.addWidget(self.period_check)
+        search_layout.addWidget(self.date_from)
+        search_layout.addWidget(self.date_to)
+        search_layout.addWidget(self.tier_combo)
+        search_layout.addWidget(self.factor_combo)
+
+        self.view = QTableView()
+        self.view.setModel(self.model)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.setWordWrap(False)
+        # Постоянная высота строк: представлению не нужно измерять содержимое
+        self.view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.view.verticalHeader().hide()
+        self.view.horizontalHeader().setSectionResizeMode(5, QHeaderView.Stretch)
+        self.view.setSortingEnabled(True)
+        self.view.sortByColumn(0, Qt.DescendingOrder)
+
+        layout = QVBoxLayout()
+        layout.addLayout(search_layout)
+        layout.addWidget(self.view)
+        self.setLayout(layout)
+
+    def apply_filters(self):
+        self.name_timer.stop()
+        date_from = date_to = None
+        if self.period_check.isChecked():
+            date_from = QDateTime(self.date_from.date()).toSecsSinceEpoch()
+            # Конечная дата включается целиком
+            date_to = QDateTime(self.date_to.date().addDays(1)).toSecsSinceEpoch()
+        self.model.set_filters(
+            name=self.name_input.text().strip() or None,
+            date_from=date_from,
+            date_to=date_to,
+            tier=self.tier_combo.currentData(),
+            factor=self.factor_combo.currentData(),
+        )
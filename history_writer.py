@@ -0,0 +1,208 @@
+"""Фоновая запись истории: база SQLite, архив и файл статистики.
+
+Окно калькулятора только кладёт запись в ограниченную очередь и никогда не
+ждёт диска. Поток записи копит записи и раз в flush_interval секунд
+сохраняет их одной транзакцией с синхронизацией на диск (synchronous=FULL,
+fsync архива и статистики). При сбое теряется не больше одного интервала.
+
+Архив и счётчики статистики дописываются, пока держится блокировка записи
+базы, поэтому несколько копий программы с общей историей пишут их по
+очереди и учитывают оценки друг друга.
+"""
+import atexit
+import os
+import queue
+import sys
+import threading
+import time
+
+FLUSH_INTERVAL = 1.0
+QUEUE_SIZE = 1024
+# Сколько окно ждёт записи очереди перед чтением истории: дольше оно
+# показывает уже сохранённое, а не зависает
+FLUSH_TIMEOUT = 5.0
+# Ошибки, вызванные самой записью (например, возраст вне диапазона INTEGER):
+# такая запись пропускается, а не повторяется. Нарушение ограничения базы
+# (NaN сохраняется как NULL) добавляется в _append_each - sqlite3 в окно не
+# импортируется
+RECORD_ERRORS = (OverflowError, ValueError, TypeError)
+
+
+def _append_each(store, records, deduplicate):
+    # В транзакции store.transaction(). Одна негодная запись не должна
+    # задерживать остальные; дубли при импорте не считаются
+    import sqlite3
+    added = []
+    for record in records:
+        try:
+            if store.append(record, deduplicate):
+                added.append(record)
+        except RECORD_ERRORS + (sqlite3.IntegrityError,) as e:
+            print(f"Запись истории пропущена ({record.name}): {e}", file=sys.stderr)
+    return added
+
+
+def write_records(store, archive, stats_path, records, deduplicate=False):
+    """Записи в базу, архив и статистику под одной транзакцией базы. При
+    ошибке транзакция откатывается, и запись можно повторить. deduplicate -
+    для импорта: записи, которые уже есть в истории, пропускаются.
+    Возвращает добавленные записи.
+
+    Архив и счётчики дописываются до фиксации транзакции, а число записей в
+    них сохраняется в ней же (HistoryStore.sink_rows). Если фиксация не
+    удалась, следующая запись обрезает архив до этого числа, а файл
+    статистики удаляет - окно пересчитает его по истории. Так повтор не
+    учитывает записи дважды.
+    """
+    import stats as stats_module
+    with store.transaction():
+        added = _append_each(store, records, deduplicate)
+        if added:
+            key = os.path.abspath(archive.path)
+            rows = store.sink_rows(key)
+            if rows is not None and archive.count() > rows:
+                archive.truncate(rows)
+            archive.append_many(added)
+            archive.sync()
+            store.set_sink_rows(key, archive.count())
+            key = os.path.abspath(stats_path)
+            store.set_sink_rows(key, stats_module.update_snapshot(
+                added, stats_path, fsync=True, expected=store.sink_rows(key)))
+    return added
+
+
+def open_archive(store, path):
+    # Обрезка оборванной дозаписи - под блокировкой, пока другие копии не пишут
+    import archive as archive_module
+    with store.transaction():
+        return archive_module.ColumnArchive(path)
+
+
+class _FlushRequest:
+    # Запрос flush: done - запись завершена, ok - накопленное сохранено
+    __slots__ = ("done", "ok")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+
+
+class HistoryWriter(threading.Thread):
+    def __init__(self, history_path=None, archive_path=None, stats_path=None,
+                 flush_interval=FLUSH_INTERVAL, queue_size=QUEUE_SIZE):
+        """Пути по умолчанию - DEFAULT_PATH модулей history_store, archive
+        и stats"""
+        super().__init__(name="history-writer", daemon=True)
+        self.history_path = history_path
+        self.archive_path = archive_path
+        self.stats_path = stats_path
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(queue_size)
+        self.closed = False
+        # Текст ошибки, если поток не смог открыть базу или архив
+        self.error = None
+        # Текст ошибки последней записи, пока её не удалось повторить
+        self.write_error = None
+        # Поток фоновый; если окно не закрылось штатно, очередь дописывается
+        # при выходе из интерпретатора
+        atexit.register(self.close)
+
+    # --- Вызовы из окна ----------------------------------------------------
+
+    def submit(self, record):
+        """Ставит запись в очередь, не блокируясь. False, если очередь
+        заполнена или поток записи не работает (см. error)."""
+        if self.error is not None:
+            return False
+        try:
+            self.queue.put_nowait(("record", record))
+        except queue.Full:
+            return False
+        return True
+
+    def flush(self, wait=False, timeout=FLUSH_TIMEOUT):
+        """Сохранить накопленное, не дожидаясь интервала. С wait - дождаться
+        записи, но не дольше timeout секунд. False, если запись не
+        завершилась (или не запрошена) или не удалась (см. write_error) -
+        например, поток записи не работает"""
+        if not self.is_alive():
+            return False
+        request = _FlushRequest()
+        deadline = time.monotonic() + timeout
+        try:
+            if wait:
+                self.queue.put(("flush", request), timeout=timeout)
+            else:
+                self.queue.put_nowait(("flush", request))
+        except queue.Full:
+            return False  # очередь разбирается, запись и так идёт
+        if not wait:
+            return True
+        return request.done.wait(max(deadline - time.monotonic(), 0)) and request.ok
+
+    def close(self):
+        """Сохраняет всё из очереди и останавливает поток (при выходе)"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.is_alive():
+            self.queue.put(("stop", None))
+            self.join()
+
+    # --- Поток записи ------------------------------------------------------
+
+    def run(self):
+        # Модули хранилищ (sqlite3, numpy) импортируются здесь, а не в окне
+        import archive as archive_module
+        import history_store
+        import stats as stats_module
+
+        store = None
+        try:
+            store = history_store.HistoryStore(self.history_path or history_store.DEFAULT_PATH)
+            # Фиксация транзакции - только после записи на диск
+            store.conn.execute("PRAGMA synchronous=FULL")
+            archive = open_archive(store, self.archive_path or archive_module.DEFAULT_PATH)
+        except Exception as e:
+            # Окно узнаёт об ошибке по error: submit и flush больше не ждут поток
+            self.error = str(e) or type(e).__name__
+            print(f"Запись истории не запущена: {self.error}", file=sys.stderr)
+            if store is not None:
+                store.close()
+            return
+        stats_path = self.stats_path or stats_module.DEFAULT_PATH
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                kind, payload = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                kind, payload = "flush", None
+
+            if kind == "record":
+                pending.append(payload)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                continue
+
+            try:
+                if pending:
+                    write_records(store, archive, stats_path, pending)
+                    pending = []
+                deadline = None
+                self.write_error = None
+            except Exception as e:
+                self.write_error = str(e) or type(e).__name__
+                print(f"Ошибка записи истории: {self.write_error}", file=sys.stderr)
+                # Повтор через интервал
+                deadline = time.monotonic() + self.flush_interval
+
+            if payload is not None:
+                payload.ok = not pending
+                payload.done.set()
+            if kind == "stop":
+                break
+
+        store.close()
+        archive.close()
@@ -1,17 +1,64 @@
+import math
+import os
 import sys
+import time
+from functools import partial
+STARTED = time.perf_counter()
+
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                              QPushButton, QLineEdit, QCheckBox, QStackedWidget,
                              QProgressBar, QMessageBox, QDialog, QScrollArea,
-                             QGroupBox, QComboBox)
+                             QGroupBox, QComboBox, QFileDialog)
 from PyQt5.QtGui import QFont, QIcon
-from PyQt5.QtCore import Qt, QDateTime
+from PyQt5.QtCore import Qt, QDateTime, QTimer, QFileSystemWatcher
+
+import metrics
+import risk_engine
+from model import ModelFile, DEFAULT_PATH as MODEL_PATH
+# Модули истории (sqlite3, модель таблицы) импортируются при первом обращении
+# к истории, чтобы не задерживать появление окна ввода ФИО
+
+PAGE_COUNT = 4
+# Замер времени запуска: python kURS.py --startup-time
+MEASURE_STARTUP = False
+
+
+# Группы факторов на страницах 2 и 3
+FACTOR_PAGES = (
+    ("chronic", "immune", "vaccine"),
+    ("habits", "activity", "psycho", "contacts", "pregnancy"),
+)
+FACTOR_GROUP_TITLES = dict(risk_engine.FACTOR_GROUPS)
+FACTOR_GROUP_BITS = {
+    group: [i for i, factor in enumerate(risk_engine.FACTORS) if factor.group == group]
+    for group in FACTOR_GROUP_TITLES
+}
+
+# Сколько лучших вариантов «что если» показывать на странице результата
+WHAT_IF_TOP = 3
+# Фильтр диалога сохранения -> формат export
+EXPORT_FILTERS = {
+    "CSV (*.csv)": "csv",
+    "JSON Lines (*.jsonl)": "jsonl",
+    "Excel (*.xlsx)": "xlsx",
+}
+
+
+_icon = None
+
+
+def app_icon():
+    global _icon
+    if _icon is None:
+        _icon = QIcon('icon.png')
+    return _icon
 
 
 class NameDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Ввод данных")
-        self.setWindowIcon(QIcon('icon.png'))
+        self.setWindowIcon(app_icon())
         self.setModal(True)
 
         layout = QVBoxLayout()
@@ -33,6 +80,13 @@ class NameDialog(QDialog):
 
         self.setLayout(layout)
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        if MEASURE_STARTUP:
+            elapsed = (time.perf_counter() - STARTED) * 1000
+            print(f"Время до окна ввода ФИО: {elapsed:.1f} мс")
+            QTimer.singleShot(0, self.reject)
+
     def check_name(self):
         name = self.name_input.text().strip()
         if len(name.split()) < 2:
@@ -42,16 +96,43 @@ class NameDialog(QDialog):
 
 
 class CovidRiskApp(QWidget):
-    def __init__(self):
+    def __init__(self, user_name=None, history_path=None, model_path=None):
+        """user_name - ФИО первого пациента без диалога ввода (для
+        скриптов и замеров); history_path - файл истории вместо history.db,
+        архив и сводная статистика пишутся рядом с ним; model_path - файл
+        модели оценки вместо model.json"""
         super().__init__()
-        self.history = []
+        self.history_path = history_path
+        self._history = None
+        self._writer = None
+        self.export_worker = None
+        self.stats_path = self.data_path("_stats.json", None)
+        # Чекбоксы факторов по номеру бита в risk_engine.FACTORS
+        self.factor_checks = [None] * len(risk_engine.FACTORS)
+        self.risk_score = None
+        # Модель оценки подменяется без перезапуска при изменении файла
+        self.model_file = ModelFile(model_path or MODEL_PATH)
+        self.model = self.model_file.model
+        # Модель, по которой получен показанный результат
+        self.risk_model = None
+        self.model_watcher = QFileSystemWatcher(self)
+        self.watch_model()
+        self.model_watcher.fileChanged.connect(self.reload_model)
+        # Замена файла через os.replace видна только как изменение каталога
+        self.model_watcher.directoryChanged.connect(self.reload_model)
+        # Текущая сумма баллов, пока анкета заполняется
+        self.live = self.model.live_score()
         self.current_page = 0
-        self.user_name = ""
+        self.user_name = user_name or ""
         self.initUI()
+        # Диалог модальный - вне замера initUI: ввод ФИО не время построения окна
+        if not self.user_name:
+            self.show_name_dialog()
 
+    @metrics.timed()
     def initUI(self):
         self.setWindowTitle('COVID-19 Risk Calculator')
-        self.setWindowIcon(QIcon('icon.png'))
+        self.setWindowIcon(app_icon())
         self.setStyleSheet("""
             QWidget {
                 font-family: 'Segoe UI';
@@ -107,32 +188,138 @@ class CovidRiskApp(QWidget):
         self.progress.setMaximum(3)
         self.layout.addWidget(self.progress)
 
+        # Текущий уровень риска под прогресс-баром
+        self.live_label = QLabel()
+        self.live_label.setAlignment(Qt.AlignCenter)
+        self.layout.addWidget(self.live_label)
+        self.update_live_label()
+
         # Стек страниц
         self.stacked_widget = QStackedWidget()
         self.layout.addWidget(self.stacked_widget)
 
-        # Страницы
-        self.create_page1()  # Основные данные
-        self.create_page2()  # Факторы здоровья
-        self.create_page3()  # Образ жизни и контакты
-        self.create_page4()  # Результат
+        # Страницы. Сразу строится только первая, остальные - при первом
+        # переходе на них (ensure_page)
+        self.page_builders = (
+            self.create_page1,  # Основные данные
+            self.create_page2,  # Факторы здоровья
+            self.create_page3,  # Образ жизни и контакты
+            self.create_page4,  # Результат
+        )
+        self.ensure_page(0)
 
         # Кнопки навигации
         self.nav_layout = QHBoxLayout()
+        # clicked передаёт флаг checked; обёртка замера (metrics.timed)
+        # передала бы его дальше, поэтому методы вызываются без аргументов
         self.btn_back = QPushButton("Назад")
-        self.btn_back.clicked.connect(self.prev_page)
+        self.btn_back.clicked.connect(lambda: self.prev_page())
         self.btn_next = QPushButton("Далее")
-        self.btn_next.clicked.connect(self.next_page)
+        self.btn_next.clicked.connect(lambda: self.next_page())
         self.btn_history = QPushButton("История")
-        self.btn_history.clicked.connect(self.show_history)
+        self.btn_history.clicked.connect(lambda: self.show_history())
+        self.btn_stats = QPushButton("Статистика")
+        self.btn_stats.clicked.connect(self.show_stats)
+        self.btn_export = QPushButton("Экспорт")
+        self.btn_export.clicked.connect(self.export_history)
 
         self.nav_layout.addWidget(self.btn_back)
         self.nav_layout.addWidget(self.btn_next)
         self.nav_layout.addWidget(self.btn_history)
+        self.nav_layout.addWidget(self.btn_stats)
+        self.nav_layout.addWidget(self.btn_export)
         self.layout.addLayout(self.nav_layout)
 
+        # Строка хода выгрузки строится при первом экспорте
+        self.export_row = None
+
         self.update_nav_buttons()
-        self.show_name_dialog()
+
+    @property
+    def history(self):
+        if self._history is None:
+            from history_store import HistoryStore, DEFAULT_PATH
+            self._history = HistoryStore(self.history_path or DEFAULT_PATH)
+        return self._history
+
+    def data_path(self, suffix, default):
+        """Путь файла рядом с историей: history.db -> history<suffix>"""
+        if self.history_path:
+            return self.history_path.rsplit(".", 1)[0] + suffix
+        return default
+
+    @property
+    def writer(self):
+        # Запись истории, архива и статистики идёт в отдельном потоке
+        if self._writer is None:
+            from history_writer import HistoryWriter
+            self._writer = HistoryWriter(self.history_path, self.data_path("_archive", None),
+                                         self.stats_path)
+            self._writer.start()
+        return self._writer
+
+    def load_stats(self):
+        # Счётчики ведёт поток записи (и копии программы с общей историей),
+        # поэтому файл читается при каждом показе
+        from stats import PopulationStats, DEFAULT_PATH
+        path = self.stats_path or DEFAULT_PATH
+        stats = PopulationStats.load(path)
+        if stats is None:
+            # Файла ещё нет (или он испорчен) - один раз пересчитываем по
+            # истории. Под блокировкой записи: иначе оценка, сохранённая во
+            # время пересчёта, не попала бы в счётчики
+            with self.history.transaction():
+                stats = PopulationStats.load(path)
+                if stats is None:
+                    stats = PopulationStats.from_records(
+                        self.history.iter_records(newest_first=False))
+                    stats.save(path)
+        return stats
+
+    def watch_model(self):
+        path = os.path.abspath(self.model_file.path)
+        paths = [os.path.dirname(path)]
+        if os.path.exists(path):
+            paths.append(path)
+        watched = set(self.model_watcher.files() + self.model_watcher.directories())
+        paths = [p for p in paths if p not in watched]
+        if paths:
+            self.model_watcher.addPaths(paths)
+
+    def reload_model(self):
+        # Заменённый файл выпадает из наблюдения - добавляем его снова
+        self.watch_model()
+        if not self.model_file.reload():
+            return
+        if self.model_file.error:
+            print(f"Модель оценки не загружена ({self.model_file.path}): "
+                  f"{self.model_file.error}", file=sys.stderr)
+        elif self.model_file.model is not self.model:
+            self.model = self.model_file.model
+            self.refresh_live()
+
+    def refresh_live(self):
+        """Пересчёт текущего риска анкеты по новой модели"""
+        self.live = self.model.live_score()
+        try:
+            self.live.set_age(int(self.age_input.text()))
+        except ValueError:
+            pass
+        try:
+            self.live.set_bmi(risk_engine.parse_bmi(self.weight_input.text(),
+                                                    self.height_input.text()))
+        except (ValueError, ArithmeticError):
+            pass
+        self.live.set_female(self.gender_combo.currentText() == "Женский")
+        for bit, checkbox in enumerate(self.factor_checks):
+            if checkbox is not None and checkbox.isChecked():
+                self.live.set_factor(bit, True)
+        self.update_live_label()
+
+    def ensure_page(self, index):
+        # Страницы добавляются в стек по порядку, номер в стеке = номер страницы
+        while self.stacked_widget.count() <= index:
+            self.page_builders[self.stacked_widget.count()]()
 
     def show_name_dialog(self):
         dialog = NameDialog(self)
@@ -142,6 +329,7 @@ class CovidRiskApp(QWidget):
         else:
             return False
 
+    @metrics.timed()
     def create_page1(self):
         page = QWidget()
         layout = QVBoxLayout()
@@ -179,6 +367,11 @@ class CovidRiskApp(QWidget):
         self.height_input = QLineEdit()
         self.height_input.setPlaceholderText("Например: 175")
 
+        self.age_input.textChanged.connect(self.on_age_changed)
+        self.gender_combo.currentTextChanged.connect(self.on_gender_changed)
+        self.weight_input.textChanged.connect(self.on_body_changed)
+        self.height_input.textChanged.connect(self.on_body_changed)
+
         anthro_layout.addWidget(weight_label)
         anthro_layout.addWidget(self.weight_input)
         anthro_layout.addWidget(height_label)
@@ -193,157 +386,46 @@ class CovidRiskApp(QWidget):
         page.setLayout(layout)
         self.stacked_widget.addWidget(page)
 
+    @metrics.timed()
     def create_page2(self):
-        page = QWidget()
-        layout = QVBoxLayout()
-
-        title = QLabel("Шаг 2/4: Факторы здоровья")
-        title.setFont(QFont('Arial', 16, QFont.Bold))
-
-        scroll = QScrollArea()
-        scroll.setWidgetResizable(True)
-        content = QWidget()
-        content_layout = QVBoxLayout()
-
-        # Хронические заболевания
-        chronic_group = QGroupBox("Хронические заболевания")
-        chronic_layout = QVBoxLayout()
-
-        self.diabetes_check = QCheckBox("Сахарный диабет")
-        self.hypertension_check = QCheckBox("Артериальная гипертензия")
-        self.cvd_check = QCheckBox("Сердечно-сосудистые заболевания")
-        self.lung_disease_check = QCheckBox("Хронические болезни лёгких")
-        self.kidney_check = QCheckBox("Хроническая болезнь почек")
-        self.liver_check = QCheckBox("Хронические заболевания печени")
-        self.cancer_check = QCheckBox("Онкологические заболевания")
-        self.autoimmune_check = QCheckBox("Аутоиммунные заболевания")
-
-        chronic_layout.addWidget(self.diabetes_check)
-        chronic_layout.addWidget(self.hypertension_check)
-        chronic_layout.addWidget(self.cvd_check)
-        chronic_layout.addWidget(self.lung_disease_check)
-        chronic_layout.addWidget(self.kidney_check)
-        chronic_layout.addWidget(self.liver_check)
-        chronic_layout.addWidget(self.cancer_check)
-        chronic_layout.addWidget(self.autoimmune_check)
-        chronic_group.setLayout(chronic_layout)
-
-        # Иммунный статус
-        immune_group = QGroupBox("Иммунный статус")
-        immune_layout = QVBoxLayout()
-
-        self.immune_check = QCheckBox("Первичный иммунодефицит")
-        self.hiv_check = QCheckBox("ВИЧ/СПИД")
-        self.transplant_check = QCheckBox("Трансплантация органов")
-        self.steroids_check = QCheckBox("Длительный приём кортикостероидов")
-        self.chemotherapy_check = QCheckBox("Химиотерапия")
-
-        immune_layout.addWidget(self.immune_check)
-        immune_layout.addWidget(self.hiv_check)
-        immune_layout.addWidget(self.transplant_check)
-        immune_layout.addWidget(self.steroids_check)
-        immune_layout.addWidget(self.chemotherapy_check)
-        immune_group.setLayout(immune_layout)
-
-        # Вакцинация
-        vaccine_group = QGroupBox("Вакцинация")
-        vaccine_layout = QVBoxLayout()
-
-        self.vaccine_check = QCheckBox("Вакцинация от COVID-19 (последние 6 мес.)")
-        self.flu_vaccine_check = QCheckBox("Вакцинация от гриппа (последний год)")
-        self.pneumo_vaccine_check = QCheckBox("Вакцинация от пневмококка")
-
-        vaccine_layout.addWidget(self.vaccine_check)
-        vaccine_layout.addWidget(self.flu_vaccine_check)
-        vaccine_layout.addWidget(self.pneumo_vaccine_check)
-        vaccine_group.setLayout(vaccine_layout)
-
-        content_layout.addWidget(title)
-        content_layout.addWidget(chronic_group)
-        content_layout.addWidget(immune_group)
-        content_layout.addWidget(vaccine_group)
-        content_layout.addStretch()
-
-        content.setLayout(content_layout)
-        scroll.setWidget(content)
-        layout.addWidget(scroll)
-
-        page.setLayout(layout)
-        self.stacked_widget.addWidget(page)
+        self.create_factor_page("Шаг 2/4: Факторы здоровья", FACTOR_PAGES[0])
 
+    @metrics.timed()
     def create_page3(self):
+        self.create_factor_page("Шаг 3/4: Образ жизни и контакты", FACTOR_PAGES[1])
+
+    def create_factor_page(self, title_text, groups):
+        """Страница с чекбоксами факторов из реестра risk_engine.FACTORS"""
         page = QWidget()
         layout = QVBoxLayout()
 
-        title = QLabel("Шаг 3/4: Образ жизни и контакты")
+        title = QLabel(title_text)
         title.setFont(QFont('Arial', 16, QFont.Bold))
 
         scroll = QScrollArea()
         scroll.setWidgetResizable(True)
         content = QWidget()
         content_layout = QVBoxLayout()
+        content_layout.addWidget(title)
 
-        # Вредные привычки
-        habits_group = QGroupBox("Вредные привычки")
-        habits_layout = QVBoxLayout()
-
-        self.smoking_check = QCheckBox("Курение (текущее или в прошлом)")
-        self.alcohol_check = QCheckBox("Злоупотребление алкоголем")
-        self.drugs_check = QCheckBox("Употребление наркотических веществ")
-
-        habits_layout.addWidget(self.smoking_check)
-        habits_layout.addWidget(self.alcohol_check)
-        habits_layout.addWidget(self.drugs_check)
-        habits_group.setLayout(habits_layout)
-
-        # Физическая активность
-        activity_group = QGroupBox("Физическая активность")
-        activity_layout = QVBoxLayout()
-
-        self.sedentary_check = QCheckBox("Малоподвижный образ жизни")
-        self.no_sport_check = QCheckBox("Отсутствие регулярных физических нагрузок")
-
-        activity_layout.addWidget(self.sedentary_check)
-        activity_layout.addWidget(self.no_sport_check)
-        activity_group.setLayout(activity_layout)
-
-        # Психологическое состояние
-        psycho_group = QGroupBox("Психологическое состояние")
-        psycho_layout = QVBoxLayout()
-
-        self.stress_check = QCheckBox("Хронический стресс")
-        self.depression_check = QCheckBox("Депрессия")
-        self.sleep_check = QCheckBox("Нарушения сна")
-
-        psycho_layout.addWidget(self.stress_check)
-        psycho_layout.addWidget(self.depression_check)
-        psycho_layout.addWidget(self.sleep_check)
-        psycho_group.setLayout(psycho_layout)
-
-        # Контакты и профессия
-        contacts_group = QGroupBox("Контакты и профессия")
-        contacts_layout = QVBoxLayout()
-
-        self.contacts_check = QCheckBox("Контакт с больными COVID-19")
-        self.medic_check = QCheckBox("Работа в медицинской сфере")
-        self.crowd_check = QCheckBox("Частое нахождение в местах скопления людей")
-        self.travel_check = QCheckBox("Недавние поездки в зоны риска")
+        for group in groups:
+            group_title = FACTOR_GROUP_TITLES[group]
+            if group_title:
+                group_box = QGroupBox(group_title)
+                group_layout = QVBoxLayout()
+            else:
+                group_layout = content_layout
 
-        contacts_layout.addWidget(self.contacts_check)
-        contacts_layout.addWidget(self.medic_check)
-        contacts_layout.addWidget(self.crowd_check)
-        contacts_layout.addWidget(self.travel_check)
-        contacts_group.setLayout(contacts_layout)
+            for i in FACTOR_GROUP_BITS[group]:
+                checkbox = QCheckBox(risk_engine.FACTORS[i].label)
+                checkbox.toggled.connect(partial(self.on_factor_toggled, i))
+                self.factor_checks[i] = checkbox
+                group_layout.addWidget(checkbox)
 
-        # Беременность
-        self.pregnancy_check = QCheckBox("Беременность (для женщин)")
+            if group_title:
+                group_box.setLayout(group_layout)
+                content_layout.addWidget(group_box)
 
-        content_layout.addWidget(title)
-        content_layout.addWidget(habits_group)
-        content_layout.addWidget(activity_group)
-        content_layout.addWidget(psycho_group)
-        content_layout.addWidget(contacts_group)
-        content_layout.addWidget(self.pregnancy_check)
         content_layout.addStretch()
 
         content.setLayout(content_layout)
@@ -353,6 +435,7 @@ class CovidRiskApp(QWidget):
         page.setLayout(layout)
         self.stacked_widget.addWidget(page)
 
+    @metrics.timed()
     def create_page4(self):
         self.result_page = QWidget()
         layout = QVBoxLayout()
@@ -367,27 +450,75 @@ class CovidRiskApp(QWidget):
         self.recommendations_label = QLabel()
         self.recommendations_label.setWordWrap(True)
 
+        self.what_if_label = QLabel()
+        self.what_if_label.setWordWrap(True)
+
+        self.model_label = QLabel()
+        self.model_label.setStyleSheet("color: gray; font-size: 11px;")
+
         layout.addWidget(title)
         layout.addWidget(self.result_label)
         layout.addWidget(self.recommendations_label)
+        layout.addWidget(self.what_if_label)
         layout.addStretch()
+        layout.addWidget(self.model_label)
 
         self.result_page.setLayout(layout)
         self.stacked_widget.addWidget(self.result_page)
 
-    def next_page(self):
-        if self.current_page < self.stacked_widget.count() - 1:
-            self.current_page += 1
-            self.stacked_widget.setCurrentIndex(self.current_page)
-            self.progress.setValue(self.current_page)
-            self.update_nav_buttons()
+    def on_age_changed(self, text):
+        try:
+            self.live.set_age(int(text))
+        except ValueError:
+            self.live.set_age(None)
+        self.update_live_label()
+
+    def on_body_changed(self):
+        try:
+            self.live.set_bmi(risk_engine.parse_bmi(self.weight_input.text(),
+                                                    self.height_input.text()))
+        except (ValueError, ArithmeticError):
+            self.live.set_bmi(None)
+        self.update_live_label()
+
+    def on_gender_changed(self, text):
+        self.live.set_female(text == "Женский")
+        self.update_live_label()
+
+    def on_factor_toggled(self, bit, checked):
+        self.live.set_factor(bit, checked)
+        self.update_live_label()
+
+    def update_live_label(self):
+        risk_score = self.live.score
+        if risk_score is None:
+            self.live_label.setText("Текущий риск: заполните возраст, вес и рост")
+            return
+        _, risk, color = risk_engine.TIERS[self.model.tier_index(risk_score)]
+        self.live_label.setText(
+            f'Текущий риск: <span style="color: {color};">{risk} (баллов: {risk_score})</span>'
+        )
 
-            if self.current_page == 3:
-                self.save_to_history()
-                self.calculate_risk()
+    def next_page(self):
+        if self.current_page < PAGE_COUNT - 1:
+            self.advance_page()
         elif self.btn_next.text() == "Завершить":
+            # Вне замера: reset_to_start ждёт ввода ФИО в модальном диалоге
             self.reset_to_start()
 
+    @metrics.timed("next_page")
+    def advance_page(self):
+        self.current_page += 1
+        self.ensure_page(self.current_page)
+        self.stacked_widget.setCurrentIndex(self.current_page)
+        self.progress.setValue(self.current_page)
+        self.update_nav_buttons()
+
+        if self.current_page == 3:
+            self.calculate_risk()
+            self.save_to_history()
+
+    @metrics.timed()
     def prev_page(self):
         if self.current_page > 0:
             self.current_page -= 1
@@ -408,8 +539,13 @@ class CovidRiskApp(QWidget):
         self.gender_combo.setCurrentIndex(0)
 
         # Сброс всех чекбоксов
-        for cb in self.findChildren(QCheckBox):
-            cb.setChecked(False)
+        for checkbox in self.factor_checks:
+            if checkbox is not None:  # страница ещё не построена
+                checkbox.setChecked(False)
+
+        # Оценка прошлого пациента сохраняется, пока вводится новое ФИО
+        if self._writer is not None:
+            self._writer.flush()
 
         # Показываем диалог ввода ФИО
         if not self.show_name_dialog():
@@ -421,190 +557,205 @@ class CovidRiskApp(QWidget):
         self.progress.setValue(0)
         self.update_nav_buttons()
 
-    def show_history(self):
-        if not self.history:
-            QMessageBox.information(self, "История", "История оценок пуста.")
+    def closeEvent(self, event):
+        if self.export_worker is not None:
+            self.export_worker.cancel()
+            self.export_worker.wait()
+        if self._writer is not None:
+            self._writer.close()
+        if self._history is not None:
+            self._history.close()
+        super().closeEvent(event)
+
+    def flush_writer(self):
+        """Дописывает очередь записи перед чтением истории. Если поток записи
+        не работает, окно сообщает об этом и показывает уже сохранённое"""
+        if self._writer is None or self._writer.flush(wait=True):
             return
+        if self._writer.error is not None:
+            self.warn_history(f"Запись истории не работает: {self._writer.error}")
+        elif self._writer.write_error is not None:
+            self.warn_history(f"Оценки не записаны в историю: {self._writer.write_error}")
 
-        history_text = "<b>История оценок:</b><br><br>"
-        for record in reversed(self.history):
-            history_text += f"<b>{record['дата']}</b><br>"
-            history_text += f"ФИО: {record['ФИО']}<br>"
-            history_text += f"Возраст: {record['данные']['возраст']}<br>"
-            history_text += f"Пол: {record['данные']['пол']}<br>"
-            history_text += f"Вес/рост: {record['данные']['вес']}кг/{record['данные']['рост']}см<br>"
-            history_text += f"Факторы: {', '.join(record['данные']['факторы'])}<br>"
-            history_text += f"<span style='color:{record['результат']['цвет']};'>"
-            history_text += f"Результат: {record['результат']['текст']}</span><br><hr>"
-
-        msg = QMessageBox()
-        msg.setWindowTitle("История оценок")
-        msg.setTextFormat(Qt.RichText)
-        msg.setText(history_text)
-        msg.setStandardButtons(QMessageBox.Ok)
-        msg.exec_()
+    def warn_history(self, text):
+        # Предупреждение показывается после возврата в цикл событий: модальное
+        # окно внутри замеряемой операции (metrics.timed) попало бы в её время
+        QTimer.singleShot(0, lambda: QMessageBox.warning(self, "История", text))
 
+    def show_history(self):
+        dialog = self.open_history()
+        if dialog is None:
+            QMessageBox.information(self, "История", "История оценок пуста.")
+            return
+        # Просмотр истории в модальном окне в замер не входит
+        dialog.exec_()
+
+    @metrics.timed("show_history")
+    def open_history(self):
+        """Окно истории, готовое к показу; None, если история пуста"""
+        # Окно истории читает базу, поэтому сначала дописываем очередь
+        self.flush_writer()
+        if self.history.is_empty():
+            return None
+        from history_view import HistoryDialog
+        return HistoryDialog(self.history, self)
+
+    def show_stats(self):
+        self.flush_writer()
+        from stats_view import StatsDialog
+        StatsDialog(self.load_stats(), self).exec_()
+
+    def create_export_row(self):
+        self.export_row = QWidget()
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.export_label = QLabel()
+        self.export_progress = QProgressBar()
+        self.export_progress.setTextVisible(False)
+        self.btn_export_cancel = QPushButton("Отмена")
+        self.btn_export_cancel.clicked.connect(self.cancel_export)
+        layout.addWidget(self.export_label)
+        layout.addWidget(self.export_progress, 1)
+        layout.addWidget(self.btn_export_cancel)
+        self.export_row.setLayout(layout)
+        self.layout.addWidget(self.export_row)
+
+    def export_history(self):
+        path, selected = QFileDialog.getSaveFileName(
+            self, "Экспорт истории", "history.csv", ";;".join(EXPORT_FILTERS))
+        if not path:
+            return
+        from export import detect_format
+        from export_view import ExportWorker
+        from history_store import DEFAULT_PATH
+
+        fmt = detect_format(path, default=EXPORT_FILTERS.get(selected, "csv"))
+        if self.export_row is None:
+            self.create_export_row()
+        self.export_label.setText("Экспорт истории...")
+        self.export_progress.setRange(0, 0)
+        self.export_progress.show()
+        self.btn_export_cancel.show()
+        self.btn_export.setEnabled(False)
+
+        # Окно не ждёт выгрузку: поток сообщает о ходе сигналами
+        self.export_worker = ExportWorker(path, fmt, self.history_path or DEFAULT_PATH,
+                                          self._writer, self)
+        self.export_worker.progress.connect(self.on_export_progress)
+        self.export_worker.done.connect(
+            lambda count: self.finish_export(f"Экспортировано записей: {count}"))
+        self.export_worker.cancelled.connect(lambda: self.finish_export("Экспорт отменён"))
+        self.export_worker.failed.connect(
+            lambda error: self.finish_export(f"Ошибка экспорта: {error}"))
+        self.export_worker.start()
+
+    def on_export_progress(self, count, total):
+        self.export_progress.setRange(0, max(total, count))
+        self.export_progress.setValue(count)
+        self.export_label.setText(f"Экспорт истории: {count} из {total}")
+
+    def cancel_export(self):
+        if self.export_worker is not None:
+            self.export_worker.cancel()
+
+    def finish_export(self, text):
+        self.export_worker.wait()
+        self.export_worker.deleteLater()
+        self.export_worker = None
+        self.export_label.setText(text)
+        self.export_progress.hide()
+        self.btn_export_cancel.hide()
+        self.btn_export.setEnabled(True)
+
+    @metrics.timed()
     def save_to_history(self):
-        data = {
-            "возраст": self.age_input.text(),
-            "пол": self.gender_combo.currentText(),
-            "вес": self.weight_input.text(),
-            "рост": self.height_input.text(),
-            "факторы": self.get_checked_factors()
-        }
-
-        self.history.append({
-            "ФИО": self.user_name,
-            "дата": QDateTime.currentDateTime().toString("dd.MM.yyyy hh:mm"),
-            "данные": data,
-            "результат": {
-                "текст": self.result_label.text(),
-                "цвет": "red" if "🔴" in self.result_label.text() else
-                "orange" if "🟡" in self.result_label.text() else "green"
-            }
-        })
-
-    def get_checked_factors(self):
-        factors = []
-        for cb in self.findChildren(QCheckBox):
-            if cb.isChecked():
-                factors.append(cb.text().split(" (")[0])  # Убираем пояснения в скобках
+        # Оценка с ошибкой ввода в историю не попадает
+        if self.risk_score is None:
+            return
 
-        return factors if factors else ["Нет факторов риска"]
+        weight, height = float(self.weight_input.text()), float(self.height_input.text())
+        if not (math.isfinite(weight) and math.isfinite(height)):
+            # float() принимает "nan" и "inf", но в истории это не числа
+            self.warn_history("Оценка не сохранена в историю: вес и рост должны быть числами.")
+            return
 
+        from history_store import HistoryRecord
+        record = HistoryRecord(
+            name=self.user_name,
+            ts=QDateTime.currentDateTime().toSecsSinceEpoch(),
+            age=int(self.age_input.text()),
+            is_female=self.gender_combo.currentText() == "Женский",
+            weight=weight,
+            height=height,
+            factors=self.factor_mask(),
+            score=self.risk_score,
+            tier=self.risk_model.tier_index(self.risk_score),
+            model=self.risk_model.version,
+        )
+        if not self.writer.submit(record):
+            reason = self.writer.error or "запись на диск не успевает"
+            self.warn_history(f"Оценка не сохранена в историю: {reason}.")
+
+    def factor_mask(self):
+        mask = 0
+        for i, checkbox in enumerate(self.factor_checks):
+            if checkbox is not None and checkbox.isChecked():
+                mask |= 1 << i
+        return mask
+
+    @metrics.timed()
     def calculate_risk(self):
         try:
-            age = int(self.age_input.text())
-            weight = float(self.weight_input.text())
-            height = float(self.height_input.text()) / 100
-            bmi = weight / (height ** 2)
+            age, bmi = risk_engine.parse_inputs(self.age_input.text(),
+                                                self.weight_input.text(),
+                                                self.height_input.text())
             is_female = self.gender_combo.currentText() == "Женский"
-        except:
+        except (ValueError, ArithmeticError):
+            self.risk_score = None
             self.result_label.setText("⚠️ Ошибка: проверьте введённые данные!")
+            self.what_if_label.clear()
+            self.model_label.clear()
             return
 
-        risk_score = 0
-
-        # 1. Основные параметры
-        if age >= 65:
-            risk_score += 4
-        elif age >= 50:
-            risk_score += 3
-        elif age >= 40:
-            risk_score += 2
-        elif age >= 30:
-            risk_score += 1
-
-        if bmi >= 40:
-            risk_score += 3
-        elif bmi >= 35:
-            risk_score += 2
-        elif bmi >= 30:
-            risk_score += 1
-
-        # 2. Хронические заболевания
-        if self.diabetes_check.isChecked(): risk_score += 3
-        if self.hypertension_check.isChecked(): risk_score += 2
-        if self.cvd_check.isChecked(): risk_score += 3
-        if self.lung_disease_check.isChecked(): risk_score += 3
-        if self.kidney_check.isChecked(): risk_score += 3
-        if self.liver_check.isChecked(): risk_score += 2
-        if self.cancer_check.isChecked(): risk_score += 4
-        if self.autoimmune_check.isChecked(): risk_score += 2
-
-        # 3. Иммунный статус
-        if self.immune_check.isChecked(): risk_score += 4
-        if self.hiv_check.isChecked(): risk_score += 4
-        if self.transplant_check.isChecked(): risk_score += 5
-        if self.steroids_check.isChecked(): risk_score += 3
-        if self.chemotherapy_check.isChecked(): risk_score += 4
-
-        # 4. Вакцинация (снижают риск)
-        if self.vaccine_check.isChecked(): risk_score -= 3
-        if self.flu_vaccine_check.isChecked(): risk_score -= 1
-        if self.pneumo_vaccine_check.isChecked(): risk_score -= 1
-
-        # 5. Образ жизни
-        if self.smoking_check.isChecked(): risk_score += 2
-        if self.alcohol_check.isChecked(): risk_score += 1
-        if self.drugs_check.isChecked(): risk_score += 2
-        if self.sedentary_check.isChecked(): risk_score += 1
-        if self.no_sport_check.isChecked(): risk_score += 1
-
-        # 6. Психологическое состояние
-        if self.stress_check.isChecked(): risk_score += 1
-        if self.depression_check.isChecked(): risk_score += 1
-        if self.sleep_check.isChecked(): risk_score += 1
-
-        # 7. Контакты и профессия
-        if self.contacts_check.isChecked(): risk_score += 2
-        if self.medic_check.isChecked(): risk_score += 2
-        if self.crowd_check.isChecked(): risk_score += 1
-        if self.travel_check.isChecked(): risk_score += 1
-
-        # 8. Беременность
-        if is_female and self.pregnancy_check.isChecked(): risk_score += 2
-
-        # Определение уровня риска
-        if risk_score >= 15:
-            risk, color = "🔴 Очень высокий", "darkred"
-        elif risk_score >= 10:
-            risk, color = "🔴 Высокий", "red"
-        elif risk_score >= 6:
-            risk, color = "🟡 Повышенный", "orange"
-        elif risk_score >= 3:
-            risk, color = "🟢 Умеренный", "green"
-        else:
-            risk, color = "🟢 Низкий", "darkgreen"
+        mask = self.factor_mask()
+        model = self.risk_model = self.model
+        risk_score = self.risk_score = model.score(age, bmi, is_female, mask)
 
-        self.result_label.setText(
-            f'<span style="color: {color}; font-weight: bold;">{risk} риск (баллов: {risk_score})</span>'
-        )
-        self.recommendations_label.setText(self.get_recommendations(risk_score, age))
-
-    def get_recommendations(self, risk_score, age):
-        recommendations = []
-
-        if risk_score >= 10:
-            recommendations.append("🔴 Срочно проконсультируйтесь с врачом!")
-            recommendations.append("🔴 Максимально ограничьте контакты с другими людьми")
-        elif risk_score >= 6:
-            recommendations.append("🟡 Рекомендуется консультация врача")
-            recommendations.append("🟡 Избегайте людных мест, носите маску")
-
-        # Рекомендации по вакцинации
-        if not self.vaccine_check.isChecked():
-            recommendations.append("💉 Сделайте прививку от COVID-19 как можно скорее")
-        if not self.flu_vaccine_check.isChecked():
-            recommendations.append("💉 Рекомендуется вакцинация от гриппа")
-        if not self.pneumo_vaccine_check.isChecked() and (self.lung_disease_check.isChecked() or age >= 65):
-            recommendations.append("💉 Рекомендуется вакцинация от пневмококка")
-
-        # Рекомендации по образу жизни
-        if self.smoking_check.isChecked():
-            recommendations.append("🚭 Настоятельно рекомендуется бросить курить")
-        if self.alcohol_check.isChecked():
-            recommendations.append("🍷 Ограничьте потребление алкоголя")
-        if self.sedentary_check.isChecked():
-            recommendations.append("🏃 Начните регулярные физические упражнения")
-        if self.stress_check.isChecked():
-            recommendations.append("🧘 Практикуйте техники релаксации и снижения стресса")
-        if self.sleep_check.isChecked():
-            recommendations.append("😴 Нормализуйте режим сна (7-9 часов ежедневно)")
-
-        # Общие рекомендации
-        recommendations.append("🧼 Соблюдайте гигиену рук и социальную дистанцию")
-        recommendations.append("🔄 Регулярно проветривайте помещения")
-
-        if risk_score < 3:
-            recommendations.append("🟢 Продолжайте соблюдать меры профилактики")
-
-        return "\n".join(recommendations)
+        self.result_label.setText(model.result_html(risk_score))
+        self.recommendations_label.setText(self.get_recommendations(risk_score, age, mask))
+        self.what_if_label.setText(self.get_what_if(age, bmi, is_female, mask))
+        self.model_label.setText(f"Модель оценки: {model.version}")
+
+    @metrics.timed()
+    def get_recommendations(self, risk_score, age, mask=None):
+        if mask is None:
+            mask = self.factor_mask()
+        return "\n".join(self.model.recommendations(risk_score, age, mask))
+
+    def get_what_if(self, age, bmi, is_female, mask):
+        variants = risk_engine.what_if(age, bmi, is_female, mask, WHAT_IF_TOP, self.model)
+        if not variants:
+            return ""
+        lines = ["Что снизит риск:"]
+        for keys, risk_score, tier in variants:
+            lines.append(f"• {risk_engine.what_if_text(keys, mask)}: "
+                         f"{risk_engine.TIERS[tier][1]} (баллов: {risk_score})")
+        return "\n".join(lines)
 
 
 if __name__ == '__main__':
+    if sys.argv[1:] == ["--startup-time"]:
+        MEASURE_STARTUP = True
+    elif len(sys.argv) > 1:
+        # Консольные режимы (пакетная оценка и т.д.), см. cli.py
+        from cli import main
+        sys.exit(main(sys.argv[1:]))
+
     app = QApplication(sys.argv)
-    ex = CovidRiskApp()
+    # Общая история нескольких копий программы на одном сервере
+    ex = CovidRiskApp(history_path=os.environ.get("KURS_HISTORY"))
+    if MEASURE_STARTUP:
+        sys.exit(0)
     ex.resize(600, 500)
     ex.show()
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,214 @@
+"""Замеры времени операций окна: гистограммы задержек в формате Prometheus.
+
+Замеры включаются переменными окружения при запуске программы:
+    KURS_METRICS          - файл метрик (textfile collector node_exporter);
+                            "{pid}" в пути заменяется номером процесса
+    KURS_METRICS_INTERVAL - период записи файла, с (по умолчанию 15)
+    KURS_PROFILE          - каталог для профиля одной медленной операции
+    KURS_PROFILE_SLOW_MS  - порог «медленной» операции, мс (по умолчанию 200)
+
+Если ни одна из переменных не задана, декоратор timed возвращает функцию
+без изменений: выключенные замеры ничего не стоят. Включённые замеры
+считают вызовы, ошибки и гистограмму времени по каждой операции; файл
+пишется атомарно в фоновом потоке и при выходе. Профилировщик (cProfile)
+включается на каждую внешнюю операцию - вложенные замеряются внутри неё -
+и сохраняет профиль первой, которая оказалась медленнее порога, после чего
+отключается. Замеряемые операции не должны ждать пользователя: модальные
+окна открываются вне их, иначе в замер попадает время ввода.
+"""
+import atexit
+import os
+import threading
+import time
+from functools import wraps
+
+
+METRICS_PATH = os.environ.get("KURS_METRICS", "").replace("{pid}", str(os.getpid()))
+INTERVAL = float(os.environ.get("KURS_METRICS_INTERVAL", 15))
+PROFILE_DIR = os.environ.get("KURS_PROFILE", "")
+PROFILE_SLOW_MS = float(os.environ.get("KURS_PROFILE_SLOW_MS", 200))
+ENABLED = bool(METRICS_PATH or PROFILE_DIR)
+
+# Верхние границы корзин гистограммы, с
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC = "kurs_operation_seconds"
+PROFILE_TOP = 40
+
+
+class Histogram:
+    __slots__ = ("buckets", "sum", "count", "errors")
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+        self.errors = 0
+
+    def observe(self, seconds):
+        self.sum += seconds
+        self.count += 1
+        for i, upper in enumerate(BUCKETS):
+            if seconds <= upper:
+                self.buckets[i] += 1
+                break
+
+
+class Registry:
+    """Гистограммы по именам операций"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, seconds, error=False):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+            if error:
+                histogram.errors += 1
+
+    def exposition(self):
+        """Текст в формате Prometheus (text exposition format 0.0.4)"""
+        lines = [f"# HELP {METRIC} Время операций окна калькулятора",
+                 f"# TYPE {METRIC} histogram"]
+        errors = ["# HELP kurs_operation_errors_total Операции, завершившиеся исключением",
+                  "# TYPE kurs_operation_errors_total counter"]
+        with self.lock:
+            for name, h in sorted(self.histograms.items()):
+                label = f'operation="{_escape(name)}"'
+                # Корзины Prometheus - накопленные
+                total = 0
+                for upper, n in zip(BUCKETS, h.buckets):
+                    total += n
+                    lines.append(f'{METRIC}_bucket{{{label},le="{upper:g}"}} {total}')
+                lines.append(f'{METRIC}_bucket{{{label},le="+Inf"}} {h.count}')
+                lines.append(f"{METRIC}_sum{{{label}}} {h.sum:.6f}")
+                lines.append(f"{METRIC}_count{{{label}}} {h.count}")
+                errors.append(f"kurs_operation_errors_total{{{label}}} {h.errors}")
+        return "\n".join(lines + errors) + "\n"
+
+    def write(self, path):
+        """Атомарная запись: сборщик не должен увидеть недописанный файл"""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+            f.write(self.exposition())
+        os.replace(tmp, path)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = Registry()
+
+
+class _Dumper(threading.Thread):
+    # Поток периодической записи файла метрик; запускается при первом замере
+    def __init__(self, registry, path, interval):
+        super().__init__(name="metrics-dumper", daemon=True)
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            self.dump()
+
+    def dump(self):
+        try:
+            self.registry.write(self.path)
+        except OSError:
+            pass  # каталог недоступен - замеры не должны мешать работе окна
+
+    def close(self):
+        self.stop.set()
+        self.dump()
+
+
+_dumper = None
+
+
+def _start_dumper():
+    global _dumper
+    if _dumper is None and METRICS_PATH:
+        _dumper = _Dumper(REGISTRY, METRICS_PATH, INTERVAL)
+        _dumper.start()
+        atexit.register(_dumper.close)
+
+
+class SlowProfiler:
+    """Профиль первой операции медленнее slow_ms - в каталог directory:
+    файл .prof для pstats/snakeviz и текстовая сводка рядом"""
+
+    def __init__(self, directory, slow_ms):
+        self.directory = directory
+        self.slow_ms = slow_ms
+        self.armed = True
+        self.path = None
+
+    def start(self):
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def finish(self, profile, name, seconds):
+        profile.disable()
+        if not self.armed or seconds * 1000 < self.slow_ms:
+            return
+        self.armed = False
+        import pstats
+        os.makedirs(self.directory, exist_ok=True)
+        stem = os.path.join(self.directory,
+                            f"kurs_{name}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}")
+        profile.dump_stats(stem + ".prof")
+        with open(stem + ".txt", "w", encoding="utf-8") as f:
+            f.write(f"{name}: {seconds * 1000:.1f} мс\n\n")
+            pstats.Stats(profile, stream=f).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        self.path = stem + ".prof"
+
+
+profiler = SlowProfiler(PROFILE_DIR, PROFILE_SLOW_MS) if PROFILE_DIR else None
+_depth = threading.local()
+
+
+def instrument(func, name, registry=REGISTRY):
+    """Обёртка замера func под именем name (без проверки ENABLED)"""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_depth, "value", 0)
+        _depth.value = depth + 1
+        # Профилируется только внешняя операция: вложенные входят в её профиль
+        profile = profiler.start() if depth == 0 and profiler and profiler.armed else None
+        error = False
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            error = True
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            _depth.value = depth
+            registry.observe(name, seconds, error)
+            if profile is not None:
+                profiler.finish(profile, name, seconds)
+            _start_dumper()
+
+    return wrapper
+
+
+def timed(name=None):
+    """Декоратор замера времени под именем name (по умолчанию - имя
+    функции). Если замеры выключены, функция возвращается как есть."""
+
+    def decorate(func):
+        if not ENABLED:
+            return func
+        return instrument(func, name or func.__name__)
+
+    return decorate
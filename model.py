@@ -0,0 +1,234 @@
+"""Модели оценки риска из файлов JSON.
+
+Файл модели (такой пишет calibrate) - словарь:
+    format    - FORMAT_VERSION
+    version   - версия модели, она записывается в каждую оценку истории
+    weights   - {ключ фактора: баллы}
+    age_bands, bmi_bands - [[нижняя граница, баллы], ...] по убыванию границ
+    tiers     - пороги уровней риска по убыванию, без нижнего уровня
+    advice, missing_advice - {ключ фактора: текст рекомендации}
+Всё, что не задано, берётся из встроенных таблиц risk_engine.
+
+При загрузке модель компилируется в таблицы: баллы для каждого значения
+каждого байта маски факторов и уровень риска для каждой возможной суммы
+баллов. Скомпилированные модели кэшируются по версии, так что возврат к уже
+загруженной версии не требует компиляции. ModelFile следит за файлом и
+подменяет модель при его изменении.
+"""
+import json
+import os
+
+import risk_engine
+
+
+DEFAULT_PATH = "model.json"
+FORMAT_VERSION = 1
+
+
+def _number(value):
+    # bool - тоже int, но границей диапазона быть не может
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"граница диапазона должна быть числом: {value!r}")
+    return value
+
+
+def _bands(value, default):
+    if value is None:
+        return default
+    bands = tuple((_number(lower), int(points)) for lower, points in value)
+    lowers = [lower for lower, _ in bands]
+    if lowers != sorted(set(lowers), reverse=True):
+        raise ValueError("границы диапазонов должны строго убывать")
+    return bands
+
+
+def _overrides(value, name, kind=None):
+    # Ошибка в файле - всегда ValueError: ModelFile и сервис ловят только
+    # ошибки загрузки, а не AttributeError от списка вместо словаря
+    value = value or {}
+    if not isinstance(value, dict):
+        raise ValueError(f"{name} должен быть словарём {{ключ фактора: значение}}")
+    unknown = set(value) - set(risk_engine.FACTOR_BITS)
+    if unknown:
+        raise ValueError(f"неизвестные факторы в {name}: {', '.join(sorted(unknown))}")
+    if kind is not None:
+        for key, item in value.items():
+            if not isinstance(item, kind):
+                raise ValueError(f"неверное значение {name}[{key!r}]: {item!r}")
+    return value
+
+
+class ScoringModel:
+    """Скомпилированная модель. Методы повторяют функции risk_engine"""
+
+    def __init__(self, data):
+        if data.get("format") != FORMAT_VERSION:
+            raise ValueError(f"неподдерживаемый формат модели: {data.get('format')}")
+        version = data.get("version")
+        if not isinstance(version, str) or not version:
+            raise ValueError("в модели не указана версия")
+        self.data = data
+        self.version = version
+
+        weights = _overrides(data.get("weights"), "weights")
+        advice = _overrides(data.get("advice"), "advice", str)
+        missing_advice = _overrides(data.get("missing_advice"), "missing_advice", str)
+        self.factors = tuple(
+            factor._replace(weight=int(weights.get(factor.key, factor.weight)),
+                            advice=advice.get(factor.key, factor.advice),
+                            missing_advice=missing_advice.get(factor.key,
+                                                              factor.missing_advice))
+            for factor in risk_engine.FACTORS
+        )
+        self.weights = tuple(factor.weight for factor in self.factors)
+        # Как risk_engine.RECOMMENDATION_MASK, но с текстами модели
+        self.recommendation_mask = risk_engine._recommendation_mask(self.factors)
+        self.age_bands = _bands(data.get("age_bands"), risk_engine.AGE_BANDS)
+        self.bmi_bands = _bands(data.get("bmi_bands"), risk_engine.BMI_BANDS)
+
+        thresholds = [lower for lower, _, _ in risk_engine.TIERS[:-1]]
+        if data.get("tiers") is not None:
+            thresholds = [int(lower) for lower in data["tiers"]]
+            if len(thresholds) != len(risk_engine.TIERS) - 1 \
+                    or thresholds != sorted(set(thresholds), reverse=True):
+                raise ValueError(f"нужно {len(risk_engine.TIERS) - 1} убывающих порогов уровней")
+        self.tiers = tuple((lower, label, color) for lower, (_, label, color)
+                           in zip(thresholds + [None], risk_engine.TIERS))
+        self._compile()
+        self._vector = None
+
+    def _compile(self):
+        # Баллы всех 256 значений каждого байта маски
+        self.byte_points = []
+        for shift in range(0, 32, 8):
+            weights = self.weights[shift:shift + 8]
+            table = [0] * 256
+            for value in range(1, 256):
+                low = value & -value
+                bit = low.bit_length() - 1
+                table[value] = table[value ^ low] + (weights[bit] if bit < len(weights) else 0)
+            self.byte_points.append(table)
+
+        # Уровень риска для каждой суммы от наименьшей до наибольшей возможной
+        def extremes(points):
+            return min(points + [0]), max(points + [0])
+
+        age = extremes([points for _, points in self.age_bands])
+        bmi = extremes([points for _, points in self.bmi_bands])
+        self.min_score = age[0] + bmi[0] + sum(w for w in self.weights if w < 0)
+        max_score = age[1] + bmi[1] + sum(w for w in self.weights if w > 0)
+        self.tier_table = [self._find_tier(score)
+                           for score in range(self.min_score, max_score + 1)]
+
+    def _find_tier(self, risk_score):
+        for i, (lower, _, _) in enumerate(self.tiers):
+            if lower is None or risk_score >= lower:
+                return i
+
+    def score(self, age, bmi, is_female, mask):
+        if not is_female:
+            mask &= ~risk_engine.PREGNANCY_BIT
+        points = self.byte_points
+        return (risk_engine._band_points(age, self.age_bands)
+                + risk_engine._band_points(bmi, self.bmi_bands)
+                + points[0][mask & 255] + points[1][mask >> 8 & 255]
+                + points[2][mask >> 16 & 255] + points[3][mask >> 24 & 255])
+
+    def tier_index(self, risk_score):
+        i = risk_score - self.min_score
+        if 0 <= i < len(self.tier_table):
+            return self.tier_table[i]
+        return self._find_tier(risk_score)
+
+    def result_html(self, risk_score):
+        return risk_engine.result_html(risk_score, self.tier_index(risk_score))
+
+    def recommendations(self, risk_score, age, mask):
+        return risk_engine.recommendations(risk_score, age, mask, self.factors, self.tiers)
+
+    def live_score(self):
+        return risk_engine.LiveScore(self)
+
+    # Векторные таблицы строятся при первом вызове: им нужен numpy
+    def vector_tables(self):
+        if self._vector is None:
+            self._vector = risk_engine.vector_tables(self.age_bands, self.bmi_bands,
+                                                     self.weights, self.tiers)
+        return self._vector
+
+    def score_batch(self, age, bmi, is_female, mask):
+        return risk_engine.score_batch(age, bmi, is_female, mask, self.vector_tables())
+
+    def tier_batch(self, scores):
+        return risk_engine.tier_batch(scores, self.vector_tables())
+
+
+# Версия -> скомпилированная модель
+_compiled = {}
+
+
+def compile_model(data):
+    """Модель из словаря файла; уже скомпилированная версия берётся из кэша"""
+    model = _compiled.get(data.get("version"))
+    if model is None or model.data != data:
+        model = ScoringModel(data)
+        _compiled[model.version] = model
+    return model
+
+
+def builtin():
+    """Встроенная модель risk_engine"""
+    return compile_model({"format": FORMAT_VERSION, "version": risk_engine.BUILTIN_MODEL})
+
+
+def load(path=DEFAULT_PATH):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("файл модели должен содержать словарь")
+    return compile_model(data)
+
+
+def save(data, path):
+    """Атомарная запись файла модели: временный файл, затем замена"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+class ModelFile:
+    """Модель из файла, которая перечитывается при его изменении.
+
+    Пока файла нет, действует встроенная модель. Если изменённый файл не
+    удалось загрузить, остаётся прежняя модель, а текст ошибки - в error.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.model = builtin()
+        self.error = None
+        self.stamp = None
+        self.reload()
+
+    def _stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def reload(self):
+        """Перечитывает файл, если он изменился. True, если файл изменился:
+        новая модель - в model, ошибка загрузки - в error"""
+        stamp = self._stamp()
+        if stamp == self.stamp:
+            return False
+        self.stamp = stamp
+        try:
+            self.model = builtin() if stamp is None else load(self.path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.error = str(e)
+        else:
+            self.error = None
+        return True
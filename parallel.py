@@ -0,0 +1,131 @@
+"""Параллельная пакетная оценка: файл делится на диапазоны байтов (шарды),
+шарды оцениваются в пуле процессов, результаты склеиваются в порядке входа.
+
+Граница шарда всегда сдвигается на начало следующей строки, поэтому записи
+CSV не должны содержать переводов строк внутри кавычек. Результат побайтно
+совпадает с однопроцессным режимом batch.score_stream при любом числе
+процессов: номера строк считаются до оценки отдельным быстрым проходом.
+"""
+import csv
+import io
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import batch
+import model
+
+
+SHARD_SIZE = 16 * 1024 * 1024
+
+
+def read_header(path, fmt):
+    """(имена столбцов CSV или None, смещение первой записи)"""
+    if fmt != "csv":
+        return None, 0
+    with open(path, "rb") as f:
+        line = f.readline()
+    fieldnames = next(csv.reader([line.decode("utf-8-sig")]), [])
+    return fieldnames, len(line)
+
+
+def split_shards(path, start, shard_count):
+    """Диапазоны (начало, конец) байтов, выровненные по началу строки"""
+    size = os.path.getsize(path)
+    bounds = [start]
+    with open(path, "rb") as f:
+        for i in range(1, shard_count):
+            offset = start + (size - start) * i // shard_count
+            if offset <= bounds[-1]:
+                continue
+            f.seek(offset - 1)
+            f.readline()  # дочитываем строку, в которую попала граница
+            offset = f.tell()
+            if offset >= size:
+                break
+            if offset > bounds[-1]:
+                bounds.append(offset)
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def _read_range(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def count_records(path, fmt, start, end):
+    # Те же правила пропуска пустых строк, что у csv.DictReader и
+    # batch.read_records
+    lines = _read_range(path, start, end).splitlines()
+    if fmt == "csv":
+        return sum(1 for line in lines if line)
+    return sum(1 for line in lines if line.strip())
+
+
+def score_shard(path, fmt, out_fmt, fieldnames, start, end, first_row, out_path, chunk_size,
+                model_data=None):
+    """Оценивает шард по модели из словаря model_data (по умолчанию
+    встроенная) и пишет результаты в out_path. Возвращает (всего записей,
+    отклонено)."""
+    # Модель передаётся словарём файла; в процессе она компилируется один раз
+    scoring_model = model.compile_model(model_data) if model_data else model.builtin()
+    text = _read_range(path, start, end).decode("utf-8-sig")
+    records = batch.read_records(io.StringIO(text, newline=""), fmt, fieldnames)
+    total = rejected = 0
+    with open(out_path, "w", encoding="utf-8", newline="") as out:
+        writer = batch.ResultWriter(out, out_fmt)
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            results, bad = batch.score_chunk(chunk, first_row + total, scoring_model)
+            writer.write(results)
+            total += len(chunk)
+            rejected += bad
+    return total, rejected
+
+
+def score_file(path, dst, fmt, out_fmt=None, workers=None, chunk_size=batch.CHUNK_SIZE,
+               shard_size=SHARD_SIZE, model_data=None):
+    """Параллельная оценка файла path в поток dst.
+    Возвращает (всего строк, отклонено)."""
+    out_fmt = out_fmt or fmt
+    workers = workers or os.cpu_count() or 1
+    fieldnames, start = read_header(path, fmt)
+    size = os.path.getsize(path) - start
+    # Шардов больше, чем процессов: выравнивает нагрузку и ограничивает
+    # объём данных, который процесс держит в памяти одновременно
+    shard_count = max(workers * 4, -(-size // shard_size), 1)
+    shards = split_shards(path, start, shard_count)
+
+    writer = batch.ResultWriter(dst, out_fmt)
+    writer.write_header()
+    dst.flush()
+
+    total = rejected = 0
+    with ProcessPoolExecutor(workers) as pool, \
+            tempfile.TemporaryDirectory(prefix="kurs-shards-") as tmp:
+        counts = pool.map(count_records, *zip(*[(path, fmt, a, b) for a, b in shards]))
+        first_rows = [1]
+        for count in counts:
+            first_rows.append(first_rows[-1] + count)
+
+        futures = [
+            pool.submit(score_shard, path, fmt, out_fmt, fieldnames, a, b, first_rows[i],
+                        os.path.join(tmp, f"{i}.part"), chunk_size, model_data)
+            for i, (a, b) in enumerate(shards)
+        ]
+        # Склейка строго в порядке шардов - результат не зависит от числа процессов
+        for i, future in enumerate(futures):
+            count, bad = future.result()
+            total += count
+            rejected += bad
+            part = os.path.join(tmp, f"{i}.part")
+            with open(part, encoding="utf-8", newline="") as f:
+                shutil.copyfileobj(f, dst)
+            os.remove(part)
+    return total, rejected
@@ -0,0 +1,324 @@
+"""Листы результатов для каждого пациента из файла CSV/JSONL (вход как у batch).
+
+Лист - HTML (или PDF через Qt) с теми же текстом и цветом уровня риска и
+рекомендациями, что на странице результата окна. Шаблон разбирается один
+раз; тексты результата и рекомендаций, которые зависят только от баллов и
+части маски факторов, кэшируются. Блоки записей оцениваются одним вызовом
+score_batch и отрисовываются в пуле процессов, а листы по порядку входа
+пишутся в каталог или в архив .zip - в памяти держится лишь несколько
+блоков.
+"""
+import html
+import os
+import re
+import string
+import sys
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+import batch
+import model
+import risk_engine
+
+
+# Записей в блоке: лист занимает несколько КБ, блок - несколько МБ
+CHUNK_SIZE = 1000
+DATE_FORMAT = "%d.%m.%Y"
+FIELDS = ("row", "name", "age", "sex", "weight", "height", "bmi", "factors", "score", "tier",
+          "color", "result", "recommendations", "model", "date")
+
+DEFAULT_TEMPLATE = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<title>Оценка риска COVID-19: {name}</title>
+<style>
+body {{ font-family: 'Segoe UI', Arial, sans-serif; font-size: 14px; margin: 2em; }}
+h1 {{ font-size: 20px; }}
+td {{ padding: 2px 16px 2px 0; vertical-align: top; }}
+.result {{ font-size: 18px; margin: 1em 0; }}
+.footer {{ color: gray; font-size: 11px; }}
+</style>
+</head>
+<body>
+<h1>Результат оценки риска</h1>
+<table>
+<tr><td>ФИО</td><td>{name}</td></tr>
+<tr><td>Возраст</td><td>{age}</td></tr>
+<tr><td>Пол</td><td>{sex}</td></tr>
+<tr><td>Вес/рост</td><td>{weight} кг / {height} см (ИМТ {bmi})</td></tr>
+<tr><td>Факторы риска</td><td>{factors}</td></tr>
+</table>
+<p class="result">{result}</p>
+<ul>
+{recommendations}
+</ul>
+<p class="footer">Модель оценки: {model}. Дата: {date}.</p>
+</body>
+</html>
+"""
+
+
+class Template:
+    """Шаблон с полями {имя} из FIELDS, разобранный на куски один раз"""
+
+    def __init__(self, text):
+        # Чётные элементы - текст, нечётные - имена полей
+        self.parts = [""]
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            if spec or conversion:
+                raise ValueError(f"в шаблоне не поддерживаются формат и преобразование: {field}")
+            if field is not None and field not in FIELDS:
+                raise ValueError(f"неизвестное поле шаблона: {{{field}}}")
+            # "{{" и "}}" разбор отдаёт отдельными кусками текста без поля
+            self.parts[-1] += literal
+            if field is not None:
+                self.parts += [field, ""]
+        self.fields = self.parts[1::2]
+
+    def render(self, values):
+        parts = self.parts[:]
+        parts[1::2] = [values[field] for field in self.fields]
+        return "".join(parts)
+
+
+_SAFE_NAME = re.compile(r"[^\w\-]+")
+
+
+def sheet_name(row, name, ext):
+    name = _SAFE_NAME.sub("_", name).strip("_")[:60]
+    return f"{row:06d}_{name}.{ext}" if name else f"{row:06d}.{ext}"
+
+
+class SheetRenderer:
+    """Отрисовка листов по шаблону и модели оценки с кэшем повторяющихся частей"""
+
+    def __init__(self, template_text, model_data, date):
+        self.template = Template(template_text)
+        self.model = model.compile_model(model_data)
+        self.date = date
+        self.results = {}
+        self.recommendations = {}
+
+    def result(self, risk_score, tier):
+        html_text = self.results.get(risk_score)
+        if html_text is None:
+            html_text = self.results[risk_score] = risk_engine.result_html(risk_score, tier)
+        return html_text
+
+    def recommendation_items(self, risk_score, age, mask):
+        # Как batch.recommendations: список зависит только от части маски и
+        # от age >= 65
+        key = (risk_score, age >= 65, mask & self.model.recommendation_mask)
+        items = self.recommendations.get(key)
+        if items is None:
+            items = self.recommendations[key] = "\n".join(
+                f"<li>{html.escape(text)}</li>"
+                for text in self.model.recommendations(risk_score, age, mask))
+        return items
+
+    def render_chunk(self, records, first_row, pdf=False):
+        """Листы блока: ([(имя файла, содержимое)], число отклонённых записей)"""
+        rows, names, ages, bmis, females, masks, rejected = batch.parse_chunk(records, first_row)
+        if not rows:
+            return [], rejected
+        scores = self.model.score_batch(batch.clip_ages(ages), bmis, females,
+                                        np.array(masks, dtype=np.uint32))
+        tiers = self.model.tier_batch(scores)
+        ext = "pdf" if pdf else "html"
+        sheets = []
+        for i, row in enumerate(rows):
+            record = records[row - first_row]
+            risk_score, tier, mask = int(scores[i]), int(tiers[i]), masks[i]
+            if not females[i]:
+                mask &= ~risk_engine.PREGNANCY_BIT
+            _, label, color = risk_engine.TIERS[tier]
+            text = self.template.render({
+                "row": str(row),
+                "name": html.escape(names[i]),
+                "age": str(ages[i]),
+                "sex": "Женский" if females[i] else "Мужской",
+                "weight": html.escape(str(record["weight"])),
+                "height": html.escape(str(record["height"])),
+                "bmi": f"{bmis[i]:.1f}",
+                "factors": html.escape(", ".join(risk_engine.factor_names(mask))),
+                "score": str(risk_score),
+                "tier": label,
+                "color": color,
+                "result": self.result(risk_score, tier),
+                "recommendations": self.recommendation_items(risk_score, ages[i], mask),
+                "model": html.escape(self.model.version),
+                "date": self.date,
+            })
+            sheets.append((sheet_name(row, names[i], ext),
+                           html_to_pdf(text) if pdf else text.encode("utf-8")))
+        return sheets, rejected
+
+
+_qt_app = None
+
+
+def html_to_pdf(text):
+    """PDF из HTML через QTextDocument; Qt импортируется при первом вызове"""
+    global _qt_app
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtCore import QBuffer, QByteArray, QIODevice
+    from PyQt5.QtGui import QGuiApplication, QPageSize, QPdfWriter, QTextDocument
+    if QGuiApplication.instance() is None:
+        _qt_app = QGuiApplication([])
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    writer = QPdfWriter(buffer)
+    writer.setPageSize(QPageSize(QPageSize.A4))
+    document = QTextDocument()
+    document.setHtml(text)
+    document.print_(writer)
+    del writer
+    buffer.close()
+    return bytes(data)
+
+
+# Отрисовщики процесса по (шаблон, версия модели, дата)
+_renderers = {}
+
+
+def render_chunk(records, first_row, template_text, model_data, date, pdf=False):
+    key = (template_text, model_data.get("version"), date)
+    renderer = _renderers.get(key)
+    if renderer is None or renderer.model.data != model_data:
+        renderer = _renderers[key] = SheetRenderer(template_text, model_data, date)
+    return renderer.render_chunk(records, first_row, pdf)
+
+
+class DirectoryOutput:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, name, data):
+        with open(os.path.join(self.path, name), "wb") as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+
+class ZipOutput:
+    def __init__(self, path):
+        # Быстрое сжатие, как у выгрузки XLSX
+        self.zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=1)
+
+    def write(self, name, data):
+        self.zip.writestr(name, data)
+
+    def close(self):
+        self.zip.close()
+
+
+def open_output(path):
+    """Архив, если путь оканчивается на .zip, иначе каталог"""
+    if path.lower().endswith(".zip"):
+        return ZipOutput(path)
+    return DirectoryOutput(path)
+
+
+def report_stream(src, output, fmt, template_text=DEFAULT_TEMPLATE, model_data=None, pdf=False,
+                  workers=1, chunk_size=CHUNK_SIZE):
+    """Листы для всех записей src в output (open_output).
+    Возвращает (всего строк, отклонено)."""
+    model_data = model_data or model.builtin().data
+    date = time.strftime(DATE_FORMAT)
+    records = batch.read_records(src, fmt)
+    total = rejected = 0
+
+    def chunks():
+        nonlocal total
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                return
+            yield chunk, total + 1
+            total += len(chunk)
+
+    if workers == 1:
+        results = (render_chunk(chunk, first_row, template_text, model_data, date, pdf)
+                   for chunk, first_row in chunks())
+        for sheets, bad in results:
+            for name, data in sheets:
+                output.write(name, data)
+            rejected += bad
+        return total, rejected
+
+    with ProcessPoolExecutor(workers) as pool:
+        # Впереди записи идёт не больше двух блоков на процесс: память не
+        # зависит от размера входа, а листы пишутся в порядке входа
+        pending = deque()
+        for chunk, first_row in chunks():
+            pending.append(pool.submit(render_chunk, chunk, first_row, template_text,
+                                       model_data, date, pdf))
+            while len(pending) > workers * 2 or (pending and pending[0].done()):
+                sheets, bad = pending.popleft().result()
+                for name, data in sheets:
+                    output.write(name, data)
+                rejected += bad
+        while pending:
+            sheets, bad = pending.popleft().result()
+            for name, data in sheets:
+                output.write(name, data)
+            rejected += bad
+    return total, rejected
+
+
+def run(args):
+    fmt = args.format or batch.detect_format(args.input)
+    model_file = model.ModelFile(args.model)
+    if model_file.error:
+        print(f"Модель оценки не загружена ({args.model}): {model_file.error}", file=sys.stderr)
+        return 2
+    template_text = DEFAULT_TEMPLATE
+    if args.template:
+        with open(args.template, encoding="utf-8") as f:
+            template_text = f.read()
+    try:
+        Template(template_text)
+    except ValueError as e:
+        print(f"Ошибка шаблона: {e}", file=sys.stderr)
+        return 2
+
+    started = time.perf_counter()
+    output = open_output(args.output)
+    try:
+        with batch._open_input(args.input) as src:
+            total, rejected = report_stream(src, output, fmt, template_text,
+                                            model_file.model.data, args.pdf,
+                                            args.workers or os.cpu_count() or 1,
+                                            args.chunk_size)
+    finally:
+        output.close()
+    batch.report(total, rejected, time.perf_counter() - started)
+    return 0
+
+
+def add_arguments(parser):
+    parser.add_argument("input", nargs="?", default="-",
+                        help="входной файл CSV/JSONL (по умолчанию stdin)")
+    parser.add_argument("-o", "--output", required=True,
+                        help="каталог листов или архив .zip")
+    parser.add_argument("-f", "--format", choices=batch.FORMATS,
+                        help="формат входа (по умолчанию по расширению, иначе csv)")
+    parser.add_argument("--pdf", action="store_true", help="листы в PDF вместо HTML")
+    parser.add_argument("--template", help="файл шаблона HTML с полями {name}, {result} и т.д.")
+    parser.add_argument("--model", default=model.DEFAULT_PATH,
+                        help="файл модели оценки (по умолчанию %(default)s, "
+                             "без файла - встроенная модель)")
+    parser.add_argument("--chunk-size", type=batch.count_argument(1), default=CHUNK_SIZE,
+                        help="число строк в блоке (по умолчанию %(default)s)")
+    parser.add_argument("-j", "--workers", type=batch.count_argument(0), default=0,
+                        help="число процессов; 0 - по числу ядер (по умолчанию %(default)s)")
+    parser.set_defaults(func=run)
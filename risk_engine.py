@@ -0,0 +1,436 @@
+"""Расчёт риска COVID-19 без зависимости от Qt.
+
+Все правила оценки (возрастные диапазоны, диапазоны ИМТ, баллы факторов и
+пороги уровней риска) хранятся здесь в виде таблиц. Один пациент считается
+функцией score(), массив пациентов - одним векторизованным вызовом
+score_batch(). Факторы риска кодируются битовой маской: бит i соответствует
+FACTORS[i]. Эти таблицы - встроенная модель; модели из файлов (model.py)
+переопределяют баллы, пороги и рекомендации.
+"""
+from collections import namedtuple
+from functools import lru_cache
+from itertools import combinations
+
+
+# (нижняя граница, баллы) - по убыванию, как в исходной цепочке if/elif
+AGE_BANDS = ((65, 4), (50, 3), (40, 2), (30, 1))
+BMI_BANDS = ((40, 3), (35, 2), (30, 1))
+
+
+def band_labels(bands):
+    """Подписи диапазонов по возрастанию: "<30", "30–39", ..., "65+"."""
+    lowers = [lower for lower, _ in reversed(bands)]
+    labels = [f"<{lowers[0]}"]
+    for lower, upper in zip(lowers, lowers[1:]):
+        labels.append(f"{lower}–{upper - 1}")
+    labels.append(f"{lowers[-1]}+")
+    return labels
+
+
+def band_index(value, bands):
+    """Номер диапазона в порядке band_labels"""
+    for i, (lower, _) in enumerate(bands):
+        if value >= lower:
+            return len(bands) - i
+    return 0
+
+
+# Общие подписи для сводок по истории (stats) и по архиву (archive)
+AGE_LABELS = band_labels(AGE_BANDS)
+BMI_LABELS = band_labels(BMI_BANDS)
+
+# Реестр факторов риска. Порядок задаёт номер бита в маске, порядок
+# чекбоксов на страницах и порядок рекомендаций.
+#   key       - идентификатор фактора (ключ во входных файлах)
+#   label     - подпись чекбокса
+#   group     - ключ группы из FACTOR_GROUPS
+#   weight    - баллы риска
+#   advice    - рекомендация, если фактор отмечен
+#   missing_advice   - рекомендация, если фактор не отмечен
+#   advice_condition - (ключ фактора, возраст): missing_advice выдаётся,
+#                      только если отмечен этот фактор или возраст не меньше
+Factor = namedtuple("Factor", "key label group weight advice missing_advice advice_condition",
+                    defaults=(None, None, None))
+
+# (ключ, заголовок группы); группа без заголовка - чекбоксы вне рамки
+FACTOR_GROUPS = (
+    ("chronic", "Хронические заболевания"),
+    ("immune", "Иммунный статус"),
+    ("vaccine", "Вакцинация"),
+    ("habits", "Вредные привычки"),
+    ("activity", "Физическая активность"),
+    ("psycho", "Психологическое состояние"),
+    ("contacts", "Контакты и профессия"),
+    ("pregnancy", None),
+)
+
+FACTORS = (
+    Factor("diabetes", "Сахарный диабет", "chronic", 3),
+    Factor("hypertension", "Артериальная гипертензия", "chronic", 2),
+    Factor("cvd", "Сердечно-сосудистые заболевания", "chronic", 3),
+    Factor("lung_disease", "Хронические болезни лёгких", "chronic", 3),
+    Factor("kidney", "Хроническая болезнь почек", "chronic", 3),
+    Factor("liver", "Хронические заболевания печени", "chronic", 2),
+    Factor("cancer", "Онкологические заболевания", "chronic", 4),
+    Factor("autoimmune", "Аутоиммунные заболевания", "chronic", 2),
+
+    Factor("immune", "Первичный иммунодефицит", "immune", 4),
+    Factor("hiv", "ВИЧ/СПИД", "immune", 4),
+    Factor("transplant", "Трансплантация органов", "immune", 5),
+    Factor("steroids", "Длительный приём кортикостероидов", "immune", 3),
+    Factor("chemotherapy", "Химиотерапия", "immune", 4),
+
+    # Вакцинация снижает риск
+    Factor("vaccine", "Вакцинация от COVID-19 (последние 6 мес.)", "vaccine", -3,
+           missing_advice="💉 Сделайте прививку от COVID-19 как можно скорее"),
+    Factor("flu_vaccine", "Вакцинация от гриппа (последний год)", "vaccine", -1,
+           missing_advice="💉 Рекомендуется вакцинация от гриппа"),
+    Factor("pneumo_vaccine", "Вакцинация от пневмококка", "vaccine", -1,
+           missing_advice="💉 Рекомендуется вакцинация от пневмококка",
+           advice_condition=("lung_disease", 65)),
+
+    Factor("smoking", "Курение (текущее или в прошлом)", "habits", 2,
+           advice="🚭 Настоятельно рекомендуется бросить курить"),
+    Factor("alcohol", "Злоупотребление алкоголем", "habits", 1,
+           advice="🍷 Ограничьте потребление алкоголя"),
+    Factor("drugs", "Употребление наркотических веществ", "habits", 2),
+
+    Factor("sedentary", "Малоподвижный образ жизни", "activity", 1,
+           advice="🏃 Начните регулярные физические упражнения"),
+    Factor("no_sport", "Отсутствие регулярных физических нагрузок", "activity", 1),
+
+    Factor("stress", "Хронический стресс", "psycho", 1,
+           advice="🧘 Практикуйте техники релаксации и снижения стресса"),
+    Factor("depression", "Депрессия", "psycho", 1),
+    Factor("sleep", "Нарушения сна", "psycho", 1,
+           advice="😴 Нормализуйте режим сна (7-9 часов ежедневно)"),
+
+    Factor("contacts", "Контакт с больными COVID-19", "contacts", 2),
+    Factor("medic", "Работа в медицинской сфере", "contacts", 2),
+    Factor("crowd", "Частое нахождение в местах скопления людей", "contacts", 1),
+    Factor("travel", "Недавние поездки в зоны риска", "contacts", 1),
+
+    # Учитывается только для женщин
+    Factor("pregnancy", "Беременность (для женщин)", "pregnancy", 2),
+)
+
+# (нижняя граница баллов, подпись, цвет) - по убыванию
+TIERS = (
+    (15, "🔴 Очень высокий", "darkred"),
+    (10, "🔴 Высокий", "red"),
+    (6, "🟡 Повышенный", "orange"),
+    (3, "🟢 Умеренный", "green"),
+    (None, "🟢 Низкий", "darkgreen"),
+)
+
+FACTOR_BITS = {factor.key: i for i, factor in enumerate(FACTORS)}
+FACTOR_WEIGHTS = tuple(factor.weight for factor in FACTORS)
+# Названия для истории - подписи без пояснений в скобках
+FACTOR_NAMES = tuple(factor.label.split(" (")[0] for factor in FACTORS)
+NO_FACTORS = "Нет факторов риска"
+PREGNANCY_BIT = 1 << FACTOR_BITS["pregnancy"]
+# Версия встроенной модели в записях истории
+BUILTIN_MODEL = "builtin"
+ALL_FACTORS_MASK = (1 << len(FACTORS)) - 1
+
+
+def factor_mask(keys):
+    """Битовая маска по ключам факторов; неизвестный ключ - ValueError"""
+    mask = 0
+    for key in keys:
+        try:
+            mask |= 1 << FACTOR_BITS[key]
+        except KeyError:
+            raise ValueError(f"неизвестный фактор риска: {key!r}") from None
+    return mask
+
+
+def factor_keys(mask):
+    return [factor.key for i, factor in enumerate(FACTORS) if mask >> i & 1]
+
+
+def factor_names(mask):
+    names = [name for i, name in enumerate(FACTOR_NAMES) if mask >> i & 1]
+    return names if names else [NO_FACTORS]
+
+
+def parse_inputs(age_text, weight_text, height_text):
+    """Разбор полей ввода так же, как это делал calculate_risk.
+
+    Возвращает (возраст, ИМТ). Ошибки разбора - ValueError или
+    ArithmeticError (нулевой или слишком большой рост).
+    """
+    age = int(age_text)
+    return age, parse_bmi(weight_text, height_text)
+
+
+def parse_bmi(weight_text, height_text):
+    weight = float(weight_text)
+    height = float(height_text) / 100
+    return weight / (height ** 2)
+
+
+def _band_points(value, bands):
+    for lower, points in bands:
+        if value >= lower:
+            return points
+    return 0
+
+
+def factor_points(mask, is_female):
+    if not is_female:
+        mask &= ~PREGNANCY_BIT
+    return sum(FACTOR_WEIGHTS[i] for i in range(len(FACTORS)) if mask >> i & 1)
+
+
+def score(age, bmi, is_female, mask):
+    """Сумма баллов риска для одного пациента"""
+    return (_band_points(age, AGE_BANDS) + _band_points(bmi, BMI_BANDS)
+            + factor_points(mask, is_female))
+
+
+class LiveScore:
+    """Сумма баллов, которая пересчитывается по одному изменению.
+
+    Каждый set_* стоит O(1): меняется только вклад изменившегося поля.
+    Пока возраст или ИМТ не разобраны, score равен None. model -
+    model.ScoringModel вместо встроенных таблиц.
+    """
+
+    def __init__(self, model=None):
+        self.age_bands = AGE_BANDS if model is None else model.age_bands
+        self.bmi_bands = BMI_BANDS if model is None else model.bmi_bands
+        self.weights = FACTOR_WEIGHTS if model is None else model.weights
+        self.age_points = None
+        self.bmi_points = None
+        self.is_female = False
+        self.mask = 0
+        self.factor_points = 0
+
+    def set_age(self, age):
+        self.age_points = None if age is None else _band_points(age, self.age_bands)
+
+    def set_bmi(self, bmi):
+        self.bmi_points = None if bmi is None else _band_points(bmi, self.bmi_bands)
+
+    def set_female(self, is_female):
+        if is_female != self.is_female and self.mask & PREGNANCY_BIT:
+            weight = self.weights[FACTOR_BITS["pregnancy"]]
+            self.factor_points += weight if is_female else -weight
+        self.is_female = is_female
+
+    def set_factor(self, bit, checked):
+        if bool(self.mask >> bit & 1) == checked:
+            return
+        self.mask ^= 1 << bit
+        if bit != FACTOR_BITS["pregnancy"] or self.is_female:
+            weight = self.weights[bit]
+            self.factor_points += weight if checked else -weight
+
+    @property
+    def score(self):
+        if self.age_points is None or self.bmi_points is None:
+            return None
+        return self.age_points + self.bmi_points + self.factor_points
+
+
+def tier_index(risk_score):
+    """Номер строки TIERS для заданной суммы баллов"""
+    for i, (lower, _, _) in enumerate(TIERS):
+        if lower is None or risk_score >= lower:
+            return i
+
+
+def result_html(risk_score, tier=None):
+    """tier - номер строки TIERS, если уровень уже известен"""
+    _, risk, color = TIERS[tier_index(risk_score) if tier is None else tier]
+    return f'<span style="color: {color}; font-weight: bold;">{risk} риск (баллов: {risk_score})</span>'
+
+
+def _recommendation_mask(factors=FACTORS):
+    mask = 0
+    for i, factor in enumerate(factors):
+        if factor.advice or factor.missing_advice:
+            mask |= 1 << i
+        if factor.advice_condition:
+            mask |= 1 << FACTOR_BITS[factor.advice_condition[0]]
+    return mask
+
+
+# Факторы, от которых зависят рекомендации: маска & RECOMMENDATION_MASK,
+# уровень баллов и признак age >= 65 полностью определяют список
+RECOMMENDATION_MASK = _recommendation_mask()
+
+
+def recommendations(risk_score, age, mask, factors=FACTORS, tiers=TIERS):
+    """Рекомендации по баллам и факторам. factors и tiers - таблицы модели;
+    общие советы зависят от уровня: высокий и выше, повышенный, низкий"""
+    result = []
+
+    if risk_score >= tiers[1][0]:
+        result.append("🔴 Срочно проконсультируйтесь с врачом!")
+        result.append("🔴 Максимально ограничьте контакты с другими людьми")
+    elif risk_score >= tiers[2][0]:
+        result.append("🟡 Рекомендуется консультация врача")
+        result.append("🟡 Избегайте людных мест, носите маску")
+
+    # Рекомендации по факторам - в порядке реестра
+    for i, factor in enumerate(factors):
+        if mask >> i & 1:
+            if factor.advice:
+                result.append(factor.advice)
+        elif factor.missing_advice:
+            condition = factor.advice_condition
+            if condition is None or mask >> FACTOR_BITS[condition[0]] & 1 or age >= condition[1]:
+                result.append(factor.missing_advice)
+
+    # Общие рекомендации
+    result.append("🧼 Соблюдайте гигиену рук и социальную дистанцию")
+    result.append("🔄 Регулярно проветривайте помещения")
+
+    if risk_score < tiers[3][0]:
+        result.append("🟢 Продолжайте соблюдать меры профилактики")
+
+    return result
+
+
+# --- Векторизованный расчёт ---------------------------------------------
+
+# numpy импортируется при первом векторном вызове: окну калькулятора он не
+# нужен, а его импорт заметно удлиняет запуск
+np = None
+
+
+def _band_table(bands):
+    lowers = tuple(lower for lower, _ in reversed(bands))
+    points = np.array([0] + [points for _, points in reversed(bands)], dtype=np.int32)
+    return lowers, points
+
+
+def _band_index(values, lowers):
+    # Число пройденных границ = номер диапазона. Сравнения, а не searchsorted,
+    # чтобы NaN, как и в скалярной версии, не попадал ни в один диапазон
+    index = np.zeros(values.shape, dtype=np.intp)
+    for lower in lowers:
+        index += values >= lower
+    return index
+
+
+def _byte_tables(factor_weights=FACTOR_WEIGHTS):
+    # Маска разбивается на 4 байта, для каждого байта заранее посчитана
+    # сумма баллов всех 256 комбинаций битов
+    bits = (np.arange(256)[:, None] >> np.arange(8)) & 1
+    weights = np.zeros(32, dtype=np.int32)
+    weights[:len(FACTORS)] = factor_weights
+    return [(bits @ weights[8 * i:8 * i + 8]).astype(np.int32) for i in range(4)]
+
+
+def vector_tables(age_bands=AGE_BANDS, bmi_bands=BMI_BANDS, factor_weights=FACTOR_WEIGHTS,
+                  tiers=TIERS):
+    """Таблицы score_batch и tier_batch для заданных баллов и порогов"""
+    global np
+    import numpy as np
+    age_lowers, age_points = _band_table(age_bands)
+    bmi_lowers, bmi_points = _band_table(bmi_bands)
+    tier_lowers = np.array([lower for lower, _, _ in reversed(tiers[:-1])])
+    return (age_lowers, age_points, bmi_lowers, bmi_points, _byte_tables(factor_weights),
+            tier_lowers)
+
+
+@lru_cache(maxsize=None)
+def _vector_tables():
+    return vector_tables()
+
+
+def score_batch(age, bmi, is_female, mask, tables=None):
+    """Суммы баллов для массивов пациентов одинаковой длины.
+
+    age и bmi - числовые массивы, is_female - булев массив,
+    mask - массив битовых масок факторов (uint32); tables - результат
+    vector_tables(), по умолчанию встроенные таблицы.
+    """
+    age_lowers, age_points, bmi_lowers, bmi_points, byte_points, _ = \
+        tables or _vector_tables()
+    age = np.asarray(age)
+    bmi = np.asarray(bmi, dtype=np.float64)
+    mask = np.asarray(mask, dtype=np.uint32)
+    mask = np.where(np.asarray(is_female, dtype=bool), mask,
+                    mask & np.uint32(~PREGNANCY_BIT & 0xFFFFFFFF))
+
+    result = age_points[_band_index(age, age_lowers)]
+    result += bmi_points[_band_index(bmi, bmi_lowers)]
+    for i, table in enumerate(byte_points):
+        result += table[(mask >> np.uint32(8 * i)) & np.uint32(0xFF)]
+    return result
+
+
+def tier_batch(scores, tables=None):
+    """Номера строк TIERS для массива сумм баллов"""
+    tier_lowers = (tables or _vector_tables())[-1]
+    return len(TIERS) - 1 - np.searchsorted(tier_lowers, scores, side="right")
+
+
+# --- Анализ «что если» ---------------------------------------------------
+
+# Факторы, которые пациент может изменить сам
+MODIFIABLE_FACTORS = ("vaccine", "smoking", "alcohol", "sedentary", "stress", "sleep")
+# Все одиночные и парные переключения этих факторов и их маски для XOR
+WHAT_IF_TOGGLES = tuple([(key,) for key in MODIFIABLE_FACTORS]
+                        + list(combinations(MODIFIABLE_FACTORS, 2)))
+WHAT_IF_MASKS = tuple(factor_mask(keys) for keys in WHAT_IF_TOGGLES)
+# Модифицируемые факторы, которые полезно отметить; остальные полезно снять
+HEALTHY_MASK = factor_mask(("vaccine",))
+
+
+def what_if_allowed(mask):
+    """Какие из WHAT_IF_TOGGLES меняют факторы только в здоровую сторону:
+    ставят вакцинацию и снимают вредные факторы, а не наоборот. Матрица
+    (пациенты x переключения) для массива масок"""
+    _vector_tables()
+    unhealthy = np.asarray(mask, dtype=np.uint32) ^ np.uint32(HEALTHY_MASK)
+    toggles = np.array(WHAT_IF_MASKS, dtype=np.uint32)
+    return (toggles & ~unhealthy[:, None]) == 0
+
+
+def what_if_batch(age, bmi, is_female, mask, model=None):
+    """Баллы при каждом переключении WHAT_IF_TOGGLES для массива пациентов.
+
+    Все варианты всех пациентов считаются одним вызовом score_batch;
+    результат - матрица (пациенты x переключения). model -
+    model.ScoringModel вместо встроенных таблиц.
+    """
+    _vector_tables()
+    scorer = score_batch if model is None else model.score_batch
+    mask = np.asarray(mask, dtype=np.uint32)
+    toggles = np.array(WHAT_IF_MASKS, dtype=np.uint32)
+    count = len(toggles)
+    scores = scorer(np.repeat(age, count), np.repeat(bmi, count),
+                    np.repeat(is_female, count), (mask[:, None] ^ toggles).ravel())
+    return scores.reshape(len(mask), count)
+
+
+def what_if(age, bmi, is_female, mask, limit=None, model=None):
+    """Переключения в здоровую сторону (what_if_allowed), снижающие баллы
+    пациента, лучшие первыми.
+
+    Список (ключи факторов, новые баллы, номер строки TIERS); при равных
+    баллах первым идёт вариант с меньшим числом изменений.
+    """
+    current = (score if model is None else model.score)(age, bmi, is_female, mask)
+    scores = what_if_batch([age], [bmi], [is_female], [mask], model)[0]
+    tiers = (tier_batch if model is None else model.tier_batch)(scores)
+    allowed = what_if_allowed([mask])[0]
+    result = [(keys, int(new), int(tier))
+              for keys, new, tier, ok in zip(WHAT_IF_TOGGLES, scores, tiers, allowed)
+              if ok and new < current]
+    result.sort(key=lambda item: (item[1], len(item[0])))
+    return result[:limit]
+
+
+def what_if_text(keys, mask):
+    """Описание переключения, например «− Курение, + Вакцинация от COVID-19»"""
+    parts = []
+    for key in keys:
+        bit = FACTOR_BITS[key]
+        parts.append(("− " if mask >> bit & 1 else "+ ") + FACTOR_NAMES[bit])
+    return ", ".join(parts)
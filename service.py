@@ -0,0 +1,269 @@
+"""HTTP-сервис оценки риска на asyncio для терминалов и внешних систем.
+
+    POST /score        - одна запись (поля как у batch: age, sex, weight, height, factors)
+    POST /score/batch  - {"records": [...]} или список записей
+    GET  /health
+
+Запросы проходят через ограниченную очередь: если она заполнена, сервис сразу
+отвечает 503. Обработчик очереди собирает одиночные запросы, накопившиеся за
+время предыдущего расчёта, и оценивает их одним векторным вызовом. Время
+обработки запроса возвращается в заголовках X-Response-Time и Server-Timing.
+
+Оценка - по модели из файла --model, как в окне: файл перечитывается при
+изменении, версия модели возвращается в каждом результате и в /health.
+"""
+import asyncio
+import json
+import sys
+import time
+
+import batch
+import model
+
+
+QUEUE_SIZE = 1024
+MAX_COALESCE = 256
+MAX_HEADER = 64 * 1024
+MAX_BODY = 16 * 1024 * 1024
+ERROR_TEXT = "⚠️ Ошибка: проверьте введённые данные!"
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 422: "Unprocessable Entity",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ScoringService:
+    def __init__(self, host="127.0.0.1", port=8080, queue_size=QUEUE_SIZE,
+                 model_path=model.DEFAULT_PATH):
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.model_file = model.ModelFile(model_path)
+        self.queue = None
+        self.server = None
+        self.worker = None
+        self.connections = set()
+
+    async def start(self):
+        self.queue = asyncio.Queue(self.queue_size)
+        self.worker = asyncio.create_task(self.process_queue())
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port,
+                                                 limit=MAX_HEADER)
+        # При port=0 система выбирает свободный порт
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        for task in self.connections:
+            task.cancel()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await self.server.wait_closed()
+        self.worker.cancel()
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Сервис оценки риска: http://{self.host}:{self.port}", file=sys.stderr)
+        async with self.server:
+            await self.server.serve_forever()
+
+    # --- Очередь расчётов --------------------------------------------------
+
+    async def submit(self, kind, payload):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((kind, payload, future))
+        except asyncio.QueueFull:
+            raise HttpError(503, "очередь запросов заполнена") from None
+        return await future
+
+    async def process_queue(self):
+        while True:
+            jobs = [await self.queue.get()]
+            while len(jobs) < MAX_COALESCE and not self.queue.empty():
+                jobs.append(self.queue.get_nowait())
+
+            self.reload_model()
+            singles = [job for job in jobs if job[0] == "single"]
+            if singles:
+                self.score_singles(singles)
+            for job in jobs:
+                if job[0] == "batch":
+                    self.score_batch(job)
+            # Отдаём управление обработчикам соединений между пачками
+            await asyncio.sleep(0)
+
+    def reload_model(self):
+        # Если изменённый файл не загрузился, остаётся прежняя модель
+        if self.model_file.reload() and self.model_file.error:
+            print(f"Модель оценки не загружена ({self.model_file.path}): "
+                  f"{self.model_file.error}", file=sys.stderr)
+
+    # Ошибка расчёта не должна останавливать обработчик очереди: иначе
+    # ни один следующий запрос не получит ответа
+
+    def score_batch(self, job):
+        _, payload, future = job
+        if future.done():
+            return
+        try:
+            results, rejected = batch.score_chunk(payload, scoring_model=self.model_file.model)
+        except Exception as e:
+            _fail([job], e)
+            return
+        future.set_result({"results": [_result(r) for r in results], "rejected": rejected})
+
+    def score_singles(self, jobs):
+        try:
+            results, _ = batch.score_chunk([payload for _, payload, _ in jobs],
+                                           scoring_model=self.model_file.model)
+        except Exception as e:
+            if len(jobs) == 1:
+                _fail(jobs, e)
+            else:
+                # Виновную запись не найти - оцениваем собранные запросы по одному
+                for job in jobs:
+                    self.score_singles([job])
+            return
+        by_row = {r["row"]: r for r in results}
+        for row, (_, _, future) in enumerate(jobs, 1):
+            if future.done():
+                continue
+            if row in by_row:
+                result = _result(by_row[row])
+                del result["row"]
+                future.set_result(result)
+            else:
+                future.set_exception(HttpError(422, ERROR_TEXT))
+
+    # --- HTTP --------------------------------------------------------------
+
+    async def handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.respond(writer, 413, {"error": "слишком большой заголовок"},
+                                       time.perf_counter(), False)
+                    break
+                started = time.perf_counter()
+                method, path, headers = _parse_head(head)
+                keep_alive = headers.get("connection", "").lower() != "close"
+
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {"error": "слишком большое тело запроса"},
+                                       started, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                try:
+                    status, payload = 200, await self.route(method, path, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": str(e)}
+                await self.respond(writer, status, payload, started, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            pass  # сервис останавливается
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    async def route(self, method, path, body):
+        if path == "/health":
+            return {"status": "ok", "queue": self.queue.qsize(),
+                    "model": self.model_file.model.version}
+        if path not in ("/score", "/score/batch"):
+            raise HttpError(404, "неизвестный путь")
+        if method != "POST":
+            raise HttpError(405, "ожидается POST")
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise HttpError(400, "тело запроса должно быть JSON") from None
+
+        if path == "/score":
+            if not isinstance(data, dict):
+                raise HttpError(400, "ожидается объект JSON")
+            return await self.submit("single", data)
+
+        records = data.get("records") if isinstance(data, dict) else data
+        if not isinstance(records, list):
+            raise HttpError(400, "ожидается список записей records")
+        return await self.submit("batch", records)
+
+    async def respond(self, writer, status, payload, started, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        elapsed = (time.perf_counter() - started) * 1000
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"X-Response-Time: {elapsed:.3f}ms\r\n"
+            f"Server-Timing: score;dur={elapsed:.3f}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        )
+        if status == 503:
+            head += "Retry-After: 1\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+
+
+def _parse_head(head):
+    lines = head.decode("latin-1").split("\r\n")
+    method, path, _ = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    return method, path.split("?", 1)[0], headers
+
+
+def _fail(jobs, error):
+    print(f"Ошибка расчёта: {error!r}", file=sys.stderr)
+    for _, _, future in jobs:
+        if not future.done():
+            future.set_exception(HttpError(500, "внутренняя ошибка расчёта"))
+
+
+def _result(result):
+    return dict(result, recommendations=list(result["recommendations"]))
+
+
+def run(args):
+    service = ScoringService(args.host, args.port, args.queue_size, args.model)
+    if service.model_file.error:
+        print(f"Модель оценки не загружена ({args.model}): {service.model_file.error}",
+              file=sys.stderr)
+        return 2
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def add_arguments(parser):
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="адрес (по умолчанию %(default)s)")
+    parser.add_argument("--port", type=int, default=8080,
+                        help="порт (по умолчанию %(default)s)")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="максимум запросов в очереди (по умолчанию %(default)s)")
+    batch.add_model_argument(parser)
+    parser.set_defaults(func=run)
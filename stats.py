@@ -0,0 +1,150 @@
+"""Сводная статистика по всем оценкам, которая ведётся нарастающим итогом.
+
+PopulationStats хранит только счётчики: число оценок по уровням риска,
+возрастным диапазонам и диапазонам ИМТ, по факторам и по баллам. Учёт
+новой оценки (add) стоит O(число факторов) и не читает историю. Счётчики
+сохраняются в JSON атомарно: во временный файл, затем os.replace.
+"""
+import json
+import os
+
+import risk_engine
+
+
+DEFAULT_PATH = "history_stats.json"
+FORMAT_VERSION = 1
+
+
+def write_snapshot(data, path, fsync=False):
+    """Атомарная запись словаря to_dict(): временный файл, затем замена"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def update_snapshot(records, path=DEFAULT_PATH, fsync=False, expected=None):
+    """Учитывает записи в файле счётчиков. Если файла нет, ничего не
+    делает: счётчики пересчитают по истории. Копии программы с общей
+    историей вызывают её под блокировкой записи истории, поэтому учёт
+    одной копии не затирает учёт другой.
+
+    expected - сколько оценок должно быть в файле до учёта records. Файл с
+    другим числом (в нём учтены записи откатившейся транзакции) удаляется.
+    Возвращает число оценок в файле или None, если файла нет.
+    """
+    stats = PopulationStats.load(path)
+    if stats is not None and expected is not None and stats.count != expected:
+        os.remove(path)
+        return None
+    if stats is None:
+        return None
+    for record in records:
+        stats.add(record)
+    stats.save(path, fsync)
+    return stats.count
+
+
+# Подписи диапазонов - общие с archive.summary
+AGE_LABELS = risk_engine.AGE_LABELS
+BMI_LABELS = risk_engine.BMI_LABELS
+
+
+class PopulationStats:
+    def __init__(self):
+        self.count = 0
+        self.score_sum = 0
+        self.tiers = [0] * len(risk_engine.TIERS)
+        self.age_bands = [0] * len(AGE_LABELS)
+        self.age_score_sums = [0] * len(AGE_LABELS)
+        self.bmi_bands = [0] * len(BMI_LABELS)
+        self.factors = [0] * len(risk_engine.FACTORS)
+        # баллы -> число оценок
+        self.scores = {}
+
+    def add(self, record):
+        """Учитывает запись истории (history_store.HistoryRecord)"""
+        score = record.score
+        self.count += 1
+        self.score_sum += score
+        self.tiers[record.tier] += 1
+        age = risk_engine.band_index(record.age, risk_engine.AGE_BANDS)
+        self.age_bands[age] += 1
+        self.age_score_sums[age] += score
+        try:
+            bmi = record.weight / (record.height / 100) ** 2
+        except ZeroDivisionError:
+            bmi = float("inf")
+        self.bmi_bands[risk_engine.band_index(bmi, risk_engine.BMI_BANDS)] += 1
+        mask = record.factors
+        while mask:
+            bit = mask & -mask
+            self.factors[bit.bit_length() - 1] += 1
+            mask ^= bit
+        self.scores[score] = self.scores.get(score, 0) + 1
+
+    @classmethod
+    def from_records(cls, records):
+        stats = cls()
+        for record in records:
+            stats.add(record)
+        return stats
+
+    def mean_score(self):
+        return self.score_sum / self.count if self.count else None
+
+    def mean_score_by_age(self):
+        return [total / n if n else None
+                for total, n in zip(self.age_score_sums, self.age_bands)]
+
+    def prevalence(self):
+        """Доля оценок с каждым фактором"""
+        return [n / self.count if self.count else 0.0 for n in self.factors]
+
+    # --- Сохранение --------------------------------------------------------
+
+    def to_dict(self):
+        return {
+            "version": FORMAT_VERSION,
+            "count": self.count,
+            "score_sum": self.score_sum,
+            "tiers": self.tiers,
+            "age_bands": self.age_bands,
+            "age_score_sums": self.age_score_sums,
+            "bmi_bands": self.bmi_bands,
+            # По ключу: порядок факторов в реестре может поменяться
+            "factors": {factor.key: n for factor, n in zip(risk_engine.FACTORS, self.factors)},
+            "scores": {str(score): n for score, n in sorted(self.scores.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise ValueError("файл статистики должен содержать словарь")
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"неподдерживаемая версия статистики: {data.get('version')}")
+        stats = cls()
+        stats.count = data["count"]
+        stats.score_sum = data["score_sum"]
+        stats.tiers = list(data["tiers"])
+        stats.age_bands = list(data["age_bands"])
+        stats.age_score_sums = list(data["age_score_sums"])
+        stats.bmi_bands = list(data["bmi_bands"])
+        stats.factors = [data["factors"].get(factor.key, 0) for factor in risk_engine.FACTORS]
+        stats.scores = {int(score): n for score, n in data["scores"].items()}
+        return stats
+
+    def save(self, path=DEFAULT_PATH, fsync=False):
+        write_snapshot(self.to_dict(), path, fsync)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        """Счётчики из файла; None, если файла нет или он повреждён"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
@@ -0,0 +1,70 @@
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QTreeWidget, QTreeWidgetItem
+from PyQt5.QtGui import QColor
+
+import risk_engine
+from stats import AGE_LABELS, BMI_LABELS
+
+
+class StatsDialog(QDialog):
+    """Сводка по всем оценкам. Строится из готовых счётчиков
+    PopulationStats, история при этом не читается"""
+
+    COLUMNS = ("Показатель", "Оценок", "Доля", "Средний балл")
+
+    def __init__(self, stats, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Статистика оценок")
+        self.resize(600, 700)
+
+        layout = QVBoxLayout()
+        if stats.count:
+            summary = f"Всего оценок: {stats.count}, средний балл: {stats.mean_score():.2f}"
+        else:
+            summary = "Оценок пока нет."
+        layout.addWidget(QLabel(summary))
+
+        # Простое дерево вместо HTML: разметка таблиц в QLabel заметно
+        # замедляет открытие окна
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(self.COLUMNS)
+        self.tree.setUniformRowHeights(True)
+        if stats.count:
+            self.fill(stats)
+        self.tree.expandAll()
+        self.tree.resizeColumnToContents(0)
+        layout.addWidget(self.tree)
+        self.setLayout(layout)
+
+    def add_section(self, title, rows, total):
+        """rows - (подпись, число оценок, цвет или None, средний балл или None)"""
+        section = QTreeWidgetItem(self.tree, [title])
+        for label, n, color, mean in rows:
+            share = n / total if total else 0
+            item = QTreeWidgetItem(section, [
+                label, str(n), f"{share:.1%}", "" if mean is None else f"{mean:.2f}"
+            ])
+            if color:
+                item.setForeground(0, QColor(color))
+
+    def fill(self, stats):
+        total = stats.count
+        self.add_section("Уровни риска", [
+            (label, n, color, None)
+            for (_, label, color), n in zip(risk_engine.TIERS, stats.tiers)
+        ], total)
+        self.add_section("Возраст", [
+            (label, n, None, mean)
+            for label, n, mean in zip(AGE_LABELS, stats.age_bands, stats.mean_score_by_age())
+        ], total)
+        self.add_section("ИМТ", [
+            (label, n, None, None) for label, n in zip(BMI_LABELS, stats.bmi_bands)
+        ], total)
+        factors = sorted(zip(risk_engine.FACTOR_NAMES, stats.factors), key=lambda item: -item[1])
+        self.add_section("Факторы риска", [
+            (name, n, None, None) for name, n in factors
+        ], total)
+        self.add_section("Баллы", [
+            (str(score), stats.scores[score],
+             risk_engine.TIERS[risk_engine.tier_index(score)][2], None)
+            for score in sorted(stats.scores)
+        ], total)
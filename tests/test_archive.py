@@ -0,0 +1,90 @@
+"""Архив оценок: дозапись столбцов, восстановление после обрыва и сводка"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+import archive
+import cli
+import risk_engine
+import stats
+
+from test_history_store import make_records
+
+
+@pytest.fixture
+def column_archive(tmp_path):
+    column_archive = archive.ColumnArchive(str(tmp_path / "archive"))
+    yield column_archive
+    column_archive.close()
+
+
+def test_append_and_read_columns(column_archive):
+    records = make_records(500)
+    column_archive.append_many(records[:200])
+    column_archive.append(records[200])
+    column_archive.append_many(records[201:])
+    columns = column_archive.columns()
+    assert column_archive.count() == 500
+    assert list(columns["ts"]) == [r.ts for r in records]
+    assert list(columns["factors"]) == [r.factors for r in records]
+    assert list(columns["score"]) == [r.score for r in records]
+    assert list(columns["female"]) == [r.is_female for r in records]
+    assert np.allclose(columns["weight"], [r.weight for r in records])
+
+
+def test_torn_append_is_repaired(tmp_path):
+    path = str(tmp_path / "archive")
+    column_archive = archive.ColumnArchive(path)
+    column_archive.append_many(make_records(10))
+    column_archive.close()
+    # Дозапись оборвалась: часть столбцов длиннее остальных
+    with open(os.path.join(path, "ts.bin"), "ab") as f:
+        f.write(b"\0" * 12)
+    assert archive.ColumnArchive(path, repair=False).count() == 10
+    column_archive = archive.ColumnArchive(path)
+    assert os.path.getsize(os.path.join(path, "ts.bin")) == 10 * 8
+    column_archive.truncate(4)
+    assert column_archive.count() == 4
+    column_archive.close()
+
+
+def test_unsupported_version(tmp_path):
+    path = tmp_path / "archive"
+    path.mkdir()
+    (path / "meta.json").write_text(json.dumps({"version": 99}), encoding="utf-8")
+    with pytest.raises(ValueError):
+        archive.ColumnArchive(str(path))
+
+
+def test_summary_matches_population_stats(column_archive, monkeypatch):
+    records = make_records(3000)
+    column_archive.append_many(records)
+    # Несколько блоков сканирования
+    monkeypatch.setattr(archive, "SCAN_CHUNK", 700)
+    summary = column_archive.summary()
+    population = stats.PopulationStats.from_records(records)
+
+    assert summary["count"] == population.count
+    assert summary["mean_score"] == pytest.approx(population.mean_score())
+    assert list(summary["tiers"].values()) == population.tiers
+    assert list(summary["tiers"]) == [label for _, label, _ in risk_engine.TIERS]
+    # Подписи и состав возрастных диапазонов - как в сводной статистике
+    assert list(summary["mean_score_by_age"]) == stats.AGE_LABELS
+    for mean, expected in zip(summary["mean_score_by_age"].values(),
+                              population.mean_score_by_age()):
+        assert mean == pytest.approx(expected)
+    for (key, share), expected in zip(summary["factor_prevalence"].items(),
+                                      population.prevalence()):
+        assert share == pytest.approx(expected), key
+
+
+def test_archive_stats_command(tmp_path, capsys):
+    path = str(tmp_path / "archive")
+    column_archive = archive.ColumnArchive(path)
+    column_archive.append_many(make_records(20))
+    column_archive.close()
+    assert cli.main(["archive-stats", path]) == 0
+    assert json.loads(capsys.readouterr().out)["count"] == 20
+    assert archive.ColumnArchive(str(tmp_path / "empty")).summary() == {"count": 0}
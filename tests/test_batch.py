@@ -0,0 +1,120 @@
+"""Пакетная оценка: отклонение некорректных записей, модель из файла и
+совпадение параллельного режима с однопроцессным"""
+import io
+import json
+import random
+
+import pytest
+
+import batch
+import cli
+import model
+import parallel
+import risk_engine
+
+
+GOOD = {"name": "Иванов Иван", "age": 40, "sex": "m", "weight": 70, "height": 175,
+        "factors": ["diabetes"]}
+
+
+@pytest.mark.parametrize("changes", [
+    {"factors": [1]},
+    {"factors": [None]},
+    {"factors": [["diabetes"]]},
+    {"factors": 5},
+    {"factors": ["нет такого"]},
+    {"sex": "x"},
+    {"age": "35.5"},
+    {"age": None},
+    {"height": 0},
+    {"weight": "семьдесят"},
+])
+def test_malformed_record_is_rejected(changes):
+    results, rejected = batch.score_chunk([dict(GOOD, **changes), GOOD])
+    assert rejected == 1
+    assert [r["row"] for r in results] == [2]
+
+
+def test_missing_field_and_bad_lines_are_rejected():
+    record = dict(GOOD)
+    del record["age"]
+    lines = [json.dumps(record), "{не json", "[1, 2]", json.dumps(GOOD), ""]
+    src = io.StringIO("\n".join(lines) + "\n")
+    dst = io.StringIO()
+    assert batch.score_stream(src, dst, "jsonl") == (4, 3)
+    (result,) = [json.loads(line) for line in dst.getvalue().splitlines()]
+    assert result["row"] == 4
+    assert result["model"] == risk_engine.BUILTIN_MODEL
+
+
+def test_csv_factors_string():
+    src = io.StringIO("name,age,sex,weight,height,factors\n"
+                      "Иванов Иван,70,ж,80,160, diabetes ; smoking;\n")
+    dst = io.StringIO()
+    assert batch.score_stream(src, dst, "csv") == (1, 0)
+    header, row = dst.getvalue().splitlines()
+    assert header.split(",") == list(batch.OUTPUT_FIELDS)
+    expected = risk_engine.score(70, 80 / 1.6 ** 2, True,
+                                 risk_engine.factor_mask(["diabetes", "smoking"]))
+    assert row.split(",")[2] == str(expected)
+
+
+def test_model_file_is_used(tmp_path):
+    path = tmp_path / "model.json"
+    model.save({"format": model.FORMAT_VERSION, "version": "test-1",
+                "weights": {"diabetes": 10}, "tiers": [30, 20, 12, 6]}, path)
+    scoring_model = batch.load_model(str(path))
+    (result,), _ = batch.score_chunk([GOOD], scoring_model=scoring_model)
+    assert result["model"] == "test-1"
+    assert result["score"] == 2 + 10  # возраст 40 и диабет
+    assert result["tier"] == risk_engine.TIERS[2][1]
+
+    path.write_text('{"format": 1}', encoding="utf-8")
+    assert cli.main(["score", "-", "--model", str(path)]) == 2
+
+
+def _write_input(path, fmt, count):
+    rng = random.Random(5)
+    keys = list(risk_engine.FACTOR_BITS)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            f.write("name,age,sex,weight,height,factors\n")
+        for i in range(count):
+            record = {"name": f"Пациент {i}", "age": rng.randint(18, 95),
+                      "sex": rng.choice("мж"), "weight": rng.randint(40, 150),
+                      "height": rng.randint(150, 200),
+                      "factors": rng.sample(keys, rng.randint(0, 5))}
+            if i % 97 == 0:
+                record["age"] = "ошибка"
+            if fmt == "csv":
+                f.write(f"{record['name']},{record['age']},{record['sex']},{record['weight']},"
+                        f"{record['height']},{';'.join(record['factors'])}\n")
+            else:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if i % 500 == 0:
+                f.write("\n")  # пустые строки не сдвигают номера записей
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_parallel_output_equals_serial(tmp_path, fmt):
+    path = str(tmp_path / f"input.{fmt}")
+    _write_input(path, fmt, 3000)
+    with open(path, encoding="utf-8-sig", newline="") as src:
+        serial = io.StringIO()
+        expected_counts = batch.score_stream(src, serial, fmt, chunk_size=128)
+    for workers in (1, 2, 3):
+        dst = io.StringIO()
+        counts = parallel.score_file(path, dst, fmt, workers=workers, chunk_size=100,
+                                     shard_size=4096)
+        assert counts == expected_counts
+        assert dst.getvalue() == serial.getvalue()
+
+
+@pytest.mark.parametrize("option", [["-j", "-1"], ["-j", "два"], ["--chunk-size", "0"]])
+def test_invalid_counts_are_argument_errors(tmp_path, option, capsys):
+    path = tmp_path / "input.csv"
+    path.write_text("name,age,sex,weight,height,factors\n", encoding="utf-8")
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(["score", str(path)] + option)
+    assert exit_info.value.code == 2
+    assert option[0] in capsys.readouterr().err
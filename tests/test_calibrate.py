@@ -0,0 +1,168 @@
+"""Калибровка: разбор размеченного файла, AUC по гистограммам против
+перебора пар, поиск конфигурации, пороги уровней и файл модели"""
+import io
+import json
+import random
+
+import numpy as np
+import pytest
+
+import calibrate
+import cli
+import model
+import risk_engine
+
+
+def labelled(count, seed=5):
+    """Пациенты, у которых исход в основном определяется диабетом"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        factors = [factor.key for factor in risk_engine.FACTORS if rng.random() < 0.2]
+        age = rng.randint(18, 95)
+        bmi = rng.uniform(16, 45)
+        chance = 0.8 if "diabetes" in factors else 0.1
+        records.append({"name": f"Пациент {i}", "age": age, "sex": rng.choice("mf"),
+                        "weight": bmi * 1.7 ** 2, "height": 170, "factors": factors,
+                        "outcome": "да" if rng.random() < chance else "нет"})
+    return records
+
+
+def jsonl(records):
+    return io.StringIO("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+
+
+def brute_auc(records, score):
+    scores = {True: [], False: []}
+    for record in records:
+        bmi = record["weight"] / (record["height"] / 100) ** 2
+        mask = risk_engine.factor_mask(record["factors"])
+        scores[calibrate.parse_outcome(record["outcome"])].append(
+            score(record["age"], bmi, record["sex"] == "f", mask))
+    pairs = 0.0
+    for p in scores[True]:
+        for n in scores[False]:
+            pairs += 1.0 if p > n else 0.5 if p == n else 0.0
+    return pairs / (len(scores[True]) * len(scores[False]))
+
+
+@pytest.fixture(scope="module")
+def records():
+    return labelled(600)
+
+
+@pytest.fixture(scope="module")
+def patterns(records):
+    return calibrate.read_patterns(jsonl(records), "jsonl", chunk_size=128)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1", True), (" Да ", True), ("yes", True), (1, True),
+    ("0", False), ("НЕТ", False), ("false", False), (0, False),
+])
+def test_parse_outcome(value, expected):
+    assert calibrate.parse_outcome(value) is expected
+
+
+def test_parse_outcome_rejects_unknown():
+    with pytest.raises(ValueError):
+        calibrate.parse_outcome("может быть")
+
+
+def test_read_patterns_counts_and_rejects(records):
+    extra = [dict(records[0], outcome="?"), {k: v for k, v in records[1].items()
+                                               if k != "outcome"},
+             dict(records[2], age="много")]
+    patterns = calibrate.read_patterns(jsonl(records + extra), "jsonl", chunk_size=100)
+    assert patterns.patients == len(records)
+    assert patterns.rejected == 3
+    assert len(np.unique(patterns.keys)) == len(patterns)
+    positive = sum(calibrate.parse_outcome(r["outcome"]) for r in records)
+    assert patterns.positive.sum() == positive
+
+
+def test_auc_matches_pairwise_count(records, patterns):
+    evaluator = calibrate.Evaluator(patterns)
+    base = calibrate.current_config()
+    assert evaluator.auc(base[None, :])[0] == pytest.approx(
+        brute_auc(records, risk_engine.score))
+
+    # Другая конфигурация - через файл модели, который из неё получится
+    rng = np.random.default_rng(3)
+    configs = calibrate.random_configs(base, 4, 2, rng)
+    aucs = evaluator.auc(configs)
+    for config, auc in zip(configs, aucs):
+        scoring = model.ScoringModel(calibrate.model_dict(config, calibrate.current_thresholds()))
+        assert auc == pytest.approx(brute_auc(records, scoring.score))
+
+
+def test_random_configs_keep_signs_and_band_order():
+    rng = np.random.default_rng(1)
+    base = calibrate.current_config()
+    configs = calibrate.random_configs(base, 200, 3, rng)
+    assert (configs[0] == base).all()
+    factors = configs[:, :calibrate.FACTOR_COUNT]
+    weights = base[:calibrate.FACTOR_COUNT]
+    assert (factors[:, weights > 0] >= 0).all()
+    assert (factors[:, weights < 0] <= 0).all()
+    for part in (calibrate._AGE_SLICE, calibrate._BMI_SLICE):
+        bands = configs[:, part]
+        assert (bands >= 0).all()
+        assert (np.diff(bands, axis=1) >= 0).all()
+
+
+def test_search_is_reproducible_and_not_worse(patterns):
+    first = calibrate.search(patterns, count=400, rounds=2, seed=7)
+    second = calibrate.search(patterns, count=400, rounds=2, seed=7)
+    config, auc, base_auc = first
+    assert (config == second[0]).all()
+    assert (auc, base_auc) == second[1:]
+    assert auc >= base_auc
+    assert calibrate.Evaluator(patterns).auc(config[None, :])[0] == pytest.approx(auc)
+
+
+def test_fit_thresholds_respect_min_share(patterns):
+    config = calibrate.current_config()
+    thresholds = calibrate.fit_thresholds(patterns, config, min_share=0.1)
+    assert len(thresholds) == len(risk_engine.TIERS) - 1
+    assert thresholds == sorted(thresholds, reverse=True)
+    rows = calibrate.tier_report(patterns, config, thresholds)
+    assert sum(count for _, count, _, _ in rows) == patterns.patients
+    assert all(share >= 0.1 for _, _, share, _ in rows)
+
+
+def test_fit_thresholds_none_when_too_few_scores(patterns):
+    assert calibrate.fit_thresholds(patterns, calibrate.current_config(), min_share=0.5) is None
+
+
+def test_cli_writes_loadable_model(tmp_path, records, capsys):
+    source = tmp_path / "outcomes.jsonl"
+    source.write_text(jsonl(records).getvalue(), encoding="utf-8")
+    output = tmp_path / "model.json"
+    assert cli.main(["calibrate", str(source), "-o", str(output), "-n", "300",
+                     "--version", "test-1", "-j", "1"]) == 0
+    scoring = model.load(str(output))
+    assert scoring.version == "test-1"
+    data = json.loads(output.read_text(encoding="utf-8"))
+    assert data["patients"] == len(records)
+    patterns = calibrate.read_patterns(jsonl(records), "jsonl")
+    config = np.array([data["weights"][factor.key] for factor in risk_engine.FACTORS]
+                      + [points for _, points in reversed(data["age_bands"])]
+                      + [points for _, points in reversed(data["bmi_bands"])])
+    assert calibrate.Evaluator(patterns).auc(config[None, :])[0] == pytest.approx(data["auc"])
+    assert brute_auc(records, scoring.score) == pytest.approx(data["auc"])
+
+
+def test_cli_needs_both_outcomes(tmp_path):
+    source = tmp_path / "outcomes.jsonl"
+    records = [dict(record, outcome="нет") for record in labelled(20)]
+    source.write_text(jsonl(records).getvalue(), encoding="utf-8")
+    output = tmp_path / "model.json"
+    assert cli.main(["calibrate", str(source), "-o", str(output), "-j", "1"]) == 2
+    assert not output.exists()
+
+
+def test_cli_rejects_negative_workers(tmp_path):
+    with pytest.raises(SystemExit) as exc:
+        cli.main(["calibrate", str(tmp_path / "outcomes.jsonl"), "-j", "-1"])
+    assert exc.value.code == 2
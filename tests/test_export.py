@@ -0,0 +1,89 @@
+"""Выгрузка истории: содержимое CSV/JSONL/XLSX, листы XLSX и отмена"""
+import csv
+import io
+import json
+import os
+
+import pytest
+
+import batch
+import export
+import risk_engine
+from history_store import HistoryStore
+
+from test_history_store import make_records
+
+
+@pytest.fixture
+def history(tmp_path):
+    path = str(tmp_path / "history.db")
+    records = make_records(250)
+    records[3].name = "Имя\x01с управляющим & <знаком>"
+    store = HistoryStore(path)
+    store.append_many(records)
+    store.close()
+    return path, records
+
+
+def expected_rows(records):
+    return [[r.date, r.name, str(r.age), r.sex, str(r.weight), str(r.height),
+             ";".join(risk_engine.factor_keys(r.factors)), str(r.score),
+             risk_engine.TIERS[r.tier][1], r.model] for r in records]
+
+
+def test_csv_and_jsonl(history, tmp_path):
+    path, records = history
+    out = str(tmp_path / "history.csv")
+    assert export.export_history(out, history_path=path) == 250
+    with open(out, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == list(export.FIELDS)
+    assert rows[1:] == expected_rows(records)
+
+    out = str(tmp_path / "history.jsonl")
+    assert export.export_history(out, history_path=path) == 250
+    with open(out, encoding="utf-8") as f:
+        first = json.loads(f.readline())
+    assert first["factors"] == list(risk_engine.factor_keys(records[0].factors))
+    assert first["score"] == records[0].score
+
+
+def test_csv_can_be_rescored(history, tmp_path):
+    path, records = history
+    out = str(tmp_path / "history.csv")
+    export.export_history(out, history_path=path)
+    with open(out, encoding="utf-8-sig", newline="") as src:
+        dst = io.StringIO()
+        assert batch.score_stream(src, dst, "csv") == (250, 0)
+    scores = [int(row["score"]) for row in csv.DictReader(io.StringIO(dst.getvalue()))]
+    assert scores == [r.score for r in records]
+
+
+def test_xlsx_sheets(history, tmp_path, monkeypatch):
+    openpyxl = pytest.importorskip("openpyxl")
+    path, records = history
+    monkeypatch.setattr(export, "XLSX_MAX_ROWS", 101)
+    out = str(tmp_path / "history.xlsx")
+    assert export.export_history(out, history_path=path) == 250
+    book = openpyxl.load_workbook(out, read_only=True)
+    sheets = [list(sheet.values) for sheet in book.worksheets]
+    assert [len(rows) for rows in sheets] == [101, 101, 51]
+    rows = [row for rows in sheets for row in rows[1:]]
+    assert all(rows[0] == tuple(export.FIELDS) for rows in sheets)
+    assert [row[1] for row in rows] == [r.name.replace("\x01", "") for r in records]
+    assert [row[7] for row in rows] == [r.score for r in records]
+    book.close()
+
+
+def test_progress_and_cancel(history, tmp_path, monkeypatch):
+    path, _ = history
+    monkeypatch.setattr(export, "PROGRESS_EVERY", 100)
+    calls = []
+    out = str(tmp_path / "history.csv")
+    export.export_history(out, history_path=path,
+                          progress=lambda done, total: calls.append((done, total)))
+    assert calls == [(100, 250), (200, 250), (250, 250)]
+
+    with pytest.raises(export.Cancelled):
+        export.export_history(out, history_path=path, cancelled=lambda: True)
+    assert not os.path.exists(out)
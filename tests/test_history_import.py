@@ -0,0 +1,131 @@
+"""Импорт выгрузок истории: форматы записей, отклонение и дубли"""
+import io
+import json
+
+import pytest
+
+import export
+import history_import
+import risk_engine
+from history_store import HistoryStore
+
+from test_history_store import fields, make_records
+
+
+def legacy(record):
+    """Словарь, как его строил save_to_history первых версий: без баллов и
+    модели, баллы - только в тексте результата"""
+    data = record.to_dict()
+    del data["результат"]["баллы"]
+    del data["модель"]
+    return data
+
+
+def import_lines(path, lines, fmt="jsonl"):
+    importer = history_import.Importer(path)
+    try:
+        importer.import_stream(io.StringIO("\n".join(lines) + "\n"), fmt)
+    finally:
+        importer.close()
+    return importer
+
+
+@pytest.fixture
+def history_path(tmp_path):
+    return str(tmp_path / "history.db")
+
+
+def stored(path):
+    store = HistoryStore(path)
+    try:
+        return sorted(fields(record) for record in store.iter_records())
+    finally:
+        store.close()
+
+
+def test_legacy_and_flat_records(history_path):
+    records = make_records(60)
+    lines = [json.dumps(r.to_dict(), ensure_ascii=False) for r in records[:20]]
+    lines += [json.dumps(legacy(r), ensure_ascii=False) for r in records[20:40]]
+    # Без баллов и без текста результата баллы встроенной модели пересчитываются
+    for record in records[40:]:
+        data = legacy(record)
+        del data["результат"]["текст"]
+        lines.append(json.dumps(data, ensure_ascii=False))
+    importer = import_lines(history_path, lines)
+    assert (importer.total, importer.rejected, importer.added) == (60, 0, 60)
+    assert stored(history_path) == sorted(fields(r) for r in records)
+
+
+def test_legacy_result_text_is_not_trusted(history_path):
+    # Первые версии сохраняли запись до расчёта: текст результата - от
+    # предыдущего пациента, баллы пересчитываются по данным записи
+    records = make_records(50)
+    lines = []
+    for previous, record in zip(records[-1:] + records, records):
+        data = legacy(record)
+        data["результат"]["текст"] = risk_engine.result_html(previous.score, previous.tier)
+        lines.append(json.dumps(data, ensure_ascii=False))
+    assert import_lines(history_path, lines).added == 50
+    assert stored(history_path) == sorted(fields(r) for r in records)
+
+    # Для модели из файла пересчитать нельзя - баллы и уровень из текста
+    data = legacy(records[0])
+    data["модель"] = "другая"
+    data["результат"]["текст"] = risk_engine.result_html(25, 0)
+    other = str(history_path) + ".other"
+    assert import_lines(other, [json.dumps(data, ensure_ascii=False)]).added == 1
+    store = HistoryStore(other)
+    (imported,) = store.iter_records()
+    store.close()
+    assert (imported.score, imported.tier, imported.model) == (25, 0, "другая")
+
+
+def test_flat_csv(history_path):
+    (record,) = make_records(1)
+    src = ["ФИО,дата,возраст,пол,вес,рост,факторы,баллы",
+           f"{record.name},{record.date},{record.age},{record.sex},{record.weight:g},"
+           f"{record.height:g},{';'.join(record.factor_names()) or risk_engine.NO_FACTORS},"
+           f"{record.score}"]
+    importer = import_lines(history_path, src, "csv")
+    assert (importer.added, importer.rejected) == (1, 0)
+    assert stored(history_path) == [fields(record)]
+
+
+def test_rejected_records(history_path):
+    record = make_records(1)[0].to_dict()
+    bad = []
+    for section, key, value in [("данные", "возраст", "сорок"), ("данные", "пол", "?"),
+                                ("данные", "факторы", [1]), ("данные", "факторы", ["нет"]),
+                                ("данные", "вес", "inf"), (None, "дата", "вчера")]:
+        broken = json.loads(json.dumps(record))
+        (broken[section] if section else broken)[key] = value
+        bad.append(json.dumps(broken, ensure_ascii=False))
+    # Чужая модель без баллов и уровня - не восстановить
+    broken = json.loads(json.dumps(record))
+    broken["модель"] = "другая"
+    del broken["результат"]
+    bad.append(json.dumps(broken, ensure_ascii=False))
+    importer = import_lines(history_path, bad + ["[1]", "{не json"])
+    assert (importer.total, importer.rejected, importer.added) == (9, 9, 0)
+
+
+def test_duplicates_across_files_and_export_round_trip(history_path, tmp_path):
+    records = make_records(300)
+    first = [json.dumps(r.to_dict(), ensure_ascii=False) for r in records[:200]]
+    second = [json.dumps(legacy(r), ensure_ascii=False) for r in records[100:]]
+    assert import_lines(history_path, first).added == 200
+    importer = import_lines(history_path, second + second[:10])
+    assert (importer.added, importer.duplicates) == (100, 110)
+    expected = sorted(fields(r) for r in records)
+    assert stored(history_path) == expected
+
+    for fmt in ("csv", "jsonl"):
+        path = str(tmp_path / f"export.{fmt}")
+        export.export_history(path, fmt, history_path)
+        with open(path, encoding="utf-8-sig", newline="") as src:
+            lines = src.read().splitlines()
+        assert import_lines(history_path, lines, fmt).duplicates == 300
+        copy = str(tmp_path / f"copy_{fmt}.db")
+        assert import_lines(copy, lines, fmt).added == 300
+        assert stored(copy) == expected
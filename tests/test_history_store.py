@@ -0,0 +1,166 @@
+"""Хранилище истории: миграции схемы, дубли и поиск по индексам"""
+import itertools
+import json
+import random
+import sqlite3
+
+import pytest
+
+import history_store
+import risk_engine
+from history_store import HistoryRecord, HistoryStore
+
+
+# Даты в выгрузках - с точностью до минуты
+BASE_TS = 1_600_000_020
+
+
+def make_records(count, seed=3):
+    rng = random.Random(seed)
+    names = ["Иванов Иван", "иванова Анна", "Петров Пётр", "Сидоров", "Ёлкин Ёж"]
+    records = []
+    for i in range(count):
+        age = rng.randint(18, 95)
+        is_female = rng.random() < 0.5
+        weight, height = rng.randint(40, 150), rng.randint(150, 200)
+        mask = sum(1 << bit for bit in rng.sample(range(len(risk_engine.FACTORS)),
+                                                  rng.randint(0, 4)))
+        score = risk_engine.score(age, weight / (height / 100) ** 2, is_female, mask)
+        # Много записей с одинаковым временем - порядок задаёт ещё и id
+        records.append(HistoryRecord(rng.choice(names), BASE_TS + rng.randint(0, 50) * 60,
+                                     age, is_female, float(weight), float(height), mask, score))
+    return records
+
+
+def fields(record):
+    return (record.name, record.ts, record.age, record.is_female, record.weight,
+            record.height, record.factors, record.score, record.tier, record.model)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"))
+    yield store
+    store.close()
+
+
+def test_live_duplicates_are_kept(store):
+    record = make_records(1)[0]
+    assert store.append(record)
+    assert store.append(record)
+    assert store.append_many([record, record]) == 2
+    assert store.count() == 4
+    assert not store.append(record, deduplicate=True)
+    other = make_records(2, seed=4)
+    assert store.append_many(other + other, deduplicate=True) == 2
+    assert store.count() == 6
+
+
+def test_migrate_from_v1(tmp_path):
+    path = str(tmp_path / "history.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE history (id INTEGER PRIMARY KEY, name TEXT NOT NULL, date TEXT NOT NULL,
+            ts INTEGER NOT NULL, age TEXT NOT NULL, sex TEXT NOT NULL, weight TEXT NOT NULL,
+            height TEXT NOT NULL, factors TEXT NOT NULL, result_text TEXT NOT NULL,
+            color TEXT NOT NULL, score INTEGER, tier INTEGER);
+        CREATE INDEX history_ts ON history (ts);
+        CREATE INDEX history_name ON history (name);
+        CREATE INDEX history_tier ON history (tier);
+        PRAGMA user_version = 1;
+    """)
+    labels = [risk_engine.FACTOR_NAMES[0], risk_engine.FACTOR_NAMES[3], "неизвестный"]
+    rows = [("Иванов Иван", 1_600_000_000, "70", "Женский", "80.5", "160", labels, 9),
+            ("Иванов Иван", 1_600_000_060, "70", "Мужской", "80", "160", [], 4),
+            ("Ошибка", 1_600_000_120, "abc", "Мужской", "", "", [], None)]
+    for name, ts, age, sex, weight, height, factors, score in rows:
+        conn.execute("INSERT INTO history (name, date, ts, age, sex, weight, height, factors, "
+                     "result_text, color, score) VALUES (?, '', ?, ?, ?, ?, ?, ?, '', '', ?)",
+                     (name, ts, age, sex, weight, height,
+                      json.dumps(factors, ensure_ascii=False), score))
+    conn.commit()
+    conn.close()
+
+    store = HistoryStore(path)
+    first, second = store.iter_records(newest_first=False)
+    assert fields(first)[:8] == ("Иванов Иван", 1_600_000_000, 70, True, 80.5, 160.0,
+                                 0b1001, 9)
+    assert (second.is_female, second.factors, second.score) == (False, 0, 4)
+    assert store.search(name="иванов", factor=risk_engine.FACTORS[3][0])[0][1].ts == first.ts
+    assert store.conn.execute("PRAGMA user_version").fetchone()[0] == \
+        history_store.SCHEMA_VERSION
+    assert store.append(second, deduplicate=True) is False
+    store.close()
+
+
+@pytest.mark.parametrize("version", [4, 5])
+def test_migrate_hash_index(tmp_path, version):
+    path = str(tmp_path / "history.db")
+    store = HistoryStore(path)
+    record = make_records(1)[0]
+    store.append(record)
+    store.close()
+
+    conn = sqlite3.connect(path)
+    conn.execute("DROP INDEX history_hash")
+    if version == 4:
+        conn.execute("ALTER TABLE history DROP COLUMN hash")
+    else:
+        conn.execute("CREATE UNIQUE INDEX history_hash ON history (hash)")
+    conn.execute(f"PRAGMA user_version = {version}")
+    conn.commit()
+    conn.close()
+
+    store = HistoryStore(path)
+    (sql,) = store.conn.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'history_hash'").fetchone()
+    assert "UNIQUE" not in sql
+    assert store.append(record)
+    assert not store.append(record, deduplicate=True)
+    assert store.count() == 2
+    store.close()
+
+
+def brute_force(records, name=None, date_from=None, date_to=None, tier=None, factor=None):
+    prefix = history_store.name_key(name) if name else ""
+    found = []
+    for record in records:
+        if prefix and not history_store.name_key(record.name).startswith(prefix):
+            continue
+        if date_from is not None and record.ts < date_from:
+            continue
+        if date_to is not None and record.ts >= date_to:
+            continue
+        if tier is not None and record.tier != tier:
+            continue
+        if factor is not None and not record.has_factor(factor):
+            continue
+        found.append(fields(record))
+    return found
+
+
+@pytest.mark.parametrize("scan_limit", [3, 40, 2000])
+def test_search_matches_brute_force(store, monkeypatch, scan_limit):
+    monkeypatch.setattr(history_store, "SEARCH_SCAN_LIMIT", scan_limit)
+    store.append_many(make_records(1500))
+    # iter_records - от больших id к меньшим; устойчивая сортировка по
+    # времени даёт порядок search: ts DESC, id DESC
+    records = sorted(store.iter_records(), key=lambda r: r.ts, reverse=True)
+
+    queries = itertools.product(
+        [None, "иван", "ИВАНОВА", "Ё", "нет такого"],
+        [None, (BASE_TS + 10 * 60, BASE_TS + 30 * 60), (BASE_TS + 45 * 60, None)],
+        [None, 0, 2, len(risk_engine.TIERS) - 1],
+        [None, risk_engine.FACTORS[0][0], risk_engine.FACTORS[-1][0]])
+    for name, dates, tier, factor in queries:
+        date_from, date_to = dates or (None, None)
+        kwargs = dict(name=name, date_from=date_from, date_to=date_to, tier=tier, factor=factor)
+        expected = brute_force(records, **kwargs)
+        found, after = [], None
+        while True:
+            page = store.search(after=after, limit=97, **kwargs)
+            found.extend(fields(record) for _, record in page)
+            if len(page) < 97:
+                break
+            after = page[-1][0]
+        assert found == expected, kwargs
@@ -0,0 +1,130 @@
+"""Поток записи истории: сохранение очереди и отказ при неработающем потоке"""
+import json
+import os
+import time
+
+import pytest
+
+import archive
+from history_store import HistoryStore
+from history_writer import HistoryWriter
+
+from test_history_store import make_records
+
+
+def start_writer(tmp_path, **kwargs):
+    writer = HistoryWriter(str(tmp_path / "history.db"), str(tmp_path / "archive"),
+                           str(tmp_path / "stats.json"), **kwargs)
+    writer.start()
+    return writer
+
+
+def test_identical_records_are_all_saved(tmp_path):
+    writer = start_writer(tmp_path, flush_interval=60)
+    (record,) = make_records(1)
+    assert writer.submit(record)
+    assert writer.submit(record)
+    assert writer.flush(wait=True)
+    writer.close()
+
+    store = HistoryStore(str(tmp_path / "history.db"))
+    assert store.count() == 2
+    store.close()
+    column_archive = archive.ColumnArchive(str(tmp_path / "archive"))
+    assert column_archive.count() == 2
+    column_archive.close()
+
+
+def test_dead_writer_does_not_block(tmp_path):
+    os.makedirs(tmp_path / "archive")
+    with open(tmp_path / "archive" / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({"version": archive.FORMAT_VERSION + 1}, f)
+    writer = start_writer(tmp_path)
+    writer.join(5)
+    assert not writer.is_alive()
+    assert "версия архива" in writer.error
+
+    started = time.monotonic()
+    assert not writer.flush(wait=True)
+    assert not writer.flush()
+    assert time.monotonic() - started < 1
+    assert not writer.submit(make_records(1)[0])
+    writer.close()
+
+
+def test_flush_wait_times_out_on_full_queue(tmp_path):
+    writer = HistoryWriter(str(tmp_path / "history.db"), queue_size=1)
+    # Поток как будто занят: он жив, но очередь не разбирает
+    writer.is_alive = lambda: True
+    assert writer.submit(make_records(1)[0])
+    started = time.monotonic()
+    assert not writer.flush(wait=True, timeout=0.2)
+    assert 0.15 < time.monotonic() - started < 1
+    assert not writer.flush()
+    writer.closed = True
+
+
+def test_unstorable_record_is_skipped(tmp_path):
+    writer = start_writer(tmp_path, flush_interval=60)
+    first, second = make_records(2)
+    broken = make_records(1, seed=9)[0]
+    broken.weight = float("nan")  # сохраняется как NULL и нарушает NOT NULL
+    for record in (first, broken, second):
+        assert writer.submit(record)
+    assert writer.flush(wait=True)
+    assert writer.write_error is None
+    writer.close()
+
+    store = HistoryStore(str(tmp_path / "history.db"))
+    assert store.count() == 2
+    store.close()
+
+
+def test_failed_write_is_reported(tmp_path, monkeypatch):
+    import history_writer
+
+    def failing(*args, **kwargs):
+        raise OSError("диск заполнен")
+
+    writer = start_writer(tmp_path, flush_interval=60)
+    monkeypatch.setattr(history_writer, "write_records", failing)
+    assert writer.submit(make_records(1)[0])
+    assert not writer.flush(wait=True)
+    assert writer.write_error == "диск заполнен"
+
+    monkeypatch.undo()
+    assert writer.flush(wait=True)
+    assert writer.write_error is None
+    writer.close()
+
+
+def test_retry_after_failed_commit_writes_once(tmp_path):
+    import history_writer
+    import stats
+
+    store = HistoryStore(str(tmp_path / "history.db"))
+    column_archive = history_writer.open_archive(store, str(tmp_path / "archive"))
+    stats_path = str(tmp_path / "stats.json")
+    stats.PopulationStats().save(stats_path)
+    first, second = make_records(4)[:2], make_records(4)[2:]
+    history_writer.write_records(store, column_archive, stats_path, first)
+
+    # Архив и счётчики дописаны, но транзакция базы откатилась
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            history_writer.write_records(store, column_archive, stats_path, second)
+            raise RuntimeError("фиксация не удалась")
+    assert store.count() == 2
+    assert column_archive.count() == 4
+
+    history_writer.write_records(store, column_archive, stats_path, second)
+    assert store.count() == column_archive.count() == 4
+    assert list(column_archive.columns()["ts"]) == [r.ts for r in first + second]
+    # Счётчики учли лишнее - файл удалён и будет пересчитан по истории
+    assert stats.PopulationStats.load(stats_path) is None
+
+    stats.PopulationStats.from_records(store.iter_records()).save(stats_path)
+    history_writer.write_records(store, column_archive, stats_path, first)
+    assert stats.PopulationStats.load(stats_path).count == store.count() == 6
+    column_archive.close()
+    store.close()
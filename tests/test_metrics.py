@@ -0,0 +1,114 @@
+"""Замеры операций окна: гистограммы, профиль медленной операции и то, что
+время в модальных окнах в замеры не входит"""
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import metrics
+
+
+def parse(exposition):
+    values = {}
+    for line in exposition.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            values[name] = float(value)
+    return values
+
+
+def test_histogram_exposition():
+    registry = metrics.Registry()
+    for seconds in (0.0005, 0.003, 0.003, 0.2, 20):
+        registry.observe('a"b', seconds)
+    registry.observe("other", 0.01, error=True)
+    values = parse(registry.exposition())
+    label = 'operation="a\\"b"'
+    assert values[f'{metrics.METRIC}_bucket{{{label},le="0.001"}}'] == 1
+    assert values[f'{metrics.METRIC}_bucket{{{label},le="0.005"}}'] == 3
+    assert values[f'{metrics.METRIC}_bucket{{{label},le="10"}}'] == 4
+    assert values[f'{metrics.METRIC}_bucket{{{label},le="+Inf"}}'] == 5
+    assert values[f"{metrics.METRIC}_count{{{label}}}"] == 5
+    assert values[f"{metrics.METRIC}_sum{{{label}}}"] == pytest.approx(20.2065)
+    assert values['kurs_operation_errors_total{operation="other"}'] == 1
+    assert values[f'kurs_operation_errors_total{{{label}}}'] == 0
+
+
+def test_instrument_counts_errors_and_nesting(tmp_path, monkeypatch):
+    registry = metrics.Registry()
+    profiler = metrics.SlowProfiler(str(tmp_path), slow_ms=50)
+    monkeypatch.setattr(metrics, "profiler", profiler)
+    monkeypatch.setattr(metrics, "METRICS_PATH", "")
+
+    inner = metrics.instrument(lambda: time.sleep(0.06), "inner", registry)
+    outer = metrics.instrument(lambda: inner(), "outer", registry)
+
+    def fail():
+        raise KeyError("x")
+
+    with pytest.raises(KeyError):
+        metrics.instrument(fail, "fail", registry)()
+    assert profiler.armed
+    outer()
+    # Профиль - один, внешней операции, и после него профилировщик выключен
+    assert not profiler.armed
+    assert os.path.basename(profiler.path).startswith("kurs_outer_")
+    with open(profiler.path[:-len(".prof")] + ".txt", encoding="utf-8") as f:
+        assert f.readline().startswith("outer: ")
+    outer()
+    assert len(os.listdir(tmp_path)) == 2
+
+    assert registry.histograms["fail"].errors == 1
+    assert registry.histograms["outer"].count == registry.histograms["inner"].count == 2
+    assert registry.histograms["inner"].sum >= 0.12
+
+
+WINDOW_SCRIPT = r"""
+import sys, time
+sys.path.insert(0, sys.argv[1])
+from PyQt5.QtWidgets import QApplication, QDialog
+import kURS, metrics
+from history_view import HistoryDialog
+
+def enter_name(dialog):
+    time.sleep(0.4)  # пользователь вводит ФИО
+    dialog.name_input.setText("Иванов Иван")
+    return QDialog.Accepted
+
+def browse(dialog):
+    time.sleep(0.4)  # пользователь смотрит историю
+    return QDialog.Accepted
+
+kURS.NameDialog.exec_ = enter_name
+HistoryDialog.exec_ = browse
+qt = QApplication([])
+app = kURS.CovidRiskApp(history_path=sys.argv[2], model_path=sys.argv[3])
+app.age_input.setText("70")
+app.weight_input.setText("80")
+app.height_input.setText("170")
+for _ in range(4):  # три страницы и «Завершить»
+    app.btn_next.click()
+app.btn_history.click()
+app.close()
+qt.processEvents()
+print(metrics.REGISTRY.exposition())
+"""
+
+
+def test_modal_dialogs_are_not_timed(tmp_path):
+    env = dict(os.environ, KURS_METRICS=str(tmp_path / "metrics.prom"),
+               KURS_PROFILE=str(tmp_path / "profile"), KURS_PROFILE_SLOW_MS="300",
+               QT_QPA_PLATFORM="offscreen")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", WINDOW_SCRIPT, root, str(tmp_path / "history.db"),
+         str(tmp_path / "model.json")],
+        env=env, capture_output=True, text=True, check=True, cwd=str(tmp_path)).stdout
+    values = parse(output)
+    for name, count in (("initUI", 1), ("next_page", 3), ("show_history", 1)):
+        assert values[f'{metrics.METRIC}_count{{operation="{name}"}}'] == count
+        assert values[f'{metrics.METRIC}_sum{{operation="{name}"}}'] < 0.3, name
+    # Ни одна операция не оказалась медленной - профиль не записан
+    assert not os.path.exists(tmp_path / "profile")
@@ -0,0 +1,105 @@
+"""Модели оценки из файлов: проверка файла, совпадение со встроенной
+моделью и перечитывание при изменении"""
+import os
+import random
+
+import numpy as np
+import pytest
+
+import model
+import risk_engine
+
+
+def data(**fields):
+    return dict({"format": model.FORMAT_VERSION, "version": "test"}, **fields)
+
+
+def patients(count, seed=11):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield (rng.randint(0, 120), rng.uniform(10, 60), rng.random() < 0.5,
+               rng.getrandbits(len(risk_engine.FACTORS)))
+
+
+def test_empty_model_equals_builtin():
+    scoring_model = model.ScoringModel(data())
+    batch = list(zip(*patients(3000)))
+    scores = scoring_model.score_batch(*batch)
+    for i, (age, bmi, is_female, mask) in enumerate(zip(*batch)):
+        expected = risk_engine.score(age, bmi, is_female, mask)
+        assert scoring_model.score(age, bmi, is_female, mask) == scores[i] == expected
+        assert scoring_model.tier_index(expected) == risk_engine.tier_index(expected)
+        assert scoring_model.recommendations(expected, age, mask) == \
+            risk_engine.recommendations(expected, age, mask)
+    assert np.array_equal(scoring_model.tier_batch(scores), risk_engine.tier_batch(scores))
+
+
+def test_overrides():
+    scoring_model = model.ScoringModel(data(
+        weights={"diabetes": 10, "vaccine": -5}, age_bands=[[80, 7]], bmi_bands=[[25.5, 1]],
+        tiers=[40, 30, 20, 10], advice={"diabetes": "Контроль сахара"}))
+    diabetes = risk_engine.factor_mask(["diabetes"])
+    assert scoring_model.score(85, 25.5, False, diabetes) == 7 + 1 + 10
+    assert scoring_model.score(79, 25.4, False, diabetes) == 10
+    assert scoring_model.score(20, 20, False, risk_engine.factor_mask(["vaccine"])) == -5
+    assert scoring_model.tier_index(18) == 3
+    assert scoring_model.tier_index(-5) == 4
+    assert scoring_model.tier_index(1000) == 0
+    assert "Контроль сахара" in scoring_model.recommendations(18, 85, diabetes)
+
+
+@pytest.mark.parametrize("fields", [
+    {"format": 2},
+    {"version": ""},
+    {"weights": ["diabetes"]},
+    {"weights": {"нет такого": 1}},
+    {"weights": {"diabetes": "много"}},
+    {"advice": ["Совет"]},
+    {"missing_advice": {"vaccine": 1}},
+    {"age_bands": [[30, 1], [40, 2]]},
+    {"age_bands": [["30", 1]]},
+    {"bmi_bands": 5},
+    {"tiers": [1, 2, 3, 4]},
+    {"tiers": [10, 5]},
+])
+def test_invalid_model_is_rejected(tmp_path, fields):
+    path = str(tmp_path / "model.json")
+    model.save(data(**fields), path)
+    with pytest.raises((ValueError, TypeError)):
+        model.load(path)
+    model_file = model.ModelFile(path)
+    assert model_file.error
+    assert model_file.model.version == risk_engine.BUILTIN_MODEL
+
+
+def test_model_file_reload(tmp_path):
+    path = str(tmp_path / "model.json")
+    model_file = model.ModelFile(path)
+    assert (model_file.model.version, model_file.error) == (risk_engine.BUILTIN_MODEL, None)
+    assert not model_file.reload()
+
+    model.save(data(version="v1", weights={"diabetes": 10}), path)
+    assert model_file.reload()
+    assert (model_file.model.version, model_file.error) == ("v1", None)
+
+    # Негодный файл не заменяет работающую модель
+    model.save(data(version="v2", weights=["diabetes"]), path)
+    assert model_file.reload()
+    assert model_file.model.version == "v1"
+    assert "weights" in model_file.error
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[1, 2]")
+    assert model_file.reload()
+    assert model_file.model.version == "v1"
+
+    os.remove(path)
+    assert model_file.reload()
+    assert (model_file.model.version, model_file.error) == (risk_engine.BUILTIN_MODEL, None)
+
+
+def test_compiled_models_are_cached():
+    first = model.compile_model(data(version="cached", weights={"diabetes": 4}))
+    assert model.compile_model(data(version="cached", weights={"diabetes": 4})) is first
+    changed = model.compile_model(data(version="cached", weights={"diabetes": 5}))
+    assert changed is not first
+    assert changed.weights[0] == 5
@@ -0,0 +1,170 @@
+"""Листы пациентов: содержимое против скалярной оценки, шаблон,
+каталог и архив, совпадение параллельного режима с однопроцессным"""
+import html
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+import cli
+import model
+import reports
+import risk_engine
+
+
+TEMPLATE = "{row}|{name}|{score}|{tier}|{color}|{factors}|{model}\n{result}\n{recommendations}"
+
+
+def records(count, seed=11):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {"name": f"Пациент <{i}> & Ко", "age": rng.randint(18, 95),
+               "sex": rng.choice("mf"), "weight": round(rng.uniform(45, 130), 1),
+               "height": rng.randint(150, 200),
+               "factors": [f.key for f in risk_engine.FACTORS if rng.random() < 0.2]}
+
+
+def jsonl(items):
+    return io.StringIO("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in items))
+
+
+class MemoryOutput:
+    def __init__(self):
+        self.sheets = {}
+
+    def write(self, name, data):
+        assert name not in self.sheets
+        self.sheets[name] = data
+
+
+def expected_sheet(row, record):
+    bmi = record["weight"] / (record["height"] / 100) ** 2
+    is_female = record["sex"] == "f"
+    mask = risk_engine.factor_mask(record["factors"])
+    if not is_female:
+        mask &= ~risk_engine.PREGNANCY_BIT
+    risk_score = risk_engine.score(record["age"], bmi, is_female, mask)
+    _, label, color = risk_engine.TIERS[risk_engine.tier_index(risk_score)]
+    items = "\n".join(f"<li>{html.escape(text)}</li>"
+                      for text in risk_engine.recommendations(risk_score, record["age"], mask))
+    return (f"{row}|{html.escape(record['name'])}|{risk_score}|{label}|{color}|"
+            f"{html.escape(', '.join(risk_engine.factor_names(mask)))}|"
+            f"{risk_engine.BUILTIN_MODEL}\n{risk_engine.result_html(risk_score)}\n{items}")
+
+
+def test_sheets_match_scalar_scoring():
+    items = list(records(300))
+    output = MemoryOutput()
+    assert reports.report_stream(jsonl(items), output, "jsonl", TEMPLATE,
+                                 chunk_size=64) == (300, 0)
+    assert len(output.sheets) == 300
+    for row, record in enumerate(items, 1):
+        name = reports.sheet_name(row, record["name"], "html")
+        assert output.sheets[name].decode("utf-8") == expected_sheet(row, record)
+
+
+def test_rejected_records_keep_row_numbers():
+    items = list(records(5))
+    items[1]["age"] = "сорок"
+    items[3]["sex"] = "x"
+    output = MemoryOutput()
+    assert reports.report_stream(jsonl(items), output, "jsonl", TEMPLATE,
+                                 chunk_size=2) == (5, 2)
+    assert sorted(name[:6] for name in output.sheets) == ["000001", "000003", "000005"]
+
+
+def test_sheet_name_is_safe():
+    assert reports.sheet_name(7, "Иванов И.И. / ../x", "pdf") == "000007_Иванов_И_И_x.pdf"
+    assert reports.sheet_name(12, "???", "html") == "000012.html"
+
+
+@pytest.mark.parametrize("text", ["{unknown}", "{score:>5}", "{name!r}"])
+def test_template_rejects_bad_fields(text):
+    with pytest.raises(ValueError):
+        reports.Template(text)
+
+
+def test_template_keeps_escaped_braces():
+    template = reports.Template("{{x}} {name} {{")
+    assert template.render({"name": "Анна"}) == "{x} Анна {"
+
+
+def test_default_template_renders():
+    output = MemoryOutput()
+    reports.report_stream(jsonl(records(3)), output, "jsonl")
+    for data in output.sheets.values():
+        text = data.decode("utf-8")
+        assert text.startswith("<!DOCTYPE html>")
+        assert "&lt;" in text and "Пациент <" not in text
+
+
+def test_model_file_is_used():
+    data = dict(model.builtin().data, version="test-model", weights={"diabetes": 9})
+    record = {"name": "Анна", "age": 30, "sex": "f", "weight": 60, "height": 170,
+              "factors": ["diabetes"]}
+    output = MemoryOutput()
+    reports.report_stream(jsonl([record]), output, "jsonl", "{score} {model}", data)
+    builtin = risk_engine.score(30, 60 / 1.7 ** 2, True, risk_engine.factor_mask(["diabetes"]))
+    expected = builtin - risk_engine.FACTOR_WEIGHTS[risk_engine.FACTOR_BITS["diabetes"]] + 9
+    assert list(output.sheets.values()) == [f"{expected} test-model".encode("utf-8")]
+
+
+def test_parallel_output_equals_serial(tmp_path):
+    items = list(records(400))
+    serial = MemoryOutput()
+    reports.report_stream(jsonl(items), serial, "jsonl", TEMPLATE, chunk_size=50)
+    for workers in (2, 3):
+        parallel = MemoryOutput()
+        assert reports.report_stream(jsonl(items), parallel, "jsonl", TEMPLATE,
+                                     workers=workers, chunk_size=50) == (400, 0)
+        assert list(parallel.sheets.items()) == list(serial.sheets.items())
+
+
+def test_cli_zip_and_directory(tmp_path, capsys):
+    source = tmp_path / "patients.jsonl"
+    source.write_text(jsonl(records(20)).getvalue(), encoding="utf-8")
+    archive = tmp_path / "sheets.zip"
+    assert cli.main(["report", str(source), "-o", str(archive), "-j", "1"]) == 0
+    with zipfile.ZipFile(archive) as z:
+        zipped = {name: z.read(name) for name in z.namelist()}
+    assert len(zipped) == 20
+    folder = tmp_path / "sheets"
+    assert cli.main(["report", str(source), "-o", str(folder), "-j", "2",
+                     "--chunk-size", "3"]) == 0
+    assert {p.name: p.read_bytes() for p in folder.iterdir()} == zipped
+
+
+def test_cli_pdf(tmp_path):
+    source = tmp_path / "patients.jsonl"
+    source.write_text(jsonl(records(2)).getvalue(), encoding="utf-8")
+    folder = tmp_path / "sheets"
+    # Отдельный процесс: QGuiApplication из html_to_pdf не даст тестам окна
+    # создать QApplication
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, os.path.join(root, "cli.py"), "report", str(source),
+                    "-o", str(folder), "--pdf", "-j", "1"],
+                   capture_output=True, check=True, cwd=str(tmp_path))
+    sheets = sorted(folder.iterdir())
+    assert [p.suffix for p in sheets] == [".pdf", ".pdf"]
+    assert all(p.read_bytes().startswith(b"%PDF") for p in sheets)
+
+
+def test_cli_bad_template(tmp_path, capsys):
+    template = tmp_path / "sheet.html"
+    template.write_text("{нет_такого}", encoding="utf-8")
+    folder = tmp_path / "sheets"
+    assert cli.main(["report", "-", "-o", str(folder), "--template", str(template)]) == 2
+    assert "Ошибка шаблона" in capsys.readouterr().err
+    assert not folder.exists()
+
+
+@pytest.mark.parametrize("option", [["-j", "-1"], ["--chunk-size", "0"]])
+def test_invalid_counts_are_argument_errors(tmp_path, option):
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(["report", "-", "-o", str(tmp_path / "sheets")] + option)
+    assert exit_info.value.code == 2
@@ -0,0 +1,213 @@
+"""Совпадение risk_engine с правилами calculate_risk/get_recommendations
+исходной версии окна (перенесены ниже дословно, с чекбоксами - по ключам)"""
+import random
+
+import numpy as np
+import pytest
+
+import model
+import risk_engine
+
+
+def baseline_score(age_text, weight_text, height_text, is_female, checked):
+    age = int(age_text)
+    weight = float(weight_text)
+    height = float(height_text) / 100
+    bmi = weight / (height ** 2)
+
+    risk_score = 0
+
+    # 1. Основные параметры
+    if age >= 65:
+        risk_score += 4
+    elif age >= 50:
+        risk_score += 3
+    elif age >= 40:
+        risk_score += 2
+    elif age >= 30:
+        risk_score += 1
+
+    if bmi >= 40:
+        risk_score += 3
+    elif bmi >= 35:
+        risk_score += 2
+    elif bmi >= 30:
+        risk_score += 1
+
+    # 2. Хронические заболевания
+    if checked("diabetes"): risk_score += 3
+    if checked("hypertension"): risk_score += 2
+    if checked("cvd"): risk_score += 3
+    if checked("lung_disease"): risk_score += 3
+    if checked("kidney"): risk_score += 3
+    if checked("liver"): risk_score += 2
+    if checked("cancer"): risk_score += 4
+    if checked("autoimmune"): risk_score += 2
+
+    # 3. Иммунный статус
+    if checked("immune"): risk_score += 4
+    if checked("hiv"): risk_score += 4
+    if checked("transplant"): risk_score += 5
+    if checked("steroids"): risk_score += 3
+    if checked("chemotherapy"): risk_score += 4
+
+    # 4. Вакцинация (снижают риск)
+    if checked("vaccine"): risk_score -= 3
+    if checked("flu_vaccine"): risk_score -= 1
+    if checked("pneumo_vaccine"): risk_score -= 1
+
+    # 5. Образ жизни
+    if checked("smoking"): risk_score += 2
+    if checked("alcohol"): risk_score += 1
+    if checked("drugs"): risk_score += 2
+    if checked("sedentary"): risk_score += 1
+    if checked("no_sport"): risk_score += 1
+
+    # 6. Психологическое состояние
+    if checked("stress"): risk_score += 1
+    if checked("depression"): risk_score += 1
+    if checked("sleep"): risk_score += 1
+
+    # 7. Контакты и профессия
+    if checked("contacts"): risk_score += 2
+    if checked("medic"): risk_score += 2
+    if checked("crowd"): risk_score += 1
+    if checked("travel"): risk_score += 1
+
+    # 8. Беременность
+    if is_female and checked("pregnancy"): risk_score += 2
+
+    # Определение уровня риска
+    if risk_score >= 15:
+        risk, color = "🔴 Очень высокий", "darkred"
+    elif risk_score >= 10:
+        risk, color = "🔴 Высокий", "red"
+    elif risk_score >= 6:
+        risk, color = "🟡 Повышенный", "orange"
+    elif risk_score >= 3:
+        risk, color = "🟢 Умеренный", "green"
+    else:
+        risk, color = "🟢 Низкий", "darkgreen"
+
+    html = f'<span style="color: {color}; font-weight: bold;">{risk} риск (баллов: {risk_score})</span>'
+    return risk_score, risk, html
+
+
+def baseline_recommendations(risk_score, age, checked):
+    recommendations = []
+
+    if risk_score >= 10:
+        recommendations.append("🔴 Срочно проконсультируйтесь с врачом!")
+        recommendations.append("🔴 Максимально ограничьте контакты с другими людьми")
+    elif risk_score >= 6:
+        recommendations.append("🟡 Рекомендуется консультация врача")
+        recommendations.append("🟡 Избегайте людных мест, носите маску")
+
+    # Рекомендации по вакцинации
+    if not checked("vaccine"):
+        recommendations.append("💉 Сделайте прививку от COVID-19 как можно скорее")
+    if not checked("flu_vaccine"):
+        recommendations.append("💉 Рекомендуется вакцинация от гриппа")
+    if not checked("pneumo_vaccine") and (checked("lung_disease") or age >= 65):
+        recommendations.append("💉 Рекомендуется вакцинация от пневмококка")
+
+    # Рекомендации по образу жизни
+    if checked("smoking"):
+        recommendations.append("🚭 Настоятельно рекомендуется бросить курить")
+    if checked("alcohol"):
+        recommendations.append("🍷 Ограничьте потребление алкоголя")
+    if checked("sedentary"):
+        recommendations.append("🏃 Начните регулярные физические упражнения")
+    if checked("stress"):
+        recommendations.append("🧘 Практикуйте техники релаксации и снижения стресса")
+    if checked("sleep"):
+        recommendations.append("😴 Нормализуйте режим сна (7-9 часов ежедневно)")
+
+    # Общие рекомендации
+    recommendations.append("🧼 Соблюдайте гигиену рук и социальную дистанцию")
+    recommendations.append("🔄 Регулярно проветривайте помещения")
+
+    if risk_score < 3:
+        recommendations.append("🟢 Продолжайте соблюдать меры профилактики")
+
+    return "\n".join(recommendations)
+
+
+def patients(count, seed=1):
+    """(возраст, вес, рост - текстом, как в полях ввода; пол; маска)"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        # Границы диапазонов возраста и ИМТ встречаются чаще случайных значений
+        age = rng.choice((rng.randint(0, 110), 29, 30, 39, 40, 49, 50, 64, 65))
+        weight = rng.choice((rng.randint(30, 200), round(rng.uniform(40, 150), 1)))
+        height = rng.randint(140, 210)
+        mask = rng.getrandbits(len(risk_engine.FACTORS))
+        yield str(age), str(weight), str(height), rng.random() < 0.5, mask
+
+
+def _checked(mask):
+    return lambda key: bool(mask >> risk_engine.FACTOR_BITS[key] & 1)
+
+
+def test_score_and_recommendations_match_baseline():
+    for age_text, weight_text, height_text, is_female, mask in patients(20000):
+        expected, label, html = baseline_score(age_text, weight_text, height_text, is_female,
+                                               _checked(mask))
+        age, bmi = risk_engine.parse_inputs(age_text, weight_text, height_text)
+        risk_score = risk_engine.score(age, bmi, is_female, mask)
+        assert risk_score == expected
+        assert risk_engine.TIERS[risk_engine.tier_index(risk_score)][1] == label
+        assert risk_engine.result_html(risk_score) == html
+        assert "\n".join(risk_engine.recommendations(risk_score, age, mask)) == \
+            baseline_recommendations(risk_score, age, _checked(mask))
+
+
+def test_batch_and_builtin_model_match_scalar():
+    rows = list(patients(20000, seed=2))
+    parsed = [risk_engine.parse_inputs(a, w, h) for a, w, h, _, _ in rows]
+    ages = np.array([age for age, _ in parsed])
+    bmis = np.array([bmi for _, bmi in parsed])
+    females = np.array([row[3] for row in rows])
+    masks = np.array([row[4] for row in rows], dtype=np.uint32)
+    expected = [risk_engine.score(age, bmi, row[3], row[4]) for (age, bmi), row in zip(parsed, rows)]
+
+    scores = risk_engine.score_batch(ages, bmis, females, masks)
+    assert scores.tolist() == expected
+    assert risk_engine.tier_batch(scores).tolist() == [risk_engine.tier_index(s) for s in expected]
+
+    builtin = model.builtin()
+    assert builtin.score_batch(ages, bmis, females, masks).tolist() == expected
+    for (age, bmi), row, risk_score in zip(parsed[:2000], rows, expected):
+        assert builtin.score(age, bmi, row[3], row[4]) == risk_score
+        assert builtin.recommendations(risk_score, age, row[4]) == \
+            risk_engine.recommendations(risk_score, age, row[4])
+
+
+def test_live_score_matches_full_score():
+    live = risk_engine.LiveScore()
+    rng = random.Random(3)
+    assert live.score is None
+    live.set_age(70)
+    live.set_bmi(31.0)
+    mask = 0
+    for _ in range(500):
+        bit = rng.randrange(len(risk_engine.FACTORS))
+        mask ^= 1 << bit
+        live.set_factor(bit, bool(mask >> bit & 1))
+        if rng.random() < 0.1:
+            live.set_female(rng.random() < 0.5)
+        assert live.score == risk_engine.score(70, 31.0, live.is_female, mask)
+
+
+@pytest.mark.parametrize("age, weight, height, error", [
+    ("35.5", "70", "175", ValueError),  # возраст - целое число, как в окне
+    ("", "70", "175", ValueError),
+    ("35", "абв", "175", ValueError),
+    ("35", "70", "0", ZeroDivisionError),
+    ("35", "70", "1e200", OverflowError),
+])
+def test_parse_inputs_errors_like_baseline(age, weight, height, error):
+    with pytest.raises(error):
+        risk_engine.parse_inputs(age, weight, height)
+    with pytest.raises(error):
+        baseline_score(age, weight, height, False, _checked(0))
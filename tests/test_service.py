@@ -0,0 +1,120 @@
+"""HTTP-сервис: коды ответов на ошибки и устойчивость обработчика очереди"""
+import asyncio
+import json
+
+import batch
+import model
+import risk_engine
+import service
+
+
+GOOD = {"age": 40, "sex": "m", "weight": 70, "height": 175, "factors": ["diabetes"]}
+
+
+async def request(port, method, path, body=b""):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n"
+                 "Connection: close\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    payload = json.loads(await reader.read())
+    writer.close()
+    return int(head.split(b" ", 2)[1]), payload
+
+
+def post(port, path, data):
+    return request(port, "POST", path, json.dumps(data).encode("utf-8"))
+
+
+def run_service(tmp_path, check):
+    async def main():
+        svc = await service.ScoringService(port=0,
+                                           model_path=str(tmp_path / "model.json")).start()
+        try:
+            await check(svc)
+        finally:
+            await svc.stop()
+    asyncio.run(main())
+
+
+def test_error_statuses(tmp_path):
+    async def check(svc):
+        port = svc.port
+        status, result = await post(port, "/score", GOOD)
+        assert status == 200
+        assert result["model"] == risk_engine.BUILTIN_MODEL
+        for bad in ({"factors": [1]}, {"factors": [None]}, {"sex": "?"}, {"age": None}):
+            status, result = await post(port, "/score", dict(GOOD, **bad))
+            assert (status, result["error"]) == (422, service.ERROR_TEXT)
+        assert (await post(port, "/score", [GOOD]))[0] == 400
+        assert (await request(port, "POST", "/score", b"{"))[0] == 400
+        assert (await post(port, "/score/batch", {"records": 5}))[0] == 400
+        assert (await request(port, "GET", "/score"))[0] == 405
+        assert (await request(port, "GET", "/nothing"))[0] == 404
+
+        status, result = await post(port, "/score/batch",
+                                    {"records": [GOOD, dict(GOOD, factors=[1]), GOOD]})
+        assert status == 200
+        assert result["rejected"] == 1
+        assert [r["row"] for r in result["results"]] == [1, 3]
+    run_service(tmp_path, check)
+
+
+def test_scoring_error_keeps_worker_alive(tmp_path, monkeypatch):
+    score_chunk = batch.score_chunk
+
+    def failing(records, *args, **kwargs):
+        if any(r.get("name") == "сбой" for r in records):
+            raise RuntimeError("сбой расчёта")
+        return score_chunk(records, *args, **kwargs)
+
+    monkeypatch.setattr(batch, "score_chunk", failing)
+
+    async def check(svc):
+        port = svc.port
+        assert (await post(port, "/score", dict(GOOD, name="сбой")))[0] == 500
+        assert (await post(port, "/score/batch", [dict(GOOD, name="сбой")]))[0] == 500
+        # Запросы, собранные в одну пачку со сбойным, получают свои ответы
+        responses = await asyncio.gather(
+            post(port, "/score", GOOD), post(port, "/score", dict(GOOD, name="сбой")),
+            post(port, "/score", dict(GOOD, factors=[1])), post(port, "/score", GOOD))
+        assert [status for status, _ in responses] == [200, 500, 422, 200]
+        assert not svc.worker.done()
+        assert (await post(port, "/score", GOOD))[0] == 200
+    run_service(tmp_path, check)
+
+
+def test_full_queue_answers_503(tmp_path):
+    async def check(svc):
+        svc.worker.cancel()
+        for _ in range(svc.queue_size):
+            svc.queue.put_nowait(("single", GOOD, asyncio.get_running_loop().create_future()))
+        status, result = await post(svc.port, "/score", GOOD)
+        assert status == 503
+    run_service(tmp_path, check)
+
+
+def test_health_and_model_reload(tmp_path):
+    async def check(svc):
+        status, result = await request(svc.port, "GET", "/health")
+        assert (status, result["model"]) == (200, risk_engine.BUILTIN_MODEL)
+        model.save({"format": model.FORMAT_VERSION, "version": "test-2",
+                    "weights": {"diabetes": 10}}, svc.model_file.path)
+        status, result = await post(svc.port, "/score", GOOD)
+        assert (status, result["model"], result["score"]) == (200, "test-2", 12)
+        status, result = await request(svc.port, "GET", "/health")
+        assert result["model"] == "test-2"
+    run_service(tmp_path, check)
+
+
+def test_bad_model_file_keeps_previous_model(tmp_path):
+    async def check(svc):
+        model.save({"format": model.FORMAT_VERSION, "version": "test-3",
+                    "weights": {"diabetes": 10}}, svc.model_file.path)
+        assert (await post(svc.port, "/score", GOOD))[1]["model"] == "test-3"
+        model.save({"format": model.FORMAT_VERSION, "version": "test-4",
+                    "weights": ["diabetes"]}, svc.model_file.path)
+        status, result = await post(svc.port, "/score", GOOD)
+        assert (status, result["model"]) == (200, "test-3")
+        assert not svc.worker.done()
+    run_service(tmp_path, check)
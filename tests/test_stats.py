@@ -0,0 +1,61 @@
+"""Сводная статистика: счётчики нарастающим итогом и файл счётчиков"""
+import json
+
+import pytest
+
+import risk_engine
+import stats
+
+from test_history_store import make_records
+
+
+def test_counters_match_records():
+    records = make_records(2000)
+    population = stats.PopulationStats()
+    for record in records:
+        population.add(record)
+
+    assert population.count == len(records)
+    assert population.mean_score() == pytest.approx(
+        sum(r.score for r in records) / len(records))
+    for tier in range(len(risk_engine.TIERS)):
+        assert population.tiers[tier] == sum(r.tier == tier for r in records)
+    for band, label in enumerate(stats.AGE_LABELS):
+        in_band = [r for r in records
+                   if risk_engine.band_index(r.age, risk_engine.AGE_BANDS) == band]
+        assert population.age_bands[band] == len(in_band), label
+    assert sum(population.bmi_bands) == len(records)
+    for bit, factor in enumerate(risk_engine.FACTORS):
+        assert population.factors[bit] == sum(r.has_factor(factor.key) for r in records)
+    assert sum(population.scores.values()) == len(records)
+
+
+def test_band_labels():
+    assert stats.AGE_LABELS == ["<30", "30–39", "40–49", "50–64", "65+"]
+    assert risk_engine.band_index(29, risk_engine.AGE_BANDS) == 0
+    assert risk_engine.band_index(30, risk_engine.AGE_BANDS) == 1
+    assert risk_engine.band_index(65, risk_engine.AGE_BANDS) == 4
+    assert risk_engine.band_index(float("nan"), risk_engine.BMI_BANDS) == 0
+
+
+def test_save_load_and_update(tmp_path):
+    path = str(tmp_path / "stats.json")
+    records = make_records(300)
+    assert stats.update_snapshot(records, path) is None
+    assert stats.PopulationStats.load(path) is None
+
+    stats.PopulationStats.from_records(records[:100]).save(path)
+    assert stats.update_snapshot(records[100:], path, expected=100) == 300
+    loaded = stats.PopulationStats.load(path)
+    assert loaded.to_dict() == stats.PopulationStats.from_records(records).to_dict()
+
+    # Файл, в котором учтено не то число оценок, удаляется
+    assert stats.update_snapshot(records[:1], path, expected=299) is None
+    assert stats.PopulationStats.load(path) is None
+
+
+@pytest.mark.parametrize("content", ["{", json.dumps({"version": 99}), json.dumps([1])])
+def test_damaged_file_is_ignored(tmp_path, content):
+    path = tmp_path / "stats.json"
+    path.write_text(content, encoding="utf-8")
+    assert stats.PopulationStats.load(str(path)) is None
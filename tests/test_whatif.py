@@ -0,0 +1,71 @@
+"""Анализ «что если»: только изменения в здоровую сторону"""
+import io
+import json
+import random
+
+import risk_engine
+import whatif
+
+
+def patients(count, seed=17):
+    rng = random.Random(seed)
+    for _ in range(count):
+        mask = 0
+        for bit in range(len(risk_engine.FACTORS)):
+            if rng.random() < 0.3:
+                mask |= 1 << bit
+        yield rng.randint(18, 95), rng.uniform(16, 45), rng.random() < 0.5, mask
+
+
+def expected_variants(age, bmi, is_female, mask):
+    # Перебор по одному пациенту через скалярный score
+    current = risk_engine.score(age, bmi, is_female, mask)
+    found = []
+    for keys in risk_engine.WHAT_IF_TOGGLES:
+        new_mask = mask
+        for key in keys:
+            bit = risk_engine.FACTOR_BITS[key]
+            if (key == "vaccine") == bool(mask >> bit & 1):
+                break  # вакцинация уже есть или вредного фактора нет
+            new_mask ^= 1 << bit
+        else:
+            new = risk_engine.score(age, bmi, is_female, new_mask)
+            if new < current:
+                found.append((keys, new, risk_engine.tier_index(new)))
+    found.sort(key=lambda item: (item[1], len(item[0])))
+    return found
+
+
+def test_what_if_matches_brute_force():
+    for patient in patients(2000):
+        assert risk_engine.what_if(*patient) == expected_variants(*patient)
+
+
+def test_what_if_never_suggests_harm():
+    smoker = risk_engine.factor_mask(["smoking"])
+    variants = risk_engine.what_if(70, 30, False, smoker)
+    texts = [risk_engine.what_if_text(keys, smoker) for keys, _, _ in variants]
+    assert texts == ["+ Вакцинация от COVID-19, − Курение", "+ Вакцинация от COVID-19",
+                     "− Курение"]
+    vaccinated = risk_engine.factor_mask(["vaccine"])
+    assert risk_engine.what_if(30, 22, True, vaccinated) == []
+
+
+def test_what_if_file_best_variant():
+    records = []
+    expected = []
+    for i, (age, bmi, is_female, mask) in enumerate(patients(500)):
+        records.append({"name": f"Пациент {i}", "age": age, "sex": "f" if is_female else "m",
+                        "weight": bmi * 1.7 ** 2, "height": 170,
+                        "factors": [key for key, bit in risk_engine.FACTOR_BITS.items()
+                                    if mask >> bit & 1]})
+        variants = expected_variants(age, records[-1]["weight"] / 1.7 ** 2, is_female, mask)
+        expected.append(("+".join(variants[0][0]), variants[0][1]) if variants else ("", None))
+    src = io.StringIO("".join(json.dumps(r) + "\n" for r in records))
+    dst = io.StringIO()
+    assert whatif.what_if_stream(src, dst, "jsonl") == (500, 0)
+    for line, (best, best_score) in zip(dst.getvalue().splitlines(), expected):
+        result = json.loads(line)
+        assert result["best"] == best
+        assert result["best_score"] == (result["score"] if best_score is None else best_score)
+        assert set(result["what_if"]) == set(whatif.TOGGLE_NAMES)
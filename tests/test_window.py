@@ -0,0 +1,46 @@
+"""Окно калькулятора: сохранение оценки в историю"""
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from PyQt5.QtWidgets import QApplication
+
+import kURS
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    qt = QApplication.instance() or QApplication([])
+    warnings = []
+    monkeypatch.setattr(kURS.QMessageBox, "warning",
+                        lambda parent, title, text: warnings.append(text))
+    window = kURS.CovidRiskApp(user_name="Иванов Иван",
+                               history_path=str(tmp_path / "history.db"),
+                               model_path=str(tmp_path / "model.json"))
+    window.warnings = warnings
+    window.age_input.setText("70")
+    window.height_input.setText("170")
+    window.weight_input.setText("80")
+    for _ in range(3):  # до страницы результата
+        window.next_page()
+    window.flush_writer()
+    window.qt = qt
+    yield window
+    window.close()
+    qt.processEvents()
+
+
+@pytest.mark.parametrize("weight", ["nan", "inf"])
+def test_non_finite_input_is_not_saved(app, weight):
+    app.weight_input.setText(weight)
+    app.calculate_risk()
+    app.save_to_history()
+    app.qt.processEvents()
+    assert len(app.warnings) == 1
+    app.weight_input.setText("80")
+    app.calculate_risk()
+    app.save_to_history()
+    app.flush_writer()
+    app.qt.processEvents()
+    assert len(app.warnings) == 1
+    assert app.history.count() == 2  # и оценка при переходе к результату
@@ -0,0 +1,132 @@
+"""Анализ «что если» для файла пациентов (CSV/JSONL, вход как у batch).
+
+Для каждой записи считаются баллы при всех одиночных и парных изменениях
+модифицируемых факторов (risk_engine.WHAT_IF_TOGGLES) - весь блок записей
+одним векторным вызовом - и лучший вариант среди изменений в здоровую
+сторону (risk_engine.what_if_allowed). Столбец варианта называется
+ключами факторов через "+", например smoking+sedentary. Оценка - по модели
+из файла --model, её версия пишется в каждый результат.
+"""
+import csv
+import json
+import time
+from itertools import islice
+
+import numpy as np
+
+import batch
+import model
+import risk_engine
+
+
+TOGGLE_NAMES = tuple("+".join(keys) for keys in risk_engine.WHAT_IF_TOGGLES)
+OUTPUT_FIELDS = ("row", "name", "score", "tier", "best", "best_score", "best_tier",
+                 "model") + TOGGLE_NAMES
+
+
+def what_if_chunk(records, first_row=1, scoring_model=None):
+    """Как batch.score_chunk, но с баллами всех вариантов и лучшим из них"""
+    rows, names, ages, bmis, females, masks, rejected = batch.parse_chunk(records, first_row)
+    if not rows:
+        return [], rejected
+
+    scoring_model = scoring_model or model.builtin()
+    ages = batch.clip_ages(ages)
+    masks = np.array(masks, dtype=np.uint32)
+    scores = scoring_model.score_batch(ages, bmis, females, masks)
+    variants = risk_engine.what_if_batch(ages, bmis, females, masks, scoring_model)
+    # Вредные изменения (начать курить) лучшими не считаются. При равных
+    # баллах argmin берёт первый вариант, а одиночные идут в WHAT_IF_TOGGLES
+    # раньше парных
+    candidates = np.where(risk_engine.what_if_allowed(masks), variants,
+                          np.iinfo(variants.dtype).max)
+    best = candidates.argmin(axis=1)
+    best_scores = candidates[np.arange(len(rows)), best]
+    tiers = scoring_model.tier_batch(scores)
+    best_tiers = scoring_model.tier_batch(best_scores)
+    labels = [label for _, label, _ in scoring_model.tiers]
+
+    results = []
+    for i, row in enumerate(rows):
+        improves = best_scores[i] < scores[i]
+        results.append({
+            "row": row,
+            "name": names[i],
+            "score": int(scores[i]),
+            "tier": labels[tiers[i]],
+            "best": TOGGLE_NAMES[best[i]] if improves else "",
+            "best_score": int(best_scores[i] if improves else scores[i]),
+            "best_tier": labels[best_tiers[i] if improves else tiers[i]],
+            "model": scoring_model.version,
+            "what_if": dict(zip(TOGGLE_NAMES, variants[i].tolist())),
+        })
+    return results, rejected
+
+
+class WhatIfWriter:
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == "csv":
+            self.writer = csv.writer(stream, lineterminator="\n")
+
+    def write_header(self):
+        if self.fmt == "csv":
+            self.writer.writerow(OUTPUT_FIELDS)
+
+    def write(self, results):
+        if self.fmt == "csv":
+            self.writer.writerows(
+                [r["row"], r["name"], r["score"], r["tier"], r["best"], r["best_score"],
+                 r["best_tier"], r["model"]] + [r["what_if"][name] for name in TOGGLE_NAMES]
+                for r in results
+            )
+        else:
+            self.stream.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in results)
+
+
+def what_if_stream(src, dst, fmt, out_fmt=None, chunk_size=batch.CHUNK_SIZE,
+                   scoring_model=None):
+    """Потоковый анализ src -> dst. Возвращает (всего строк, отклонено)."""
+    writer = WhatIfWriter(dst, out_fmt or fmt)
+    writer.write_header()
+    records = batch.read_records(src, fmt)
+    total = rejected = 0
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        results, bad = what_if_chunk(chunk, total + 1, scoring_model)
+        writer.write(results)
+        total += len(chunk)
+        rejected += bad
+    return total, rejected
+
+
+def run(args):
+    scoring_model = batch.load_model(args.model)
+    if scoring_model is None:
+        return 2
+    fmt = args.format or batch.detect_format(args.input)
+    out_fmt = args.output_format or batch.detect_format(args.output, default=fmt)
+    started = time.perf_counter()
+    with batch._open_input(args.input) as src, batch._open_output(args.output) as dst:
+        total, rejected = what_if_stream(src, dst, fmt, out_fmt, args.chunk_size,
+                                         scoring_model)
+    batch.report(total, rejected, time.perf_counter() - started)
+    return 0
+
+
+def add_arguments(parser):
+    parser.add_argument("input", nargs="?", default="-",
+                        help="входной файл CSV/JSONL (по умолчанию stdin)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="файл результатов (по умолчанию stdout)")
+    parser.add_argument("-f", "--format", choices=batch.FORMATS,
+                        help="формат входа (по умолчанию по расширению, иначе csv)")
+    parser.add_argument("--output-format", choices=batch.FORMATS,
+                        help="формат результатов (по умолчанию как у входа)")
+    parser.add_argument("--chunk-size", type=batch.count_argument(1), default=batch.CHUNK_SIZE,
+                        help="число строк в блоке (по умолчанию %(default)s)")
+    batch.add_model_argument(parser)
+    parser.set_defaults(func=run)